@@ -0,0 +1,7 @@
+"""
+Benchmarks on synthetic court videos with known bounces.
+
+Run from the backend directory:
+
+    python -m benchmarks.run --output benchmark_results.json
+"""
@@ -0,0 +1,355 @@
+"""
+Runs the processing benchmarks on synthetic court videos and writes the
+results as JSON.
+
+    python -m benchmarks.run                             # stub detectors, all scenarios
+    python -m benchmarks.run --detectors model           # the real models (needs the weights)
+    python -m benchmarks.run --baseline old_results.json # also compare with an earlier run
+
+For each (mode, shot_type) scenario it reports:
+  - pipeline: ProcessingEngine.process_video throughput, overall and per
+    stage (frames / busy seconds), and peak Python memory (tracemalloc)
+  - concurrent (with --concurrent-jobs N): N copies of the video processed
+    at once on the one engine, their combined throughput, and the batch
+    sizes and waits of the models with --micro-batching
+  - accuracy: bounces found within --tolerance frames of the ground truth
+    and how many of them got the right IN/OUT call
+  - line_detector: detect_lines time and IN/OUT accuracy of the fitted
+    court on the ground-truth bounce points
+  - decision_engine: per-frame evaluate and whole-track evaluate_track
+    time on the ground-truth shuttle track, and the bounces they find
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from processing.config import DECODERS, ENCODERS
+from processing.engine import ProcessingEngine
+from processing.decision import DecisionEngine
+from processing.line_detector import LineDetector
+from benchmarks.synthetic import make_video
+from benchmarks.stubs import ColorShuttlecockDetector, WhiteCourtDetector
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SCENARIOS = [("doubles", "rally"), ("doubles", "serve"), ("singles", "rally"), ("singles", "serve")]
+
+# Relative throughput drop against a baseline that counts as a regression
+FPS_TOLERANCE = 0.10
+
+
+def score_decisions(predicted, expected, tolerance=2):
+    """
+    Matches predicted decisions to ground-truth bounces (each used once,
+    nearest frame first, within `tolerance` frames).
+    """
+    unmatched = list(range(len(predicted)))
+    matched, correct, frame_errors = 0, 0, []
+    for bounce in expected:
+        best = None
+        for i in unmatched:
+            error = abs(predicted[i]["frame"] - bounce["frame"])
+            if error <= tolerance and (best is None or error < abs(predicted[best]["frame"] - bounce["frame"])):
+                best = i
+        if best is None:
+            continue
+        unmatched.remove(best)
+        matched += 1
+        frame_errors.append(abs(predicted[best]["frame"] - bounce["frame"]))
+        correct += predicted[best]["decision"] == bounce["decision"]
+    return {
+        "expected": len(expected),
+        "detected": matched,
+        "missed": len(expected) - matched,
+        "false_positives": len(unmatched),
+        "correct_calls": correct,
+        "decision_accuracy": round(correct / len(expected), 4) if expected else None,
+        "mean_frame_error": round(float(np.mean(frame_errors)), 3) if frame_errors else None,
+    }
+
+
+def bench_concurrent(engine, video_path, truth, jobs, tolerance=2):
+    """Processes `jobs` copies of the video at once on the shared engine."""
+    mode, shot_type = truth["mode"], truth["shot_type"]
+    outcomes = [None] * jobs
+
+    def run(i):
+        stats = {}
+        results = engine.process_video(video_path, mode=mode, shot_type=shot_type, stats=stats)
+        outcomes[i] = (results, stats)
+
+    batching_before = {batcher.name: batcher.stats() for batcher in engine.batchers}
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(jobs)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_s = time.perf_counter() - started
+
+    frames = sum(stats["frames"] for _, stats in outcomes)
+    report = {
+        "jobs": jobs,
+        "wall_s": round(wall_s, 3),
+        "total_fps": round(frames / wall_s, 2),
+        "per_job_fps": [stats["fps"] for _, stats in outcomes],
+        "accuracy": [score_decisions(results, truth["bounces"], tolerance) for results, _ in outcomes],
+    }
+    if engine.batchers:
+        report["inference_batching"] = {}
+        for batcher in engine.batchers:
+            stats, before = batcher.stats(), batching_before[batcher.name]
+            batches = stats["batches"] - before["batches"]
+            report["inference_batching"][batcher.name] = {
+                "batches": batches,
+                "mean_batch_size": round((stats["frames"] - before["frames"]) / batches, 2) if batches else 0.0,
+                "max_wait_ms": stats["max_wait_ms"],
+            }
+    return report
+
+
+def _time_it(fn, repeats):
+    """Mean seconds per call over `repeats` calls."""
+    started = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return (time.perf_counter() - started) / repeats, result
+
+
+def bench_pipeline(engine, video_path, truth, output_path=None, tolerance=2, memory=True):
+    mode, shot_type = truth["mode"], truth["shot_type"]
+    stats = {}
+    results = engine.process_video(video_path, output_path, mode=mode, shot_type=shot_type, stats=stats)
+
+    frames = stats["frames"]
+    stages = {
+        name: {
+            "fps": round(frames / stage["busy_s"], 2) if stage["busy_s"] else None,
+            "busy_s": stage["busy_s"],
+            "wait_s": stage["wait_s"],
+        }
+        for name, stage in stats["stages"].items()
+    }
+    report = {
+        "frames": frames,
+        "wall_s": stats["wall_s"],
+        "fps": stats["fps"],
+        "stages": stages,
+        "accuracy": score_decisions(results, truth["bounces"], tolerance),
+    }
+    for key in ("court_tracking", "shuttle_roi", "shuttle_tiles", "adaptive_sampling", "decoding", "encoding", "inference_batching"):
+        if key in stats:
+            report[key] = stats[key]
+
+    if memory:
+        # Separate pass: tracemalloc slows everything down, so it is kept out of the timed run
+        tracemalloc.start()
+        try:
+            engine.process_video(video_path, output_path, mode=mode, shot_type=shot_type)
+            report["peak_python_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+        finally:
+            tracemalloc.stop()
+    return report
+
+
+def bench_line_detector(video_path, truth, court_detector, repeats=5):
+    cap = cv2.VideoCapture(str(video_path))
+    ret, frame = cap.read()
+    cap.release()
+    if not ret:
+        return {}
+    court_dets = court_detector.detect(frame)
+    if not court_dets:
+        return {"court_found": False}
+
+    detector = LineDetector()
+    seconds, _ = _time_it(lambda: detector.detect_lines(frame, court_dets[0][:4]), repeats)
+    points = np.array([bounce["point"] for bounce in truth["bounces"]])
+    labels = np.array([bounce["decision"] == "IN" for bounce in truth["bounces"]])
+    in_bounds = detector.points_in_bounds(points, truth["mode"], truth["shot_type"])
+    lookup_s, _ = _time_it(lambda: detector.points_in_bounds(points, truth["mode"], truth["shot_type"]), 100)
+    return {
+        "court_found": True,
+        "court_fitted": detector.has_court(),
+        "detect_lines_ms": round(seconds * 1000, 3),
+        "points_in_bounds_us_per_point": round(lookup_s * 1e6 / max(1, len(points)), 3),
+        "in_out_accuracy": round(float(np.mean(in_bounds == labels)), 4) if len(labels) else None,
+    }
+
+
+def bench_decision_engine(truth, tolerance=2, repeats=3):
+    mode, shot_type = truth["mode"], truth["shot_type"]
+    track = np.array(truth["track"], dtype=np.float64).reshape(-1, 3)
+    visible = {int(frame): (x, y) for frame, x, y in track}
+
+    def online():
+        engine = DecisionEngine()
+        decisions = []
+        for frame in range(1, truth["frames"] + 1):
+            dets = [[visible[frame][0] - 5, visible[frame][1] - 5, visible[frame][0] + 5,
+                     visible[frame][1] + 5, 0.9, 0]] if frame in visible else []
+            event = engine.evaluate(dets, [], frame, mode=mode, shot_type=shot_type)
+            if event:
+                decisions.append(event)
+        return decisions
+
+    online_s, online_results = _time_it(online, repeats)
+    offline_s, offline_results = _time_it(lambda: DecisionEngine().evaluate_track(track, mode=mode,
+                                                                                  shot_type=shot_type), repeats)
+    return {
+        "evaluate_us_per_frame": round(online_s * 1e6 / max(1, truth["frames"]), 3),
+        "evaluate_track_ms": round(offline_s * 1000, 3),
+        "bounces_found": score_decisions(online_results, truth["bounces"], tolerance)["detected"],
+        "offline_matches_online": [e["frame"] for e in offline_results] == [e["frame"] for e in online_results],
+    }
+
+
+def compare(results, baseline, fps_tolerance=FPS_TOLERANCE):
+    """Returns a list of regression messages against an earlier results dict."""
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        fps, old_fps = current["pipeline"]["fps"], previous["pipeline"]["fps"]
+        if old_fps and fps < old_fps * (1 - fps_tolerance):
+            regressions.append(f"{name}: fps {old_fps} -> {fps}")
+        accuracy = current["pipeline"]["accuracy"]["decision_accuracy"]
+        old_accuracy = previous["pipeline"]["accuracy"]["decision_accuracy"]
+        if old_accuracy is not None and accuracy is not None and accuracy < old_accuracy:
+            regressions.append(f"{name}: decision accuracy {old_accuracy} -> {accuracy}")
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--detectors", choices=("stub", "model"), default="stub",
+                        help="colour-matching stubs (no weights needed) or the configured models")
+    parser.add_argument("--stub-latency-ms", type=float, default=0.0, help="simulated model time per frame")
+    parser.add_argument("--stub-call-latency-ms", type=float, default=0.0,
+                        help="simulated model time per forward pass")
+    parser.add_argument("--scenario", action="append", metavar="MODE/SHOT_TYPE",
+                        help="e.g. singles/serve; repeatable (default: all four)")
+    parser.add_argument("--rallies", type=int, default=8)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tolerance", type=int, default=2, help="frames a bounce may be off by")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--court-keyframe-interval", type=int, default=30)
+    parser.add_argument("--shuttle-roi", action="store_true")
+    parser.add_argument("--shuttle-tiles", action="store_true")
+    parser.add_argument("--adaptive-sampling", action="store_true")
+    parser.add_argument("--micro-batching", action="store_true",
+                        help="merge the forward passes of concurrent jobs (see --concurrent-jobs)")
+    parser.add_argument("--concurrent-jobs", type=int, default=1,
+                        help="also process N copies of each video at once on the one engine")
+    parser.add_argument("--decoder", choices=DECODERS, default="auto")
+    parser.add_argument("--decode-width", type=int, default=0, help="scale frames down to this width while decoding")
+    parser.add_argument("--encoder", choices=ENCODERS, default="auto", help="output video writer (with --render)")
+    parser.add_argument("--render", action="store_true", help="also draw and encode the output video")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="earlier results JSON to compare with")
+    args = parser.parse_args()
+
+    scenarios = [tuple(s.split("/")) for s in args.scenario] if args.scenario else SCENARIOS
+    engine_kwargs = {
+        "batch_size": args.batch_size,
+        "court_keyframe_interval": args.court_keyframe_interval,
+        "shuttle_roi": args.shuttle_roi,
+        "shuttle_tiles": args.shuttle_tiles,
+        "adaptive_sampling": args.adaptive_sampling,
+        "micro_batching": args.micro_batching,
+        "decoder": args.decoder,
+        "decode_width": args.decode_width,
+        "encoder": args.encoder,
+    }
+    if args.detectors == "stub":
+        detectors = (ColorShuttlecockDetector(args.stub_latency_ms, args.stub_call_latency_ms),
+                     WhiteCourtDetector(args.stub_latency_ms, args.stub_call_latency_ms))
+        engine = ProcessingEngine(detectors=detectors, **engine_kwargs)
+    else:
+        engine = ProcessingEngine(**engine_kwargs)
+        engine.warmup()
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "opencv": cv2.__version__,
+        "settings": {**engine_kwargs, **{k: v for k, v in vars(args).items()
+                                         if k in ("detectors", "stub_latency_ms", "stub_call_latency_ms", "rallies",
+                                                  "width", "height", "seed", "tolerance", "render",
+                                                  "concurrent_jobs")}},
+        "scenarios": {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix="alicas_bench_") as tmp:
+        for mode, shot_type in scenarios:
+            name = f"{mode}/{shot_type}"
+            video_path = Path(tmp) / f"{mode}_{shot_type}.avi"
+            truth = make_video(video_path, mode, shot_type, rallies=args.rallies,
+                               size=(args.width, args.height), seed=args.seed)
+            output_path = Path(tmp) / f"{mode}_{shot_type}_out.mp4" if args.render else None
+            scenario = {
+                "pipeline": bench_pipeline(engine, video_path, truth, output_path, args.tolerance,
+                                           memory=not args.no_memory),
+                "line_detector": bench_line_detector(video_path, truth, engine.court_detector),
+                "decision_engine": bench_decision_engine(truth, args.tolerance),
+            }
+            if args.concurrent_jobs > 1:
+                scenario["concurrent"] = bench_concurrent(engine, video_path, truth, args.concurrent_jobs,
+                                                          args.tolerance)
+            results["scenarios"][name] = scenario
+            accuracy = scenario["pipeline"]["accuracy"]
+            print(f"{name:16s} {scenario['pipeline']['fps']:8.1f} fps  "
+                  f"bounces {accuracy['detected']}/{accuracy['expected']}  "
+                  f"calls {accuracy['correct_calls']}/{accuracy['expected']}  "
+                  f"false positives {accuracy['false_positives']}")
+            if "concurrent" in scenario:
+                concurrent = scenario["concurrent"]
+                print(f"{'':16s} {concurrent['total_fps']:8.1f} fps  total over {concurrent['jobs']} concurrent jobs")
+
+    if resource is not None:
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        results["max_rss_mb"] = round(max_rss / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 1)
+
+    with open(args.output, "w") as handle:
+        json.dump(results, handle, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as handle:
+            regressions = compare(results, json.load(handle))
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
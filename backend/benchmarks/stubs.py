@@ -0,0 +1,52 @@
+import time
+
+import cv2
+import numpy as np
+
+from processing.detectors import _YOLODetector
+
+
+class _StubDetector(_YOLODetector):
+    """
+    Detector that finds objects in the synthetic videos by colour instead of
+    running a model, so benchmarks run without the weight files.
+    latency_ms adds a fixed cost per frame to stand in for model time, and
+    call_latency_ms a fixed cost per forward pass (what batching saves).
+    """
+
+    def __init__(self, latency_ms=0.0, call_latency_ms=0.0):
+        self.model = None
+        self.latency_ms = latency_ms
+        self.call_latency_ms = call_latency_ms
+
+    def _find(self, frame):
+        raise NotImplementedError
+
+    def _predict(self, frames):
+        if self.latency_ms or self.call_latency_ms:
+            time.sleep((self.call_latency_ms + self.latency_ms * len(frames)) / 1000)
+        return [self._find(frame) for frame in frames]
+
+
+def _bounding_box(mask, conf, cls, pad=0):
+    points = cv2.findNonZero(mask)
+    if points is None:
+        return np.empty((0, 6), dtype=np.float32)
+    x, y, w, h = cv2.boundingRect(points)
+    return np.array([[x - pad, y - pad, x + w + pad, y + h + pad, conf, cls]], dtype=np.float32)
+
+
+class ColorShuttlecockDetector(_StubDetector):
+    """Finds the red shuttle of benchmarks.synthetic."""
+
+    def _find(self, frame):
+        mask = cv2.inRange(frame, (0, 0, 201), (79, 79, 255))
+        return _bounding_box(mask, 0.9, 0)
+
+
+class WhiteCourtDetector(_StubDetector):
+    """Returns the box around the white court lines of benchmarks.synthetic."""
+
+    def _find(self, frame):
+        mask = cv2.inRange(frame, (201, 201, 201), (255, 255, 255))
+        return _bounding_box(mask, 0.9, 0, pad=5)
@@ -0,0 +1,189 @@
+import cv2
+import numpy as np
+
+# Court geometry in metres from the Laws of Badminton, origin at a doubles corner, x across the court and
+# y along it. Deliberately not imported from processing.line_detector: the ground truth must not share
+# the assumptions of the code it checks
+COURT_WIDTH = 6.10
+COURT_LENGTH = 13.40
+SINGLES_MARGIN = 0.46        # doubles sideline to singles sideline
+DOUBLES_LONG_SERVICE = 0.76  # baseline to doubles long service line
+SHORT_SERVICE = 1.98         # net to short service line
+NET_Y = COURT_LENGTH / 2
+
+# Colours (BGR)
+GRASS = (60, 120, 50)
+LINE = (255, 255, 255)
+NET = (170, 170, 170)
+SHUTTLE = (0, 0, 255)
+
+# Frames of a rally: the shuttle falls for up to FALL_FRAMES, bounces and rises for up to RISE_FRAMES
+FALL_FRAMES = 30
+RISE_FRAMES = 15
+# Frames without a shuttle between rallies
+IDLE_FRAMES = 20
+# Share of the landing speed the shuttle keeps when it bounces
+RESTITUTION = 0.4
+
+
+def court_homography(size):
+    """Court (metres) to image (pixels) homography for a camera behind one baseline."""
+    width, height = size
+    template = np.float32([[0, 0], [COURT_WIDTH, 0], [COURT_WIDTH, COURT_LENGTH], [0, COURT_LENGTH]])
+    image = np.float32([
+        [width * 0.31, height * 0.16], [width * 0.69, height * 0.16],
+        [width * 0.89, height * 0.92], [width * 0.11, height * 0.92],
+    ])
+    return cv2.getPerspectiveTransform(template, image)
+
+
+def court_lines():
+    """Every court line as ((x1, y1), (x2, y2)) in metres."""
+    lines = []
+    for x in (0.0, SINGLES_MARGIN, COURT_WIDTH - SINGLES_MARGIN, COURT_WIDTH):
+        lines.append(((x, 0.0), (x, COURT_LENGTH)))
+    for y in (0.0, DOUBLES_LONG_SERVICE, NET_Y - SHORT_SERVICE, NET_Y + SHORT_SERVICE,
+              COURT_LENGTH - DOUBLES_LONG_SERVICE, COURT_LENGTH):
+        lines.append(((0.0, y), (COURT_WIDTH, y)))
+    lines.append(((COURT_WIDTH / 2, 0.0), (COURT_WIDTH / 2, NET_Y - SHORT_SERVICE)))
+    lines.append(((COURT_WIDTH / 2, NET_Y + SHORT_SERVICE), (COURT_WIDTH / 2, COURT_LENGTH)))
+    return lines
+
+
+def project(homography, points):
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 1, 2)
+    return cv2.perspectiveTransform(points, homography).reshape(-1, 2)
+
+
+def render_court(size, homography):
+    width, height = size
+    frame = np.full((height, width, 3), GRASS, dtype=np.uint8)
+    for start, end in court_lines():
+        (x1, y1), (x2, y2) = np.round(project(homography, [start, end])).astype(int)
+        cv2.line(frame, (x1, y1), (x2, y2), LINE, 3, cv2.LINE_AA)
+    (x1, y1), (x2, y2) = np.round(project(homography, [(-0.3, NET_Y), (COURT_WIDTH + 0.3, NET_Y)])).astype(int)
+    cv2.line(frame, (x1, y1), (x2, y2), NET, 2, cv2.LINE_AA)
+    return frame
+
+
+def _bounds(mode, shot_type):
+    """
+    (x1, x2, back): the sidelines in play, and the distance from each
+    baseline to the back boundary. Singles uses the inner sidelines and the
+    baseline for rallies and serves alike; a doubles serve must not pass the
+    doubles long service line.
+    """
+    x1, x2 = (SINGLES_MARGIN, COURT_WIDTH - SINGLES_MARGIN) if mode == "singles" else (0.0, COURT_WIDTH)
+    back = DOUBLES_LONG_SERVICE if (mode, shot_type) == ("doubles", "serve") else 0.0
+    return x1, x2, back
+
+
+def is_in(court_point, mode, shot_type):
+    """
+    Ground truth IN/OUT of a landing point in metres. A serve must land in
+    a service court, i.e. also beyond the short service line; the server's
+    side is not modelled, so either service court of either half counts.
+    """
+    x1, x2, back = _bounds(mode, shot_type)
+    x, y = court_point
+    if not (x1 <= x <= x2 and back <= y <= COURT_LENGTH - back):
+        return False
+    return shot_type != "serve" or abs(y - NET_Y) >= SHORT_SERVICE
+
+
+def _landing_point(rng, mode, shot_type, inside):
+    """A landing point (metres) clearly inside or outside the in-bounds area, in a random half."""
+    x1, x2, back = _bounds(mode, shot_type)
+    # Distance from the baseline of the chosen half: in bounds between `back` and `front`
+    front = NET_Y - SHORT_SERVICE if shot_type == "serve" else NET_Y
+    if inside:
+        x, depth = rng.uniform(x1 + 0.3, x2 - 0.3), rng.uniform(back + 0.3, front - 0.3)
+    else:
+        # Out past one edge by 15-60 cm: e.g. in the doubles alley for singles, past the doubles
+        # long service line on a doubles serve, or short of the short service line on any serve
+        miss = rng.uniform(0.15, 0.6)
+        edge = rng.integers(4 if shot_type == "serve" else 3)
+        if edge == 0:
+            x, depth = x1 - miss, rng.uniform(back + 0.5, front - 0.5)
+        elif edge == 1:
+            x, depth = x2 + miss, rng.uniform(back + 0.5, front - 0.5)
+        elif edge == 2:
+            x, depth = rng.uniform(x1 + 0.3, x2 - 0.3), back - miss
+        else:
+            x, depth = rng.uniform(x1 + 0.3, x2 - 0.3), front + miss
+    far_half = rng.integers(2) == 0
+    return x, (depth if far_half else COURT_LENGTH - depth)
+
+
+def make_video(path, mode="doubles", shot_type="rally", rallies=8, size=(1280, 720), fps=30, seed=0):
+    """
+    Writes a synthetic match video to `path` (MJPG) and returns its ground truth:
+
+        {"mode", "shot_type", "frames", "fps", "size",
+         "bounces": [{"frame", "point", "court_point", "decision"}],
+         "track": [[frame, x, y], ...]}
+
+    Each rally is a falling parabolic shuttle path that bounces once; rallies
+    alternate between IN and OUT landings. Frame numbers are 1-based, like
+    the "frame" of ProcessingEngine results, and "point" is the bounce in
+    pixels. "track" holds the shuttle centre of every frame it is visible in.
+    """
+    rng = np.random.default_rng(seed)
+    width, height = size
+    homography = court_homography(size)
+    court = render_court(size, homography)
+
+    bounces, track = [], []
+    frame_index = IDLE_FRAMES
+    shuttle_at = {}
+    for rally in range(rallies):
+        court_point = _landing_point(rng, mode, shot_type, inside=rally % 2 == 0)
+        bx, by = project(homography, [court_point])[0]
+        bounce_index = frame_index + FALL_FRAMES
+        # Height above the floor in pixels: the shuttle lands at `speed` px/frame
+        # and rebounds with RESTITUTION of it, under `gravity` px/frame^2
+        gravity = rng.uniform(0.25, 0.45)
+        speed = rng.uniform(6, 12)
+        vx = rng.choice([-1, 1]) * rng.uniform(2, 6)
+        # Only the fall from the top of the arc and the rebound up to its top are
+        # drawn, so the lowest point of every visible stretch is the bounce
+        first = max(-FALL_FRAMES, -int(speed / gravity))
+        last = min(RISE_FRAMES, int(RESTITUTION * speed / gravity))
+        for t in range(first, last + 1):
+            if t <= 0:
+                x, h = bx + vx * t, -speed * t - gravity * t * t / 2
+            else:
+                x, h = bx + vx * t / 2, RESTITUTION * speed * t - gravity * t * t / 2
+            y = by - h
+            if 5 <= x < width - 5 and 5 <= y < height - 5:
+                shuttle_at[bounce_index + t] = (x, y)
+        bounces.append({
+            "frame": bounce_index + 1,
+            "point": [float(bx), float(by)],
+            "court_point": [float(court_point[0]), float(court_point[1])],
+            "decision": "IN" if is_in(court_point, mode, shot_type) else "OUT",
+        })
+        frame_index = bounce_index + RISE_FRAMES + 1 + IDLE_FRAMES
+
+    total = frame_index
+    out = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), fps, size)
+    try:
+        for i in range(total):
+            frame = court.copy()
+            if i in shuttle_at:
+                x, y = shuttle_at[i]
+                cv2.circle(frame, (int(round(x)), int(round(y))), 5, SHUTTLE, -1)
+                track.append([i + 1, float(round(x)), float(round(y))])
+            out.write(frame)
+    finally:
+        out.release()
+
+    return {
+        "mode": mode,
+        "shot_type": shot_type,
+        "frames": total,
+        "fps": fps,
+        "size": list(size),
+        "bounces": bounces,
+        "track": track,
+    }
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+_SHA256_NAME = re.compile(r"^[0-9a-f]{64}$")
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def content_hash(video_path):
+    """
+    SHA-256 of a video. Uploads are already stored under their digest, so
+    the file name is used when it is one.
+    """
+    video_path = Path(video_path)
+    if _SHA256_NAME.match(video_path.stem):
+        return video_path.stem
+    return file_sha256(video_path)
+
+
+def model_fingerprint(model_paths):
+    """
+    Hash of the model weight files. A directory (e.g. an OpenVINO export,
+    .xml + .bin) contributes every file inside it, in sorted order; a
+    missing path contributes its path only.
+    """
+    hasher = hashlib.sha256()
+    for path in model_paths:
+        path = Path(path)
+        hasher.update(str(path).encode())
+        if path.is_file():
+            hasher.update(file_sha256(path).encode())
+        elif path.is_dir():
+            for file in sorted(p for p in path.rglob("*") if p.is_file()):
+                hasher.update(file.relative_to(path).as_posix().encode())
+                hasher.update(file_sha256(file).encode())
+    return hasher.hexdigest()
+
+
+def touch(path):
+    """Marks a file as recently used for LRU eviction."""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+def evict_lru(directory, max_bytes, protected=()):
+    """
+    Deletes the least recently used files in `directory` (by mtime, which
+    touch() bumps on use) until its total size is at most max_bytes.
+    Hidden entries (e.g. partial uploads) and `protected` paths are kept.
+    Returns the list of deleted paths.
+    """
+    if not max_bytes:
+        return []
+    protected = {Path(p).resolve() for p in protected}
+    files = []
+    for path in Path(directory).rglob("*"):
+        if not path.is_file() or any(part.startswith(".") for part in path.relative_to(directory).parts):
+            continue
+        stat = path.stat()
+        files.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in files)
+    deleted = []
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        if path.resolve() in protected:
+            continue
+        path.unlink(missing_ok=True)
+        total -= size
+        deleted.append(path)
+    return deleted
+
+
+class ResultCache:
+    """
+    Caches /process results under OUTPUT_DIR, keyed on the video's content
+    hash, mode, shot_type, request parameters, the model weights and the
+    engine settings. Each entry is a JSON file in OUTPUT_DIR/cache plus the
+    rendered video and detection sidecar the JSON points to, if any; an
+    entry is only valid while all of them exist.
+    """
+
+    def __init__(self, output_dir, model_paths, engine_kwargs=None):
+        self.output_dir = Path(output_dir)
+        self.cache_dir = self.output_dir / "cache"
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.model_paths = list(model_paths)
+        self.engine_kwargs = engine_kwargs or {}
+        self._fingerprint = None
+        self._lock = threading.Lock()
+
+    @property
+    def fingerprint(self):
+        with self._lock:
+            if self._fingerprint is None:
+                self._fingerprint = model_fingerprint(self.model_paths)
+            return self._fingerprint
+
+    def key(self, video_path, mode, shot_type, **params):
+        payload = json.dumps({
+            "video": content_hash(video_path),
+            "mode": mode,
+            "shot_type": shot_type,
+            "params": params,
+            "model": self.fingerprint,
+            "engine": self.engine_kwargs,
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def output_path(self, key, suffix):
+        return self.output_dir / f"processed_{key}{suffix}"
+
+    def _entry_path(self, key):
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key):
+        """Returns the cached result for key, or None."""
+        entry = self._entry_path(key)
+        try:
+            with open(entry) as handle:
+                result = json.load(handle)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        touch(entry)
+        # Decision-only results have no rendered video, and results without a sidecar no detections file
+        for field in ("output_video", "detections"):
+            if result.get(field):
+                output = Path(result[field])
+                if not output.is_file():
+                    entry.unlink(missing_ok=True)
+                    return None
+                touch(output)
+        return result
+
+    def put(self, key, result):
+        entry = self._entry_path(key)
+        tmp = entry.with_suffix(f".{os.getpid()}.{time.time_ns()}.tmp")
+        with open(tmp, "w") as handle:
+            json.dump(result, handle)
+        os.replace(tmp, entry)
@@ -0,0 +1,40 @@
+"""
+Exports the shuttlecock and court .pt weights for the CPU runtimes.
+
+    python export_models.py --backend onnx
+    python export_models.py --backend openvino --int8 --data path/to/data.yaml
+    python export_models.py --backend onnx --int8 --data path/to/calibration/images
+
+The exports are written next to the .pt files, where the detectors look
+for them when ALICAS_BACKEND (and ALICAS_INT8) select them.
+"""
+import argparse
+import os
+import sys
+
+# Add the current directory to sys.path to allow imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from processing.backends import export_model, DEFAULT_IMGSZ
+from processing.detectors import SHUTTLECOCK_MODEL_PATH, COURT_MODEL_PATH
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=("onnx", "openvino"), required=True)
+    parser.add_argument("--int8", action="store_true", help="also quantize the weights to INT8")
+    parser.add_argument("--data", help="calibration data: data.yaml for openvino, an image directory for onnx")
+    parser.add_argument("--imgsz", type=int, default=DEFAULT_IMGSZ)
+    parser.add_argument("--force", action="store_true", help="re-export even if the files exist")
+    parser.add_argument("models", nargs="*", default=[SHUTTLECOCK_MODEL_PATH, COURT_MODEL_PATH],
+                        help=".pt weights to export (default: the shuttlecock and court models)")
+    args = parser.parse_args()
+
+    for model_path in args.models:
+        target = export_model(model_path, args.backend, int8=args.int8, imgsz=args.imgsz, data=args.data,
+                              force=args.force)
+        print(f"{model_path} -> {target}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,606 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from processing.metrics import Histogram, Metrics
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# Seconds between progress updates sent from a worker to the parent
+PROGRESS_INTERVAL = 0.5
+# A pool whose worker died (e.g. killed for running out of memory) is replaced at most this many
+# times per window; past that, or when a worker could not even start, it stays down until restarted
+MAX_POOL_RESTARTS = 3
+POOL_RESTART_WINDOW = 600
+
+# One ProcessingEngine per worker process, created by _init_worker. It keeps only the models and
+# settings; process_video starts every job from a fresh JobState, so nothing leaks between jobs
+_engine = None
+_engine_kwargs = None
+# Jobs the worker may still take on when it runs several at once (see _start_job)
+_job_slots = None
+
+
+def _init_worker(engine_kwargs, ready_map=None, error_map=None, jobs_per_worker=1):
+    """
+    Loads and warms up the worker's engine, then publishes its startup
+    breakdown (seconds) in ready_map under the worker's pid. If that fails
+    the exception is published in error_map first: the pool itself only
+    reports that a process terminated abruptly.
+    """
+    global _engine, _engine_kwargs, _job_slots
+    started = time.perf_counter()
+    try:
+        from processing.engine import ProcessingEngine
+        imported = time.perf_counter()
+        _engine_kwargs = engine_kwargs
+        _job_slots = threading.Semaphore(jobs_per_worker)
+        _engine = ProcessingEngine(**engine_kwargs)
+        loaded = time.perf_counter()
+        warmup_s = _engine.warmup()
+    except BaseException as exc:
+        if error_map is not None:
+            error_map[os.getpid()] = f"{type(exc).__name__}: {exc}"
+        raise
+    if ready_map is not None:
+        ready_map[os.getpid()] = {
+            "import_s": round(imported - started, 3),
+            "load_s": round(loaded - imported, 3),
+            "load_per_model_s": _engine.load_seconds,
+            "warmup_s": warmup_s,
+            "total_s": round(time.perf_counter() - started, 3),
+        }
+
+
+def _ping():
+    """No-op task; submitting one per worker makes the pool start all workers up front."""
+    return os.getpid()
+
+
+def _run_job(job_id, video_path, output_path, mode, shot_type, progress_map, cancel_map, shards=1,
+             sidecar_path=None):
+    """
+    Runs one job inside a worker process and returns the /process payload.
+    Without an output_path only the decisions are computed; with a
+    sidecar_path the per-frame detections are written there. The payload's
+    "timings" summarise the job's stage timings; "_metrics" carries them in
+    full for the API process's /metrics and is removed by JobManager.
+    """
+    from processing.engine import ProcessingCancelled
+
+    started = time.perf_counter()
+    last_report = [0.0]
+    metrics = Metrics()
+
+    def report(frames_done, total_frames):
+        if cancel_map.get(job_id):
+            raise ProcessingCancelled()
+        now = time.perf_counter()
+        if now - last_report[0] >= PROGRESS_INTERVAL:
+            last_report[0] = now
+            elapsed = now - started
+            progress_map[job_id] = {
+                "frames_done": frames_done,
+                "total_frames": total_frames,
+                "fps": round(frames_done / elapsed, 2) if elapsed else 0.0,
+                "queue_depths": {stage: depth for (stage,), depth in
+                                 metrics.gauge_values("pipeline_queue_depth").items()},
+            }
+
+    progress_map[job_id] = {"frames_done": 0, "total_frames": 0, "fps": 0.0}
+    stats = {}
+    if shards > 1:
+        # Frame-range shards run in their own processes; report sums their progress and stops them all
+        # when the job is cancelled
+        from processing.sharding import process_video_sharded
+        results = process_video_sharded(video_path, output_path, mode=mode, shot_type=shot_type,
+                                        num_shards=shards, engine_kwargs=_engine_kwargs, stats=stats,
+                                        metrics=metrics, sidecar_path=sidecar_path, progress=report)
+    else:
+        results = _engine.process_video(video_path, output_path, mode=mode, shot_type=shot_type,
+                                        stats=stats, progress=report, metrics=metrics, sidecar_path=sidecar_path)
+        stats.pop("timings", None)
+    progress_map[job_id] = {
+        "frames_done": stats.get("frames", 0),
+        "total_frames": stats.get("frames", 0),
+        "fps": stats.get("fps", 0.0),
+    }
+    return {
+        "message": "Processing complete",
+        "output_video": str(output_path) if output_path else None,
+        "detections": str(sidecar_path) if sidecar_path else None,
+        "results_summary": results,
+        "pipeline_stats": stats,
+        "timings": metrics.summary(),
+        "_metrics": metrics.snapshot(),
+    }
+
+
+def _start_job(result_queue, batching_map, job_id, *args):
+    """
+    Starts _run_job on a thread of this worker, once fewer than
+    jobs_per_worker jobs are running here, and returns straight away so the
+    worker can take on the next one. The outcome is put on result_queue as
+    (job_id, payload, exception); the micro-batching histograms of the
+    worker's engine are published in batching_map under its pid.
+    """
+    _job_slots.acquire()
+
+    def run():
+        try:
+            outcome = (job_id, _run_job(job_id, *args), None)
+        except BaseException as exc:
+            outcome = (job_id, None, exc)
+        finally:
+            _job_slots.release()
+        if _engine.batchers:
+            batching_map[os.getpid()] = [sample for batcher in _engine.batchers for sample in batcher.histograms()]
+        try:
+            result_queue.put(outcome)
+        except Exception as exc:
+            # E.g. an exception that cannot be pickled
+            result_queue.put((job_id, None, RuntimeError(f"{type(exc).__name__}: {exc}")))
+
+    threading.Thread(target=run, name=f"job-{job_id}", daemon=True).start()
+    return os.getpid()
+
+
+def _render_clip(video_path, output_path, decision_frame, mode, shot_type):
+    _engine.render_clip(video_path, output_path, decision_frame, mode=mode, shot_type=shot_type)
+    return str(output_path)
+
+
+class JobManager:
+    """
+    Queues /process requests and runs them on a pool of worker processes,
+    each with its own ProcessingEngine. Progress and cancellation flags are
+    shared with the workers through a multiprocessing Manager.
+
+    With jobs_per_worker > 1 each worker runs that many jobs at once on
+    threads sharing its engine (with micro_batching in engine_kwargs their
+    frames share forward passes). Their outcomes come back through a
+    Manager queue instead of the pool's futures.
+    """
+
+    def __init__(self, workers=1, engine_kwargs=None, on_complete=None, on_worker_ready=None, job_ttl=86400,
+                 max_finished_jobs=1000, jobs_per_worker=1):
+        self.workers = max(1, workers)
+        self.jobs_per_worker = max(1, jobs_per_worker)
+        self.engine_kwargs = engine_kwargs or {}
+        # Finished jobs are forgotten after job_ttl seconds, oldest first beyond max_finished_jobs
+        self.job_ttl = job_ttl
+        self.max_finished_jobs = max_finished_jobs
+        # Called with the job dict after a job finishes successfully
+        self.on_complete = on_complete
+        # Called with (pid, startup breakdown) once per worker whose engine is warm
+        self.on_worker_ready = on_worker_ready
+        # Stage timings and counters of every finished job, for /metrics
+        self.metrics = Metrics()
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._manager = None
+        self._executor = None
+        self._progress = None
+        self._cancel = None
+        self._ready = None
+        self._errors = None
+        self._results = None
+        self._batching = None
+        self._collector = None
+        # Future of every job started on a worker thread whose outcome has not arrived, with its executor
+        self._handoffs = {}
+        self._reported = set()
+        self._restart_lock = threading.Lock()
+        self._restarts = []
+        # Why a worker failed to start (e.g. missing model weights), if one did
+        self.startup_error = None
+
+    def start(self):
+        context = multiprocessing.get_context("spawn")
+        self._manager = context.Manager()
+        self._progress = self._manager.dict()
+        self._cancel = self._manager.dict()
+        self._ready = self._manager.dict()
+        self._errors = self._manager.dict()
+        if self.jobs_per_worker > 1:
+            self._results = self._manager.Queue()
+            self._batching = self._manager.dict()
+            self._collector = threading.Thread(target=self._collect_results, name="job-results", daemon=True)
+            self._collector.start()
+        self._start_executor()
+
+    def _start_executor(self):
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.engine_kwargs, self._ready, self._errors, self.jobs_per_worker),
+        )
+        self._executor = executor
+        # Workers are spawned on demand; start them all now so they load and
+        # warm up their models before the first job arrives
+        for _ in range(self.workers):
+            executor.submit(_ping).add_done_callback(lambda f: self._on_ping(executor, f))
+
+    def _on_ping(self, executor, future):
+        if future.cancelled():
+            return
+        exc = future.exception()
+        if isinstance(exc, BrokenProcessPool):
+            self._restart(executor)
+        elif exc is not None:
+            self.startup_error = str(exc) or type(exc).__name__
+        else:
+            self._report_ready()
+
+    def _init_error(self):
+        """The exception a worker's initializer raised, if any worker's did."""
+        try:
+            return next(iter(self._errors.values()), None) if self._errors is not None else None
+        except (OSError, EOFError):
+            return None
+
+    def _restart(self, executor):
+        """
+        Replaces `executor` after one of its workers died. Returns True if a
+        working pool is in place afterwards, False (with startup_error set)
+        if a worker failed to start or the pool broke too often to retry.
+        Jobs running on the threads of its workers fail.
+        """
+        with self._restart_lock:
+            if self._executor is not executor:
+                # Already replaced after another of its futures failed
+                return self._executor is not None
+            with self._lock:
+                lost = [job_id for job_id, (owner, _) in self._handoffs.items() if owner is executor]
+                lost = [self._handoffs.pop(job_id)[1] for job_id in lost]
+            restarted = self._replace(executor)
+        for done in lost:
+            done.set_exception(BrokenProcessPool("A process in the process pool was terminated abruptly "
+                                                 "while the job was running."))
+        return restarted
+
+    def _replace(self, executor):
+        """Starts a new pool in place of `executor` unless it should stay down. Call with _restart_lock held."""
+        error = self._init_error()
+        now = time.monotonic()
+        self._restarts = [t for t in self._restarts if now - t < POOL_RESTART_WINDOW]
+        if error is None and len(self._restarts) >= MAX_POOL_RESTARTS:
+            error = (f"worker pool broke {len(self._restarts) + 1} times in "
+                     f"{POOL_RESTART_WINDOW}s; not restarting it")
+        if error is not None:
+            self.startup_error = error
+            return False
+        self._restarts.append(now)
+        executor.shutdown(wait=False, cancel_futures=True)
+        self._ready.clear()
+        with self._lock:
+            self._reported.clear()
+        self.metrics.count("worker_pool_restarts")
+        self._start_executor()
+        return True
+
+    def _submit(self, fn, *args):
+        """
+        Submits fn to the pool, replacing the pool once if it is broken.
+        Returns (executor, future); raises BrokenProcessPool if no working
+        pool could be had.
+        """
+        executor = self._executor
+        try:
+            return executor, executor.submit(fn, *args)
+        except BrokenProcessPool:
+            if not self._restart(executor):
+                raise
+        executor = self._executor
+        return executor, executor.submit(fn, *args)
+
+    def _report_ready(self):
+        """Calls on_worker_ready for workers that became ready since the last call."""
+        for pid, startup in self.startup_stats().items():
+            with self._lock:
+                if pid in self._reported:
+                    continue
+                self._reported.add(pid)
+            if self.on_worker_ready:
+                self.on_worker_ready(pid, startup)
+
+    def startup_stats(self):
+        """Startup breakdown of every worker whose engine is loaded and warm, by pid."""
+        try:
+            return dict(self._ready) if self._ready is not None else {}
+        except (OSError, EOFError):
+            return {}
+
+    def ready(self):
+        """True once every worker has loaded and warmed up its engine."""
+        executor = self._executor
+        if executor is not None and getattr(executor, "_broken", False):
+            # A worker died while the pool was idle, so no future failed to report it
+            self._restart(executor)
+        self._report_ready()
+        return len(self.startup_stats()) >= self.workers
+
+    def shutdown(self):
+        if self._executor is not None:
+            for job_id in list(self.jobs):
+                self.cancel(job_id)
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        with self._lock:
+            # Jobs still on worker threads went down with the workers
+            lost = [done for _, done in self._handoffs.values()]
+            self._handoffs.clear()
+        for done in lost:
+            done.cancel()
+        if self._collector is not None:
+            self._results.put(None)
+            self._collector.join()
+            self._collector = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+            self._ready = None
+            self._errors = None
+            self._results = None
+            self._batching = None
+
+    def submit(self, video_path, output_path, mode="doubles", shot_type="rally", shards=1, sidecar_path=None,
+               **info):
+        """
+        Queues a job and returns its id. Raises BrokenProcessPool when the
+        workers cannot run jobs (see startup_error); the job is not recorded.
+        """
+        job_id = uuid.uuid4().hex
+        args = (job_id, str(video_path), str(output_path) if output_path else None, mode, shot_type, self._progress,
+                self._cancel, shards, str(sidecar_path) if sidecar_path else None)
+        if self.jobs_per_worker > 1:
+            # The pool's future only says the job started on a worker thread; `done` gets its outcome
+            done = Future()
+            with self._lock:
+                self._handoffs[job_id] = (None, done)
+            try:
+                executor, future = self._submit(_start_job, self._results, self._batching, *args)
+            except BaseException:
+                with self._lock:
+                    self._handoffs.pop(job_id, None)
+                raise
+            with self._lock:
+                if job_id in self._handoffs:
+                    self._handoffs[job_id] = (executor, done)
+        else:
+            executor, future = self._submit(_run_job, *args)
+            done = future
+        job = {
+            "job_id": job_id,
+            "status": QUEUED,
+            "mode": mode,
+            "shot_type": shot_type,
+            "shards": shards,
+            "video_path": str(video_path),
+            "output_path": str(output_path) if output_path else None,
+            "sidecar_path": str(sidecar_path) if sidecar_path else None,
+            "created_at": time.time(),
+            "finished_at": None,
+            "result": None,
+            "error": None,
+            "_future": future,
+            **info,
+        }
+        # Recorded only once the pool has accepted it, and before the callback that may finish it
+        with self._lock:
+            self.jobs[job_id] = job
+            self._prune()
+        if done is not future:
+            future.add_done_callback(lambda f, job_id=job_id: self._on_started(job_id, f))
+        done.add_done_callback(lambda f, job_id=job_id: self._on_done(job_id, executor, f))
+        return job_id
+
+    def _on_started(self, job_id, future):
+        """Passes on a job that never got to a worker thread: cancelled while queued, or the pool broke."""
+        if not future.cancelled() and future.exception() is None:
+            return
+        with self._lock:
+            entry = self._handoffs.pop(job_id, None)
+        if entry is None:
+            return
+        if future.cancelled():
+            entry[1].cancel()
+        else:
+            entry[1].set_exception(future.exception())
+
+    def _collect_results(self):
+        """Resolves the futures of jobs run on worker threads as their outcomes arrive."""
+        while True:
+            try:
+                item = self._results.get(timeout=1)
+            except queue.Empty:
+                # A dead worker takes its running jobs with it; only a broken pool tells
+                executor = self._executor
+                if executor is not None and getattr(executor, "_broken", False):
+                    self._restart(executor)
+                continue
+            except (OSError, EOFError):
+                return
+            if item is None:
+                return
+            job_id, payload, exc = item
+            with self._lock:
+                entry = self._handoffs.pop(job_id, None)
+            if entry is None:
+                continue
+            if exc is not None:
+                entry[1].set_exception(exc)
+            else:
+                entry[1].set_result(payload)
+
+    def batching_histograms(self):
+        """
+        Micro-batching histograms of the workers' engines summed over
+        workers, as (name, labels, snapshot) samples for Metrics.render.
+        """
+        try:
+            per_worker = list(self._batching.values()) if self._batching is not None else []
+        except (OSError, EOFError):
+            return []
+        merged = {}
+        for samples in per_worker:
+            for name, labels, snapshot in samples:
+                key = (name, tuple(sorted(labels.items())))
+                if key not in merged:
+                    merged[key] = Histogram(snapshot["buckets"])
+                merged[key].merge(snapshot)
+        return [(name, dict(labels), histogram.snapshot()) for (name, labels), histogram in sorted(merged.items())]
+
+    def render_clip(self, video_path, output_path, decision_frame, mode="doubles", shot_type="rally"):
+        """
+        Renders an annotated clip around one decision on the worker pool.
+        Returns a concurrent.futures.Future resolving to the clip path.
+        """
+        return self._submit(_render_clip, str(video_path), str(output_path), decision_frame, mode, shot_type)[1]
+
+    def complete(self, result, **info):
+        """Records a job that needs no processing, e.g. one served from the result cache."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self.jobs[job_id] = {
+                "job_id": job_id,
+                "status": COMPLETED,
+                "created_at": now,
+                "finished_at": now,
+                "result": result,
+                "error": None,
+                **info,
+            }
+            self._prune()
+        return job_id
+
+    def _prune(self):
+        """Drops expired finished jobs, and the oldest beyond max_finished_jobs. Call with _lock held."""
+        cutoff = time.time() - self.job_ttl
+        finished = sorted((job["finished_at"], job_id) for job_id, job in self.jobs.items()
+                          if job["status"] in (COMPLETED, FAILED, CANCELLED))
+        excess = len(finished) - self.max_finished_jobs
+        for i, (finished_at, job_id) in enumerate(finished):
+            if i < excess or finished_at < cutoff:
+                del self.jobs[job_id]
+
+    def _sync_status(self, job_id, job):
+        """
+        Returns the job's latest progress report, or None before a worker
+        picks it up. A worker publishes progress as soon as it starts a job,
+        so the first report moves a queued job to running. Call without
+        _lock held: reading the shared dict is a round trip to the Manager.
+        """
+        progress = job.get("_progress")
+        if progress is None and job["status"] in (QUEUED, RUNNING) and self._progress is not None:
+            progress = self._progress.get(job_id)
+        if progress is not None and job["status"] == QUEUED:
+            with self._lock:
+                if job["status"] == QUEUED:
+                    job["status"] = RUNNING
+        return progress
+
+    def find_active(self, **info):
+        """Returns the id of a queued or running job whose fields match info, or None."""
+        with self._lock:
+            active = [(job_id, job) for job_id, job in self.jobs.items() if job["status"] in (QUEUED, RUNNING)]
+        for job_id, job in active:
+            self._sync_status(job_id, job)
+            if job["status"] in (QUEUED, RUNNING) and all(job.get(k) == v for k, v in info.items()):
+                return job_id
+        return None
+
+    def _on_done(self, job_id, executor, future):
+        job = self.jobs[job_id]
+        exc = None if future.cancelled() else future.exception()
+        # The job's entries in the shared dicts are no longer needed; its last progress stays with the job
+        try:
+            cancelled = self._cancel.pop(job_id, False)
+            progress = self._progress.pop(job_id, None)
+        except (OSError, EOFError):
+            # The Manager is already gone during shutdown
+            cancelled, progress = True, None
+        with self._lock:
+            job["finished_at"] = time.time()
+            job["_progress"] = progress
+            if future.cancelled() or cancelled:
+                job["status"] = CANCELLED
+            elif isinstance(exc, BrokenProcessPool):
+                job["status"] = FAILED
+                job["error"] = f"Worker process died while the job was queued or running: {exc}"
+            elif exc is not None:
+                job["status"] = FAILED
+                job["error"] = str(exc) or type(exc).__name__
+            else:
+                job["status"] = COMPLETED
+                job["result"] = future.result()
+                snapshot = job["result"].pop("_metrics", None)
+                if snapshot:
+                    self.metrics.merge(snapshot)
+        self.metrics.count("jobs", status=job["status"])
+        if isinstance(exc, BrokenProcessPool):
+            self._restart(executor)
+        if job["status"] == COMPLETED and self.on_complete:
+            self.on_complete(job)
+
+    def cancel(self, job_id):
+        """
+        Cancels a job. A queued job is dropped straight away; a running job
+        stops at its next progress report. Returns False for unknown jobs.
+        """
+        job = self.jobs.get(job_id)
+        if job is None:
+            return False
+        if job["status"] in (COMPLETED, FAILED, CANCELLED):
+            return True
+        self._cancel[job_id] = True
+        future = job.get("_future")
+        if future is not None and future.cancel():
+            with self._lock:
+                job["status"] = CANCELLED
+                job["finished_at"] = time.time()
+        return True
+
+    def gauges(self):
+        """
+        Current (name, labels, value) gauge samples for /metrics: jobs per
+        state, warm workers, and items waiting in each pipeline stage's
+        inbox summed over running jobs.
+        """
+        with self._lock:
+            active = [(job_id, job) for job_id, job in self.jobs.items() if job["status"] in (QUEUED, RUNNING)]
+        depths = {}
+        for job_id, job in active:
+            progress = self._sync_status(job_id, job)
+            for stage, depth in (progress or {}).get("queue_depths", {}).items():
+                depths[stage] = depths.get(stage, 0) + depth
+        with self._lock:
+            statuses = [job["status"] for job in self.jobs.values()]
+        samples = [("jobs", {"status": status}, statuses.count(status)) for status in (QUEUED, RUNNING)]
+        samples.append(("workers", {}, self.workers))
+        samples.append(("workers_ready", {}, len(self.startup_stats())))
+        samples.extend(("pipeline_queue_depth", {"stage": stage}, depth) for stage, depth in sorted(depths.items()))
+        return samples
+
+    def get(self, job_id):
+        """Returns a JSON-serialisable view of the job, or None."""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        progress = self._sync_status(job_id, job)
+        with self._lock:
+            view = {k: v for k, v in job.items() if not k.startswith("_")}
+        view["progress"] = dict(progress or {"frames_done": 0, "total_frames": 0, "fps": 0.0})
+        return view
@@ -0,0 +1,173 @@
+import asyncio
+import struct
+import threading
+import time
+
+import cv2
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+from starlette.websockets import WebSocketDisconnect
+
+# Binary frame message: uint32 frame id, float64 client capture time (ms since
+# the epoch, 0 if unknown), then the encoded image (JPEG/PNG)
+FRAME_HEADER = struct.Struct("<Id")
+
+# Frames older than this when inference is ready for them are dropped
+MAX_FRAME_AGE_MS = 500
+
+_detectors = None
+_detectors_lock = threading.Lock()
+
+
+def _get_detectors():
+    """
+    Loads the models once per API process, on the first live session. Each
+    is wrapped in a BatchingDetector, so the single frames of concurrent
+    sessions share forward passes.
+    """
+    global _detectors
+    with _detectors_lock:
+        if _detectors is None:
+            from processing.detectors import load_detectors
+            from processing.batching import BatchingDetector
+            shuttlecock_detector, court_detector, _ = load_detectors()
+            shuttlecock_detector.warmup()
+            court_detector.warmup()
+            _detectors = (BatchingDetector(shuttlecock_detector, name="shuttlecock"),
+                          BatchingDetector(court_detector, name="court"))
+        return _detectors
+
+
+def batching_histograms():
+    """Batch size and wait histograms of the shared models, for /metrics; empty before the first session."""
+    detectors = _detectors
+    return [sample for detector in detectors or () for sample in detector.histograms()]
+
+
+class LiveSession:
+    """
+    Per-connection state for live line calls: the trajectory and cooldown
+    in DecisionEngine, the court calibration in LineDetector, and a
+    keyframe CourtTracker. The models are shared between sessions.
+    """
+
+    def __init__(self, mode="doubles", shot_type="rally"):
+        from processing.decision import DecisionEngine
+        from processing.line_detector import LineDetector
+        from processing.court_tracker import CourtTracker
+
+        self.mode = mode
+        self.shot_type = shot_type
+        self.shuttlecock_detector, court_detector = _get_detectors()
+        self.decision_engine = DecisionEngine()
+        self.line_detector = LineDetector()
+        self.court_tracker = CourtTracker(court_detector)
+        self.lines_detected = False
+        self.frames_processed = 0
+        self.frames_dropped = 0
+
+    def process(self, frame, frame_id):
+        """Runs detection and the bounce decision for one frame. Blocking."""
+        # The shuttle model runs while the court tracker waits for its own (keyframe) pass
+        shuttlecock_future = self.shuttlecock_detector.submit([frame])
+        court_batch, scene_changes = self.court_tracker.detect_batch([frame], 1)
+        shuttlecock_dets = list(shuttlecock_future.result()[0])
+        court_dets = court_batch[0]
+
+        if scene_changes[0]:
+            self.lines_detected = False
+        if not self.lines_detected and court_dets:
+            self.line_detector.detect_lines(frame, court_dets[0][:4])
+            self.lines_detected = True
+
+        self.frames_processed += 1
+        return self.decision_engine.evaluate(
+            shuttlecock_dets,
+            court_dets,
+            frame_id,
+            mode=self.mode,
+            shot_type=self.shot_type,
+            line_detector=self.line_detector if self.lines_detected else None
+        )
+
+
+async def run_session(websocket, mode="doubles", shot_type="rally"):
+    """
+    Serves one live WebSocket connection.
+
+    The client sends binary frame messages (see FRAME_HEADER). The server
+    sends JSON messages: {"type": "frame", ...} with per-frame latency after
+    every processed frame, and {"type": "decision", ...} when a bounce is
+    called. Frames are processed newest-first: when a frame arrives before
+    the previous one has been picked up, the older one is dropped, as are
+    frames older than MAX_FRAME_AGE_MS.
+    """
+    await websocket.accept()
+    session = await run_in_threadpool(LiveSession, mode, shot_type)
+
+    latest = {"item": None}
+    available = asyncio.Event()
+    closed = asyncio.Event()
+
+    async def receive():
+        try:
+            while True:
+                data = await websocket.receive_bytes()
+                if len(data) <= FRAME_HEADER.size:
+                    continue
+                frame_id, client_ms = FRAME_HEADER.unpack_from(data)
+                if latest["item"] is not None:
+                    session.frames_dropped += 1
+                latest["item"] = (frame_id, client_ms, time.time() * 1000, data)
+                available.set()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            closed.set()
+            available.set()
+
+    async def process():
+        while True:
+            await available.wait()
+            available.clear()
+            if closed.is_set():
+                return
+            item, latest["item"] = latest["item"], None
+            if item is None:
+                continue
+            frame_id, client_ms, received_ms, data = item
+
+            if time.time() * 1000 - received_ms > MAX_FRAME_AGE_MS:
+                session.frames_dropped += 1
+                continue
+
+            buffer = np.frombuffer(data, dtype=np.uint8, offset=FRAME_HEADER.size)
+            frame = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+            if frame is None:
+                await websocket.send_json({"type": "error", "frame_id": frame_id, "detail": "Could not decode frame"})
+                continue
+
+            decision = await run_in_threadpool(session.process, frame, frame_id)
+            done_ms = time.time() * 1000
+            latency = {
+                "server_ms": round(done_ms - received_ms, 1),
+                # Only meaningful when client and server clocks are synchronised
+                "end_to_end_ms": round(done_ms - client_ms, 1) if client_ms else None,
+            }
+            if decision:
+                await websocket.send_json({"type": "decision", "frame_id": frame_id, "latency": latency, **decision})
+            await websocket.send_json({
+                "type": "frame",
+                "frame_id": frame_id,
+                "latency": latency,
+                "processed": session.frames_processed,
+                "dropped": session.frames_dropped,
+            })
+
+    receiver = asyncio.create_task(receive())
+    try:
+        await process()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
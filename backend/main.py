@@ -1,25 +1,147 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import time
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-import shutil
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+import asyncio
+import logging
 import os
+import sys
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 
 
-from processing.engine import ProcessingEngine
+# Only lightweight modules are imported here; OpenCV and the inference
+# runtimes are loaded by the worker processes (and by live.py on first use)
+from jobs import JobManager, QUEUED, RUNNING, COMPLETED
+from storage import UploadStore, UploadError
+from cache import ResultCache, evict_lru, touch
+from processing.config import (SHUTTLECOCK_MODEL_PATH, COURT_MODEL_PATH, DEFAULT_BACKEND, DEFAULT_INT8,
+                               DEFAULT_THREADS, DEFAULT_DECODER, DEFAULT_DECODE_THREADS, DEFAULT_DECODE_WIDTH,
+                               DEFAULT_ENCODER, DEFAULT_ENCODE_OPTIONS, exported_path)
+from starlette.concurrency import run_in_threadpool
 
 from fastapi.staticfiles import StaticFiles
 
 from contextlib import asynccontextmanager
 
-engine = None
+IMPORT_SECONDS = time.perf_counter() - _import_started
+logger = logging.getLogger("uvicorn.error")
+
+jobs = None
+cache = None
+
+# Frames per detector forward pass
+BATCH_SIZE = int(os.environ.get("ALICAS_BATCH_SIZE", "8"))
+# Run the court model every N frames (and on scene changes); 0 runs it on every frame
+COURT_KEYFRAME_INTERVAL = int(os.environ.get("ALICAS_COURT_KEYFRAME_INTERVAL", "30"))
+# Run the shuttle model on a crop around the predicted shuttle position
+SHUTTLE_ROI = os.environ.get("ALICAS_SHUTTLE_ROI", "0") == "1"
+# Run the shuttle model on overlapping full-resolution tiles with motion in them (for 4K footage)
+SHUTTLE_TILES = os.environ.get("ALICAS_SHUTTLE_TILES", "0") == "1"
+# Between rallies run the models on every 10th frame only; full rate while the shuttle is in play
+ADAPTIVE_SAMPLING = os.environ.get("ALICAS_ADAPTIVE_SAMPLING", "0") == "1"
+# Cores given to each worker when ALICAS_WORKERS is "auto" and ALICAS_INFERENCE_THREADS is 0
+CORES_PER_WORKER = 4
+
+
+def _worker_count(value):
+    """ALICAS_WORKERS: a number, or "auto" for one worker per ALICAS_INFERENCE_THREADS (else 4) cores."""
+    if value != "auto":
+        return max(1, int(value))
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    return max(1, cores // (DEFAULT_THREADS or CORES_PER_WORKER))
+
+
+# Worker processes running /process jobs, i.e. videos processed in parallel on this node. Each has
+# its own ProcessingEngine (one copy of the models) and starts every job from a fresh JobState
+WORKERS = _worker_count(os.environ.get("ALICAS_WORKERS", "1"))
+# Jobs each worker runs at once, on threads sharing its engine. With micro-batching (the default
+# when this is above 1) their frames are merged into shared forward passes, see
+# ALICAS_MICRO_BATCH_SIZE / ALICAS_MICRO_BATCH_WAIT_MS; without it they take turns on the models
+JOBS_PER_WORKER = max(1, int(os.environ.get("ALICAS_JOBS_PER_WORKER", "1")))
+MICRO_BATCHING = os.environ.get("ALICAS_MICRO_BATCHING", "1" if JOBS_PER_WORKER > 1 else "0") == "1"
+# Frame-range shards per video, each processed in its own process (1 = no sharding)
+SHARDS = int(os.environ.get("ALICAS_SHARDS", "1"))
+# Render the annotated output video by default; with 0 only decisions are computed
+# and clips are rendered on demand through /clips
+RENDER = os.environ.get("ALICAS_RENDER", "1") == "1"
+# Write a detection sidecar per job (boxes of every frame, court calibrations and decisions,
+# served from /outputs with range requests) for overlays drawn on the original video
+SIDECAR = os.environ.get("ALICAS_SIDECAR", "1") == "1"
+SIDECAR_SUFFIX = ".detections.bin"
+# Size limits for uploads/ and outputs/; least recently used files are evicted first (0 = unlimited)
+UPLOAD_CACHE_MB = int(os.environ.get("ALICAS_UPLOAD_CACHE_MB", "20000"))
+OUTPUT_CACHE_MB = int(os.environ.get("ALICAS_OUTPUT_CACHE_MB", "20000"))
+# Finished jobs stay listed in /jobs for this many seconds, and at most this many of them
+JOB_TTL = int(os.environ.get("ALICAS_JOB_TTL", "86400"))
+MAX_FINISHED_JOBS = int(os.environ.get("ALICAS_MAX_FINISHED_JOBS", "1000"))
+# Resumable uploads idle for this many seconds are dropped along with their partial file
+UPLOAD_SESSION_TTL = int(os.environ.get("ALICAS_UPLOAD_SESSION_TTL", "86400"))
+
+ENGINE_KWARGS = {
+    "batch_size": BATCH_SIZE,
+    "court_keyframe_interval": COURT_KEYFRAME_INTERVAL,
+    "shuttle_roi": SHUTTLE_ROI,
+    "shuttle_tiles": SHUTTLE_TILES,
+    "adaptive_sampling": ADAPTIVE_SAMPLING,
+    # Inference runtime, see ALICAS_BACKEND / ALICAS_INT8 / ALICAS_INFERENCE_THREADS in processing/config.py
+    "backend": DEFAULT_BACKEND,
+    "int8": DEFAULT_INT8,
+    "threads": DEFAULT_THREADS,
+    # Video decoding, see ALICAS_DECODER / ALICAS_DECODE_THREADS / ALICAS_DECODE_WIDTH
+    "decoder": DEFAULT_DECODER,
+    "decode_threads": DEFAULT_DECODE_THREADS,
+    "decode_width": DEFAULT_DECODE_WIDTH,
+    # Output video writer, see ALICAS_ENCODER / ALICAS_OUTPUT_*
+    "encoder": DEFAULT_ENCODER,
+    "encode_options": DEFAULT_ENCODE_OPTIONS,
+    "micro_batching": MICRO_BATCHING,
+}
+# Engine settings that change results and are therefore part of the cache key
+RESULT_SETTINGS = {k: v for k, v in ENGINE_KWARGS.items()
+                   if k not in ("batch_size", "threads", "decode_threads", "encoder", "encode_options",
+                                 "micro_batching")}
+# The weight files actually loaded for the configured backend
+MODEL_FILES = [exported_path(path, DEFAULT_BACKEND, DEFAULT_INT8) for path in (SHUTTLECOCK_MODEL_PATH, COURT_MODEL_PATH)]
+
+def _on_job_complete(job):
+    if job.get("cache_key"):
+        cache.put(job["cache_key"], job["result"])
+    _evict()
+
+def _evict():
+    active = []
+    for job in list(jobs.jobs.values()):
+        if job["status"] in (QUEUED, RUNNING):
+            active += [path for path in (job["video_path"], job["output_path"], job.get("sidecar_path")) if path]
+    evict_lru(UPLOAD_DIR, UPLOAD_CACHE_MB * 1024 * 1024, protected=active)
+    evict_lru(OUTPUT_DIR, OUTPUT_CACHE_MB * 1024 * 1024, protected=active)
+
+def _on_worker_ready(pid, startup):
+    logger.info("Worker %s ready in %.2fs (imports %.2fs, model load %.2fs %s, warm-up %.2fs)",
+                pid, startup["total_s"], startup["import_s"], startup["load_s"], startup["load_per_model_s"],
+                startup["warmup_s"])
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global engine
-    # Initialize Engine here to avoid loading it in the parent process during reload
-    engine = ProcessingEngine()
+    global jobs, cache
+    started = time.perf_counter()
+    cache = ResultCache(OUTPUT_DIR, MODEL_FILES, RESULT_SETTINGS)
+    # Engines are created inside the worker processes, never in the API process.
+    # The workers load and warm up their models in the background; /readyz reports when they are done
+    jobs = JobManager(workers=WORKERS, engine_kwargs=ENGINE_KWARGS, on_complete=_on_job_complete,
+                      on_worker_ready=_on_worker_ready, job_ttl=JOB_TTL, max_finished_jobs=MAX_FINISHED_JOBS,
+                      jobs_per_worker=JOBS_PER_WORKER)
+    jobs.start()
+    logger.info("API started in %.2fs (imports %.2fs, job manager %.2fs); %d worker(s) warming up",
+                IMPORT_SECONDS + time.perf_counter() - started, IMPORT_SECONDS, time.perf_counter() - started,
+                WORKERS)
     yield
-    engine = None
+    jobs.shutdown()
+    jobs = None
+    cache = None
 
 app = FastAPI(title="ALiCaS-B Backend", lifespan=lifespan)
 
@@ -30,6 +152,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets the frontend read partial responses of range requests for the detection sidecar
+    expose_headers=["Accept-Ranges", "Content-Range", "Content-Length"],
 )
 
 # Directories
@@ -38,53 +162,223 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 OUTPUT_DIR = Path("outputs")
 OUTPUT_DIR.mkdir(exist_ok=True)
 
-# Mount static files
+uploads = UploadStore(UPLOAD_DIR, session_ttl=UPLOAD_SESSION_TTL)
+
+# Mount static files; Range requests are answered with 206 partial content (Starlette >= 0.39)
 app.mount("/outputs", StaticFiles(directory=OUTPUT_DIR), name="outputs")
 
 @app.get("/")
 async def root():
     return {"message": "ALiCaS-B Backend is running"}
 
-import uuid
+@app.get("/healthz")
+async def healthz():
+    # Liveness: the API process is up, whether or not the models are loaded yet
+    return {"status": "ok"}
+
+@app.get("/metrics")
+async def metrics():
+    # Prometheus text format: stage timing histograms and counters of finished jobs, plus live gauges
+    # and the micro-batching histograms of the workers (source="process") and, once a live session
+    # has loaded the models, of the live sessions (source="live")
+    if jobs is None:
+        return PlainTextResponse("", media_type="text/plain; version=0.0.4")
+    gauges = await run_in_threadpool(jobs.gauges)
+    histograms = [(name, {**labels, "source": "process"}, data)
+                  for name, labels, data in await run_in_threadpool(jobs.batching_histograms)]
+    live = sys.modules.get("live")
+    if live:
+        histograms += [(name, {**labels, "source": "live"}, data) for name, labels, data in live.batching_histograms()]
+    return PlainTextResponse(jobs.metrics.render(gauges=gauges, histograms=histograms),
+                             media_type="text/plain; version=0.0.4")
+
+@app.get("/readyz")
+async def readyz():
+    # Readiness: every worker has loaded and warmed up its models
+    ready = jobs is not None and await run_in_threadpool(jobs.ready)
+    workers = await run_in_threadpool(jobs.startup_stats) if jobs is not None else {}
+    error = jobs.startup_error if jobs is not None else None
+    body = {
+        "status": "ready" if ready else ("failed" if error else "starting"),
+        "error": error,
+        "workers": WORKERS,
+        "workers_ready": len(workers),
+        "startup": {str(pid): startup for pid, startup in workers.items()},
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+def _upload_response(path, digest, duplicate, original_filename):
+    return {
+        "filename": path.name,
+        "original_filename": original_filename,
+        "location": str(path),
+        "sha256": digest,
+        "duplicate": duplicate,
+        "message": "Video already uploaded" if duplicate else "Video uploaded successfully"
+    }
 
 @app.post("/upload")
 async def upload_video(file: UploadFile = File(...)):
     try:
-        # Generate a safe filename using UUID
-        file_extension = Path(file.filename).suffix
-        safe_filename = f"{uuid.uuid4()}{file_extension}"
-        file_location = UPLOAD_DIR / safe_filename
-        
-        with open(file_location, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        return {
-            "filename": safe_filename, 
-            "original_filename": file.filename,
-            "location": str(file_location), 
-            "message": "Video uploaded successfully"
-        }
+        # Stored under the content hash, so re-uploading a file returns the existing copy
+        path, digest, duplicate = await uploads.save(file)
+        await run_in_threadpool(_evict)
+        return _upload_response(path, digest, duplicate, file.filename)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/process/{filename}")
-async def process_video(filename: str, mode: str = "doubles", shot_type: str = "rally"):
+# Resumable uploads: POST /uploads, then PUT /uploads/{id}?offset=N with the raw
+# bytes of each chunk, then POST /uploads/{id}/complete. GET /uploads/{id}
+# returns the offset to resume from after a dropped connection.
+
+@app.post("/uploads")
+async def create_upload(filename: str, size: int = None):
+    session = uploads.create_session(filename, size)
+    return session.as_dict()
+
+@app.get("/uploads/{upload_id}")
+async def get_upload(upload_id: str):
+    try:
+        return uploads.get_session(upload_id).as_dict()
+    except UploadError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.put("/uploads/{upload_id}")
+async def append_upload(upload_id: str, offset: int, request: Request):
+    try:
+        session = await uploads.append(upload_id, offset, request.stream())
+        return session.as_dict()
+    except UploadError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.post("/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str):
+    try:
+        original_filename = uploads.get_session(upload_id).original_filename
+        path, digest, duplicate = await uploads.complete(upload_id)
+        await run_in_threadpool(_evict)
+        return _upload_response(path, digest, duplicate, original_filename)
+    except UploadError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.post("/process/{filename}", status_code=202)
+async def process_video(filename: str, mode: str = "doubles", shot_type: str = "rally", shards: int = None,
+                        render: bool = None):
     video_path = UPLOAD_DIR / filename
     if not video_path.exists():
         raise HTTPException(status_code=404, detail="Video not found")
     
-    output_filename = f"processed_{filename}"
-    output_path = OUTPUT_DIR / output_filename
-    
-    try:
-        results = engine.process_video(video_path, output_path, mode=mode, shot_type=shot_type)
-        return {
-            "message": "Processing complete",
-            "output_video": str(output_path),
-            "results_summary": results
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    touch(video_path)
+    # Hashes the video (when its name is not already its digest) and the model weights
+    render = RENDER if render is None else render
+    cache_key = await run_in_threadpool(cache.key, video_path, mode, shot_type, render=render, sidecar=SIDECAR)
+
+    cached = cache.get(cache_key)
+    if cached is not None:
+        job_id = jobs.complete(cached, filename=filename, mode=mode, shot_type=shot_type, cached=True)
+        return {"message": "Processing complete (cached)", "job_id": job_id, "status_url": f"/jobs/{job_id}"}
+
+    # The same video and settings may already be queued or running
+    job_id = jobs.find_active(cache_key=cache_key)
+    if job_id is None:
+        # Decision-only jobs skip drawing and encoding entirely
+        output_path = cache.output_path(cache_key, video_path.suffix) if render else None
+        sidecar_path = cache.output_path(cache_key, SIDECAR_SUFFIX) if SIDECAR else None
+        try:
+            job_id = jobs.submit(video_path, output_path, mode=mode, shot_type=shot_type, shards=shards or SHARDS,
+                                 sidecar_path=sidecar_path, filename=filename, cache_key=cache_key)
+        except BrokenProcessPool as e:
+            raise HTTPException(status_code=503, detail=f"Workers unavailable: {jobs.startup_error or e}")
+    return {
+        "message": "Processing queued",
+        "job_id": job_id,
+        "status_url": f"/jobs/{job_id}"
+    }
+
+@app.get("/jobs")
+async def list_jobs():
+    # A job may be pruned between listing the ids and reading it
+    views = (jobs.get(job_id) for job_id in list(jobs.jobs))
+    return {"jobs": [view for view in views if view is not None]}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    if not jobs.cancel(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return jobs.get(job_id)
+
+# Clip path -> task of its render in flight
+_clip_renders = {}
+
+def _render_clip(job, video_path, clip_path, decision_frame):
+    """
+    Starts rendering a clip on the worker pool and returns a coroutine that
+    waits for it. The clip is written to a hidden file (skipped by the LRU
+    eviction) and moved into place once complete, so it is never served
+    half-written.
+    """
+    partial_path = clip_path.with_name(f".{clip_path.name}")
+    future = jobs.render_clip(video_path, partial_path, decision_frame, mode=job["mode"], shot_type=job["shot_type"])
+
+    async def wait():
+        try:
+            await asyncio.wrap_future(future)
+            os.replace(partial_path, clip_path)
+        finally:
+            _clip_renders.pop(clip_path, None)
+            partial_path.unlink(missing_ok=True)
+    return wait()
+
+@app.get("/clips/{job_id}/{decision_index}")
+async def get_clip(job_id: str, decision_index: int):
+    """Annotated clip around one decision of a finished job, rendered on first request."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != COMPLETED:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    decisions = job["result"]["results_summary"]
+    if not 0 <= decision_index < len(decisions):
+        raise HTTPException(status_code=404, detail="Decision not found")
+
+    video_path = UPLOAD_DIR / job["filename"]
+    if not video_path.exists():
+        raise HTTPException(status_code=404, detail="Source video no longer available")
+
+    clip_dir = OUTPUT_DIR / "clips"
+    clip_dir.mkdir(exist_ok=True)
+    clip_path = clip_dir / f"{job.get('cache_key') or job_id}_{decision_index}{video_path.suffix}"
+    if not clip_path.exists():
+        # Requests for a clip being rendered wait for that render instead of starting another
+        render = _clip_renders.get(clip_path)
+        if render is None:
+            touch(video_path)
+            try:
+                render = asyncio.ensure_future(_render_clip(job, video_path, clip_path,
+                                                            decisions[decision_index]["frame"]))
+            except BrokenProcessPool as e:
+                raise HTTPException(status_code=503, detail=f"Workers unavailable: {jobs.startup_error or e}")
+            _clip_renders[clip_path] = render
+        try:
+            # Shielded: a client going away must not cancel a render other requests share
+            await asyncio.shield(render)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    touch(clip_path)
+    return FileResponse(clip_path)
+
+@app.websocket("/live")
+async def live_calls(websocket: WebSocket, mode: str = "doubles", shot_type: str = "rally"):
+    # Live line calls on a stream of encoded frames; see live.run_session for the protocol
+    import live
+    await live.run_session(websocket, mode=mode, shot_type=shot_type)
 
 if __name__ == "__main__":
     import uvicorn
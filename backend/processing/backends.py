@@ -0,0 +1,259 @@
+import os
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from .config import BACKENDS, exported_path
+
+# Same defaults as ultralytics predict, so every backend returns the same boxes
+CONF_THRESHOLD = 0.25
+IOU_THRESHOLD = 0.7
+MAX_DETECTIONS = 300
+DEFAULT_IMGSZ = 640
+PAD_VALUE = 114
+
+
+def letterbox(frame, size):
+    """
+    Resizes a frame to fit a size x size square, keeping its aspect ratio and
+    padding the rest. Returns (image, gain, (pad_x, pad_y)).
+    """
+    height, width = frame.shape[:2]
+    gain = min(size / height, size / width)
+    new_w, new_h = int(round(width * gain)), int(round(height * gain))
+    if (new_w, new_h) != (width, height):
+        frame = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    pad_x, pad_y = (size - new_w) / 2, (size - new_h) / 2
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    image = cv2.copyMakeBorder(frame, top, bottom, left, right, cv2.BORDER_CONSTANT,
+                               value=(PAD_VALUE, PAD_VALUE, PAD_VALUE))
+    return image, gain, (left, top)
+
+
+def preprocess(frames, size):
+    """Letterboxes BGR frames into one (n, 3, size, size) float32 RGB blob in [0, 1]."""
+    images, transforms = [], []
+    for frame in frames:
+        image, gain, pad = letterbox(frame, size)
+        images.append(image)
+        transforms.append((gain, pad, frame.shape[:2]))
+    blob = np.stack(images)[..., ::-1].transpose(0, 3, 1, 2)
+    return np.ascontiguousarray(blob, dtype=np.float32) / 255.0, transforms
+
+
+def postprocess(output, transforms, conf=CONF_THRESHOLD, iou=IOU_THRESHOLD, max_det=MAX_DETECTIONS):
+    """
+    Decodes raw YOLOv8 output of shape (n, 4 + classes, anchors) into one
+    (m, 6) float32 array of [x1, y1, x2, y2, conf, cls] rows per frame,
+    with per-class NMS, in original frame coordinates.
+    """
+    results = []
+    for pred, (gain, (pad_x, pad_y), (height, width)) in zip(output, transforms):
+        pred = pred.T
+        scores = pred[:, 4:]
+        classes = scores.argmax(axis=1)
+        confs = scores[np.arange(len(scores)), classes]
+        keep = confs > conf
+        if not keep.any():
+            results.append(np.empty((0, 6), dtype=np.float32))
+            continue
+        xywh, confs, classes = pred[keep, :4], confs[keep], classes[keep]
+
+        # Offset boxes by class so NMS never suppresses across classes
+        offset = classes[:, None] * 7680.0
+        nms_boxes = np.concatenate((xywh[:, :2] - xywh[:, 2:] / 2 + offset, xywh[:, 2:]), axis=1)
+        picked = cv2.dnn.NMSBoxes(nms_boxes.tolist(), confs.tolist(), conf, iou)
+        picked = np.asarray(picked, dtype=np.int64).reshape(-1)[:max_det]
+
+        boxes = np.concatenate((xywh[picked, :2] - xywh[picked, 2:] / 2,
+                                xywh[picked, :2] + xywh[picked, 2:] / 2), axis=1)
+        boxes = (boxes - [pad_x, pad_y, pad_x, pad_y]) / gain
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+        results.append(np.concatenate(
+            (boxes, confs[picked, None], classes[picked, None]), axis=1).astype(np.float32))
+    return results
+
+
+def _result_to_array(result):
+    """
+    Converts one ultralytics Result into an (n, 6) float32 array of
+    [x1, y1, x2, y2, conf, cls] rows without looping over the boxes.
+    """
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return np.empty((0, 6), dtype=np.float32)
+    data = boxes.data.cpu().numpy()
+    # boxes.data is [x1, y1, x2, y2, (track_id,) conf, cls]
+    return np.ascontiguousarray(
+        np.concatenate((data[:, :4], data[:, -2:]), axis=1), dtype=np.float32
+    )
+
+
+class TorchBackend:
+    """The .pt weights through ultralytics (PyTorch)."""
+
+    def __init__(self, model_path, threads=None):
+        from ultralytics import YOLO
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.model = YOLO(str(model_path))
+
+    def predict(self, frames):
+        results = self.model(list(frames), verbose=False)
+        return [_result_to_array(result) for result in results]
+
+
+class _ExportedBackend:
+    """
+    Common code for exported models: letterbox, one forward pass, decode
+    and NMS in NumPy. Models exported with a fixed batch size of 1 are
+    run frame by frame.
+    """
+
+    imgsz = DEFAULT_IMGSZ
+    fixed_batch = None
+
+    def _run(self, blob):
+        raise NotImplementedError
+
+    def predict(self, frames):
+        frames = list(frames)
+        if not frames:
+            return []
+        blob, transforms = preprocess(frames, self.imgsz)
+        step = self.fixed_batch or len(frames)
+        outputs = [self._run(blob[i:i + step]) for i in range(0, len(frames), step)]
+        return postprocess(np.concatenate(outputs, axis=0), transforms)
+
+
+class ONNXBackend(_ExportedBackend):
+    """An exported .onnx model on ONNX Runtime's CPU execution provider."""
+
+    def __init__(self, model_path, threads=None):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch, _, height, _ = model_input.shape
+        if isinstance(height, int):
+            self.imgsz = height
+        if isinstance(batch, int):
+            self.fixed_batch = batch
+
+    def _run(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenVINOBackend(_ExportedBackend):
+    """An exported OpenVINO IR model (a *_openvino_model directory or .xml) on the CPU plugin."""
+
+    def __init__(self, model_path, threads=None):
+        import openvino as ov
+        model_path = Path(model_path)
+        if model_path.is_dir():
+            model_path = next(model_path.glob("*.xml"))
+        core = ov.Core()
+        config = {"PERFORMANCE_HINT": "LATENCY"}
+        if threads:
+            config["INFERENCE_NUM_THREADS"] = threads
+        self.model = core.compile_model(core.read_model(str(model_path)), "CPU", config)
+        shape = self.model.input(0).partial_shape
+        if shape[2].is_static:
+            self.imgsz = shape[2].get_length()
+        if shape[0].is_static:
+            self.fixed_batch = shape[0].get_length()
+
+    def _run(self, blob):
+        return self.model(blob)[self.model.output(0)]
+
+
+_BACKEND_CLASSES = {
+    "pytorch": TorchBackend,
+    "onnx": ONNXBackend,
+    "openvino": OpenVINOBackend,
+}
+
+
+def load_backend(model_path, backend="pytorch", threads=None, int8=False):
+    """
+    Loads the `backend` version of a model. model_path is the .pt weights;
+    the ONNX / OpenVINO files are looked up next to it (see exported_path)
+    unless model_path already points at one.
+    """
+    if backend not in _BACKEND_CLASSES:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+    path = Path(model_path)
+    if path.suffix == ".pt":
+        path = exported_path(path, backend, int8)
+    if backend != "pytorch" and not path.exists():
+        raise FileNotFoundError(f"No {backend} model at {path}; export it first with export_models.py")
+    return _BACKEND_CLASSES[backend](path, threads)
+
+
+class _CalibrationReader:
+    """Feeds letterboxed images from a directory to ONNX Runtime's static quantizer."""
+
+    def __init__(self, image_dir, input_name, imgsz, limit=200):
+        paths = sorted(p for p in Path(image_dir).rglob("*") if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+        self.input_name = input_name
+        self.imgsz = imgsz
+        self.paths = iter(paths[:limit])
+
+    def get_next(self):
+        for path in self.paths:
+            frame = cv2.imread(str(path))
+            if frame is not None:
+                return {self.input_name: preprocess([frame], self.imgsz)[0]}
+        return None
+
+
+def export_model(model_path, backend, int8=False, imgsz=DEFAULT_IMGSZ, data=None, force=False):
+    """
+    Exports .pt weights to `backend` next to them and returns the exported path.
+    Nothing is done if the export already exists, unless force is set.
+
+    int8: also quantize the weights to INT8. For OpenVINO this is NNCF
+        post-training quantization calibrated on `data` (an ultralytics
+        data.yaml). For ONNX, `data` is a directory of calibration images for
+        static quantization; without it the weights are quantized dynamically.
+    """
+    target = exported_path(model_path, backend, int8)
+    if backend == "pytorch" or (target.exists() and not force):
+        return target
+    if backend == "openvino":
+        from ultralytics import YOLO
+        model = YOLO(str(model_path))
+        kwargs = {"data": data} if int8 and data else {}
+        exported = Path(model.export(format="openvino", imgsz=imgsz, dynamic=True, int8=int8, **kwargs))
+        if exported != target:
+            os.replace(exported, target)
+        return target
+
+    fp32 = exported_path(model_path, "onnx")
+    if force or not fp32.exists():
+        from ultralytics import YOLO
+        exported = Path(YOLO(str(model_path)).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True))
+        if exported != fp32:
+            os.replace(exported, fp32)
+    if not int8:
+        return fp32
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic, quantize_static
+    if data and Path(data).is_dir():
+        import onnxruntime as ort
+        input_name = ort.InferenceSession(str(fp32), providers=["CPUExecutionProvider"]).get_inputs()[0].name
+        quantize_static(str(fp32), str(target), _CalibrationReader(data, input_name, imgsz),
+                        weight_type=QuantType.QInt8, activation_type=QuantType.QUInt8)
+    else:
+        quantize_dynamic(str(fp32), str(target), weight_type=QuantType.QUInt8)
+    return target
@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from .config import DEFAULT_MICRO_BATCH_SIZE, DEFAULT_MICRO_BATCH_WAIT_MS
+from .detectors import _YOLODetector
+from .metrics import Histogram
+
+# Histogram bucket upper bounds for frames per forward pass
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class BatchingDetector(_YOLODetector):
+    """
+    Shares one detector between jobs running on different threads, and
+    gathers the frames they submit into larger forward passes.
+
+    Callers use it like the detector it wraps (detect, detect_batch,
+    warmup); every forward pass they ask for becomes a request that waits
+    on a Future. A single inference thread takes the oldest request, adds
+    later ones while the batch has room for them, and runs the model once
+    max_batch_size frames are waiting or the oldest request has waited
+    max_wait_ms. A request larger than max_batch_size goes through on its
+    own, max_batch_size frames per pass.
+    """
+
+    def __init__(self, detector, max_batch_size=None, max_wait_ms=None, name="detector"):
+        self.detector = detector
+        self.model = detector.model
+        self.max_batch_size = max(1, max_batch_size or DEFAULT_MICRO_BATCH_SIZE)
+        self.max_wait = (DEFAULT_MICRO_BATCH_WAIT_MS if max_wait_ms is None else max_wait_ms) / 1000
+        self.name = name
+        self._condition = threading.Condition()
+        self._pending = deque()       # (frames, future, submitted_at)
+        self._pending_frames = 0
+        self._closed = False
+        # Frames per forward pass and seconds each request waited before its pass started
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.waits = Histogram()
+        self.requests = 0
+        self._thread = threading.Thread(target=self._run, name=f"batching-{name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, frames):
+        """Queues frames for the model. Returns a Future resolving to one (n, 6) array per frame."""
+        frames = list(frames)
+        future = Future()
+        if not frames:
+            future.set_result([])
+            return future
+        with self._condition:
+            if self._closed:
+                raise RuntimeError(f"Batching for {self.name} is closed")
+            self._pending.append((frames, future, time.perf_counter()))
+            self._pending_frames += len(frames)
+            self._condition.notify()
+        return future
+
+    def _predict(self, frames):
+        return self.submit(frames).result()
+
+    def _next_requests(self):
+        """Waits for a batch to fill up or time out, then takes its requests off the queue."""
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            if not self._pending:
+                return []
+            deadline = self._pending[0][2] + self.max_wait
+            while self._pending_frames < self.max_batch_size and not self._closed:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            requests = [self._pending.popleft()]
+            size = len(requests[0][0])
+            while self._pending and size + len(self._pending[0][0]) <= self.max_batch_size:
+                requests.append(self._pending.popleft())
+                size += len(requests[-1][0])
+            self._pending_frames -= size
+            return requests
+
+    def _run(self):
+        while True:
+            requests = self._next_requests()
+            if not requests:
+                return
+            started = time.perf_counter()
+            frames = [frame for request_frames, _, _ in requests for frame in request_frames]
+            try:
+                results = []
+                for start in range(0, len(frames), self.max_batch_size):
+                    results.extend(self.detector._predict(frames[start:start + self.max_batch_size]))
+            except BaseException as exc:
+                for _, future, _ in requests:
+                    future.set_exception(exc)
+                continue
+
+            with self._condition:
+                for start in range(0, len(frames), self.max_batch_size):
+                    self.batch_sizes.observe(min(self.max_batch_size, len(frames) - start))
+                for _, _, submitted_at in requests:
+                    self.waits.observe(started - submitted_at)
+                self.requests += len(requests)
+            offset = 0
+            for request_frames, future, _ in requests:
+                future.set_result(results[offset:offset + len(request_frames)])
+                offset += len(request_frames)
+
+    def close(self):
+        """Runs what is still queued, then stops the inference thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def stats(self):
+        with self._condition:
+            batches, frames = self.batch_sizes.count, self.batch_sizes.sum
+            return {
+                "requests": self.requests,
+                "batches": batches,
+                "frames": int(frames),
+                "mean_batch_size": round(frames / batches, 2) if batches else 0.0,
+                "mean_wait_ms": round(self.waits.sum / self.waits.count * 1000, 3) if self.waits.count else 0.0,
+                "max_wait_ms": round(self.waits.max * 1000, 3),
+                "batch_size_histogram": self.batch_sizes.snapshot(),
+                "wait_histogram": self.waits.snapshot(),
+            }
+
+    def histograms(self):
+        """(name, labels, snapshot) samples for Metrics.render."""
+        with self._condition:
+            return [
+                ("inference_batch_size", {"model": self.name}, self.batch_sizes.snapshot()),
+                ("inference_batch_wait_seconds", {"model": self.name}, self.waits.snapshot()),
+            ]
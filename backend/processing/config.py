@@ -0,0 +1,73 @@
+"""
+Model and runtime settings read from ALICAS_* environment variables.
+
+Only the standard library is imported here, so the API process can read
+the settings without loading OpenCV or an inference runtime.
+"""
+import os
+from pathlib import Path
+
+# Define model paths - using absolute paths as per user environment (override with the env vars)
+SHUTTLECOCK_MODEL_PATH = os.environ.get("ALICAS_SHUTTLECOCK_MODEL", r"e:\Badminton\frontend\files\shuttlecock\best.pt")
+COURT_MODEL_PATH = os.environ.get("ALICAS_COURT_MODEL", r"e:\Badminton\frontend\files\line\best.pt")
+
+# Inference runtimes a detector can run on
+BACKENDS = ("pytorch", "onnx", "openvino")
+
+# Inference runtime: "pytorch" (the .pt weights), "onnx" or "openvino" (exported next to the .pt)
+DEFAULT_BACKEND = os.environ.get("ALICAS_BACKEND", "pytorch")
+# Use the INT8-quantized export of the onnx / openvino model
+DEFAULT_INT8 = os.environ.get("ALICAS_INT8", "0") == "1"
+# Threads per model for the inference runtime (0 = runtime default)
+DEFAULT_THREADS = int(os.environ.get("ALICAS_INFERENCE_THREADS", "0"))
+
+
+def exported_path(model_path, backend, int8=False):
+    """
+    Where export_model writes the `backend` version of a .pt model:
+    best.pt -> best.onnx / best_int8.onnx / best_openvino_model / best_int8_openvino_model.
+    The .pt path itself for pytorch.
+    """
+    model_path = Path(model_path)
+    if backend == "pytorch":
+        return model_path
+    stem = f"{model_path.stem}_int8" if int8 else model_path.stem
+    if backend == "onnx":
+        return model_path.with_name(f"{stem}.onnx")
+    if backend == "openvino":
+        return model_path.with_name(f"{stem}_openvino_model")
+    raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+
+# Video decoders a ProcessingEngine can read frames with
+DECODERS = ("auto", "opencv", "pyav", "ffmpeg")
+
+# "pyav" (PyAV), "ffmpeg" (an ffmpeg subprocess), "opencv" (cv2.VideoCapture) or
+# "auto" = the first of pyav / ffmpeg that is available, else opencv
+DEFAULT_DECODER = os.environ.get("ALICAS_DECODER", "auto")
+# Decoder threads (0 = one per core)
+DEFAULT_DECODE_THREADS = int(os.environ.get("ALICAS_DECODE_THREADS", "0"))
+# Scale frames down to this width while decoding (0 = native size). Results are in decoded pixels
+DEFAULT_DECODE_WIDTH = int(os.environ.get("ALICAS_DECODE_WIDTH", "0"))
+# ffmpeg executable for the "ffmpeg" decoder and encoder
+FFMPEG_BINARY = os.environ.get("ALICAS_FFMPEG", "ffmpeg")
+
+# Writers for the annotated output video
+ENCODERS = ("auto", "ffmpeg", "opencv")
+
+# "ffmpeg" (frames piped to an ffmpeg subprocess), "opencv" (cv2.VideoWriter, VP9)
+# or "auto" = ffmpeg if it is on the PATH, else opencv
+DEFAULT_ENCODER = os.environ.get("ALICAS_ENCODER", "auto")
+# Settings of the ffmpeg encoder: codec, x264/x265 preset, CRF (lower = better), encoder
+# threads (0 = ffmpeg's default) and whether to copy the source's audio track into the output
+DEFAULT_ENCODE_OPTIONS = {
+    "codec": os.environ.get("ALICAS_OUTPUT_CODEC", "libx264"),
+    "preset": os.environ.get("ALICAS_OUTPUT_PRESET", "veryfast"),
+    "crf": int(os.environ.get("ALICAS_OUTPUT_CRF", "23")),
+    "threads": int(os.environ.get("ALICAS_OUTPUT_THREADS", "0")),
+    "audio": os.environ.get("ALICAS_OUTPUT_AUDIO", "0") == "1",
+}
+
+# Cross-job micro-batching (processing.batching): the most frames per forward pass, and how long
+# the first waiting frame may be held back while a batch fills up
+DEFAULT_MICRO_BATCH_SIZE = int(os.environ.get("ALICAS_MICRO_BATCH_SIZE", "16"))
+DEFAULT_MICRO_BATCH_WAIT_MS = float(os.environ.get("ALICAS_MICRO_BATCH_WAIT_MS", "5"))
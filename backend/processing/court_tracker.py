@@ -0,0 +1,79 @@
+import cv2
+import numpy as np
+from .detectors import split_batch
+
+# Size of the grayscale thumbnail used for the scene-change check
+THUMBNAIL_SIZE = (64, 36)
+
+
+class CourtTracker:
+    """
+    Runs the court model on keyframes only and reuses the last court box in
+    between. A keyframe is taken every `keyframe_interval` frames, or earlier
+    when the mean absolute difference between a downsampled grayscale copy
+    of the frame and the last keyframe's exceeds `change_threshold` (a cut,
+    a pan or a zoom).
+    """
+
+    def __init__(self, court_detector, keyframe_interval=30, change_threshold=12.0):
+        self.court_detector = court_detector
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.change_threshold = change_threshold
+        self.reset()
+
+    def reset(self):
+        self.last_detections = []
+        self.keyframe_thumbnail = None
+        self.frames_since_keyframe = 0
+        self.keyframes = 0
+        self.frames = 0
+
+    def _thumbnail(self, frame):
+        small = cv2.resize(frame, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.float32)
+
+    def scene_changed(self, thumbnail):
+        """True if the thumbnail differs enough from the last keyframe's."""
+        if self.keyframe_thumbnail is None:
+            return True
+        return float(np.mean(np.abs(thumbnail - self.keyframe_thumbnail))) > self.change_threshold
+
+    def detect_batch(self, frames, batch_size):
+        """
+        Returns (court detections per frame, scene-change flag per frame).
+        Only keyframes go through the court model, in one detect_batch call.
+        """
+        keyframe_idx = []
+        changed = []
+        for i, frame in enumerate(frames):
+            thumbnail = self._thumbnail(frame)
+            cut = self.scene_changed(thumbnail)
+            # Until a court has been seen, retry on the first frame of every batch
+            due = (self.frames_since_keyframe >= self.keyframe_interval
+                   or (not self.last_detections and not keyframe_idx))
+            if cut or due:
+                keyframe_idx.append(i)
+                self.keyframe_thumbnail = thumbnail
+                self.frames_since_keyframe = 0
+            else:
+                self.frames_since_keyframe += 1
+            changed.append(cut and self.keyframes + len(keyframe_idx) > 1)
+
+        keyframe_dets = []
+        if keyframe_idx:
+            batch = self.court_detector.detect_batch([frames[i] for i in keyframe_idx], batch_size)
+            keyframe_dets = split_batch(batch, len(keyframe_idx))
+
+        per_frame = []
+        lookup = dict(zip(keyframe_idx, keyframe_dets))
+        for i in range(len(frames)):
+            if i in lookup:
+                self.last_detections = lookup[i]
+            per_frame.append(self.last_detections)
+
+        self.keyframes += len(keyframe_idx)
+        self.frames += len(frames)
+        return per_frame, changed
+
+    def stats(self):
+        return {"frames": self.frames, "keyframes": self.keyframes}
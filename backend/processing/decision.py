@@ -1,11 +1,22 @@
 import numpy as np
-from collections import deque
+from .trajectory import TrajectoryBuffer, is_bounce, detect_bounces
+from .tracker import ShuttleTracker
+
+# Number of shuttle positions kept for bounce detection
+HISTORY_SIZE = 7
+# Positions needed before a bounce can be detected
+MIN_HISTORY = 5
+# Frames after a bounce during which no new bounce is reported
+COOLDOWN_FRAMES = 30
 
 class DecisionEngine:
     def __init__(self):
-        # History stores tuples of (frame_number, (x, y))
-        self.history = deque(maxlen=7)
+        # History is a ring buffer of (frame_number, x, y) rows; indexing gives (frame_number, (x, y))
+        self.history = TrajectoryBuffer(HISTORY_SIZE)
         self.cooldown = 0
+        # Follows every detected shuttle; only the in-play track goes into the history
+        self.tracker = ShuttleTracker()
+        self.track_id = None
 
     def is_inside(self, point, box):
         """
@@ -25,67 +36,37 @@ class DecisionEngine:
         """
         if self.cooldown > 0:
             self.cooldown -= 1
-            
-        if not shuttlecock_detections:
+
+        # The tracker sees every frame, with or without detections, so tracks age correctly
+        track = self.tracker.update(frame_num, shuttlecock_detections)
+        if track is None:
             return None
 
-        # Track the first detected shuttlecock
-        s_box = shuttlecock_detections[0]
-        s_center = ((s_box[0] + s_box[2]) / 2, (s_box[1] + s_box[3]) / 2)
-        
-        self.history.append((frame_num, s_center))
+        # A different shuttle is in play now: its path starts a new trajectory
+        if track["id"] != self.track_id:
+            self.history.clear()
+            self.track_id = track["id"]
+
+        self.history.append((frame_num, track["center"]))
         
         # Need enough history to detect a curve
-        if len(self.history) < 5:
+        if len(self.history) < MIN_HISTORY:
             return None
             
         if self.cooldown > 0:
             return None
 
         # Bounce detection logic:
-        # We look for a local maximum in Y (lowest point on screen)
-        y_coords = [p[1][1] for p in self.history]
+        # We look for a local maximum in Y (lowest point on screen) at the middle of the window
+        mid_idx = len(self.history) // 2
         
-        # Check if the middle point is the lowest (max Y)
-        mid_idx = len(y_coords) // 2
-        mid_y = y_coords[mid_idx]
-        
-        # Simple check: mid point is lower than neighbors
-        is_local_max = all(mid_y >= y for y in y_coords) and (mid_y > y_coords[0] + 2) and (mid_y > y_coords[-1] + 2)
-        
-        if is_local_max:
+        if is_bounce(self.history.ys):
             # Bounce detected at the middle frame of our history
             bounce_frame, bounce_point = self.history[mid_idx]
             
-            # Determine IN/OUT using LineDetector if available
-            is_in = False
+            is_in = self.classify(bounce_point, court_detections, mode, shot_type, line_detector)
             
-            if line_detector and line_detector.court_lines:
-                # Use precise line detection
-                is_in = line_detector.is_point_in_bounds(bounce_point, mode=mode, shot_type=shot_type)
-            elif court_detections:
-                # Fallback to old percentage-based method if line detection fails
-                for c_box in court_detections:
-                    box = c_box[:4]
-                    x1, y1, x2, y2 = box
-                    
-                    # Adjust for Singles: Narrow the court width
-                    if mode == "singles":
-                        width = x2 - x1
-                        margin = width * 0.075
-                        box = [x1 + margin, y1, x2 - margin, y2]
-                    
-                    # Adjust for Doubles Serve: Short Service Line
-                    if mode == "doubles" and shot_type == "serve":
-                        height = y2 - y1
-                        margin_h = height * 0.028
-                        box = [box[0], y1 + margin_h, box[2], y2 - margin_h]
-
-                    if self.is_inside(bounce_point, box):
-                        is_in = True
-                        break
-            
-            self.cooldown = 30 # Prevent multiple detections for the same bounce
+            self.cooldown = COOLDOWN_FRAMES # Prevent multiple detections for the same bounce
             
             return {
                 "decision": "IN" if is_in else "OUT",
@@ -94,3 +75,57 @@ class DecisionEngine:
             }
             
         return None
+
+    def classify(self, bounce_point, court_detections, mode="doubles", shot_type="rally", line_detector=None):
+        """
+        Returns True if the bounce point is IN.
+        """
+        # Determine IN/OUT using LineDetector if available
+        is_in = False
+        
+        if line_detector and line_detector.has_court():
+            # Use precise line detection
+            is_in = line_detector.is_point_in_bounds(bounce_point, mode=mode, shot_type=shot_type)
+        elif court_detections:
+            # Fallback to old percentage-based method if line detection fails
+            for c_box in court_detections:
+                box = c_box[:4]
+                x1, y1, x2, y2 = box
+                
+                # Adjust for Singles: Narrow the court width
+                if mode == "singles":
+                    width = x2 - x1
+                    margin = width * 0.075
+                    box = [x1 + margin, y1, x2 - margin, y2]
+                
+                # Adjust for Doubles Serve: Short Service Line
+                if mode == "doubles" and shot_type == "serve":
+                    height = y2 - y1
+                    margin_h = height * 0.028
+                    box = [box[0], y1 + margin_h, box[2], y2 - margin_h]
+
+                if self.is_inside(bounce_point, box):
+                    is_in = True
+                    break
+        
+        return is_in
+
+    def evaluate_track(self, track, court_detections=None, mode="doubles", shot_type="rally", line_detector=None):
+        """
+        Offline counterpart of evaluate for a whole track.
+        track: (n, 3) array of [frame_number, x, y] shuttle centers, one row per frame with a detection.
+        Finds all bounces in one vectorized pass with the same window and cooldown rules as
+        calling evaluate on every frame, and returns the same decision dictionaries.
+        Does not touch this engine's history or cooldown.
+        """
+        bounces = detect_bounces(track, history_size=HISTORY_SIZE, min_history=MIN_HISTORY,
+                                 cooldown=COOLDOWN_FRAMES)
+        decisions = []
+        for bounce_frame, x, y, _ in bounces:
+            is_in = self.classify((x, y), court_detections, mode, shot_type, line_detector)
+            decisions.append({
+                "decision": "IN" if is_in else "OUT",
+                "point": (float(x), float(y)),
+                "frame": int(bounce_frame)
+            })
+        return decisions
@@ -1,32 +1,94 @@
-from ultralytics import YOLO
+import time
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
 from pathlib import Path
+from .backends import load_backend
+from .config import SHUTTLECOCK_MODEL_PATH, COURT_MODEL_PATH, DEFAULT_BACKEND, DEFAULT_INT8, DEFAULT_THREADS
 
-# Define model paths - using absolute paths as per user environment
-SHUTTLECOCK_MODEL_PATH = r"e:\Badminton\frontend\files\shuttlecock\best.pt"
-COURT_MODEL_PATH = r"e:\Badminton\frontend\files\line\best.pt"
+# Number of frames sent through the model in one forward pass by detect_batch
+DEFAULT_BATCH_SIZE = 8
 
-class ShuttlecockDetector:
-    def __init__(self, model_path=SHUTTLECOCK_MODEL_PATH):
-        self.model = YOLO(model_path)
+
+class _YOLODetector:
+    def __init__(self, model_path, backend=None, threads=None, int8=None):
+        self.backend_name = backend or DEFAULT_BACKEND
+        self.model = load_backend(model_path, self.backend_name,
+                                  threads=DEFAULT_THREADS if threads is None else threads,
+                                  int8=DEFAULT_INT8 if int8 is None else int8)
+
+    def _predict(self, frames):
+        """
+        Runs the model on a list of frames in one forward pass.
+        Returns one (n, 6) array per frame.
+        """
+        return self.model.predict(frames)
+
+    def warmup(self, batch_size=1, frame_size=(720, 1280)):
+        """
+        Runs the model once on blank frames so the first real batch does not
+        pay for lazy initialisation, graph compilation and buffer allocation.
+        """
+        self._predict([np.zeros((*frame_size, 3), dtype=np.uint8)] * max(1, batch_size))
+
+    def detect(self, frame):
+        """
+        Returns a list of bounding boxes [x1, y1, x2, y2, conf, cls].
+        """
+        return list(self._predict([frame])[0])
+
+    def detect_batch(self, frames, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Runs the model on several frames, batch_size frames per forward pass.
+        Returns a single (total, 7) float32 array whose rows are
+        [frame_idx, x1, y1, x2, y2, conf, cls], where frame_idx is the
+        position of the frame in `frames`.
+        """
+        frames = list(frames)
+        chunks = []
+        for start in range(0, len(frames), max(1, batch_size)):
+            per_frame = self._predict(frames[start:start + batch_size])
+            for offset, dets in enumerate(per_frame):
+                if len(dets):
+                    idx = np.full((len(dets), 1), start + offset, dtype=np.float32)
+                    chunks.append(np.concatenate((idx, dets), axis=1))
+        if not chunks:
+            return np.empty((0, 7), dtype=np.float32)
+        return np.concatenate(chunks, axis=0)
+
+
+def split_batch(batch_dets, num_frames):
+    """
+    Splits a (total, 7) array from detect_batch into a list with one
+    list of [x1, y1, x2, y2, conf, cls] boxes per frame.
+    """
+    per_frame = [[] for _ in range(num_frames)]
+    if len(batch_dets) == 0:
+        return per_frame
+    frame_idx = batch_dets[:, 0].astype(np.int64)
+    order = np.argsort(frame_idx, kind="stable")
+    bounds = np.searchsorted(frame_idx[order], np.arange(num_frames + 1))
+    boxes = batch_dets[order, 1:]
+    for i in range(num_frames):
+        per_frame[i] = list(boxes[bounds[i]:bounds[i + 1]])
+    return per_frame
+
+
+class ShuttlecockDetector(_YOLODetector):
+    def __init__(self, model_path=SHUTTLECOCK_MODEL_PATH, backend=None, threads=None, int8=None):
+        super().__init__(model_path, backend, threads, int8)
 
     def detect(self, frame):
         """
         Detects shuttlecock in the frame.
         Returns a list of bounding boxes [x1, y1, x2, y2, conf, cls].
         """
-        results = self.model(frame, verbose=False)
-        detections = []
-        for result in results:
-            boxes = result.boxes.cpu().numpy()
-            for box in boxes:
-                detections.append(np.concatenate((box.xyxy[0], [box.conf[0]], [box.cls[0]])))
-        return detections
+        return super().detect(frame)
+
 
-class CourtDetector:
-    def __init__(self, model_path=COURT_MODEL_PATH):
-        self.model = YOLO(model_path)
+class CourtDetector(_YOLODetector):
+    def __init__(self, model_path=COURT_MODEL_PATH, backend=None, threads=None, int8=None):
+        super().__init__(model_path, backend, threads, int8)
 
     def detect(self, frame):
         """
@@ -34,10 +96,22 @@ class CourtDetector:
         Returns a list of bounding boxes or masks depending on the model type.
         Assuming the model detects the 'court' as a bounding box or polygon.
         """
-        results = self.model(frame, verbose=False)
-        detections = []
-        for result in results:
-            boxes = result.boxes.cpu().numpy()
-            for box in boxes:
-                detections.append(np.concatenate((box.xyxy[0], [box.conf[0]], [box.cls[0]])))
-        return detections
+        return super().detect(frame)
+
+
+def load_detectors(**kwargs):
+    """
+    Loads the shuttlecock and court models in parallel; kwargs go to both
+    constructors. Returns (shuttlecock_detector, court_detector, load_seconds),
+    where load_seconds maps each model to its load time.
+    """
+    def timed(cls):
+        started = time.perf_counter()
+        detector = cls(**kwargs)
+        return detector, round(time.perf_counter() - started, 3)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        shuttlecock = pool.submit(timed, ShuttlecockDetector)
+        court = pool.submit(timed, CourtDetector)
+        (shuttlecock_detector, shuttlecock_s), (court_detector, court_s) = shuttlecock.result(), court.result()
+    return shuttlecock_detector, court_detector, {"shuttlecock": shuttlecock_s, "court": court_s}
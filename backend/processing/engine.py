@@ -1,97 +1,417 @@
 import cv2
+import threading
+import time
 from pathlib import Path
-from .detectors import ShuttlecockDetector, CourtDetector
-from .decision import DecisionEngine
+from .detectors import DEFAULT_BATCH_SIZE, load_detectors, split_batch
+from .decision import DecisionEngine, HISTORY_SIZE, COOLDOWN_FRAMES
 from .utils import draw_detections
 from .line_detector import LineDetector
+from .pipeline import Pipeline
+from .court_tracker import CourtTracker
+from .roi import ROIShuttlecockDetector
+from .tiling import TiledShuttlecockDetector
+from .sampling import AdaptiveSampler
+from .metrics import Metrics
+from .config import DEFAULT_DECODER, DEFAULT_DECODE_THREADS, DEFAULT_DECODE_WIDTH, DEFAULT_ENCODER
+from .video_source import open_source
+from .video_writer import open_writer
+from .sidecar import DetectionSidecar
+from .batching import BatchingDetector
 
-class ProcessingEngine:
-    def __init__(self):
-        self.shuttlecock_detector = ShuttlecockDetector()
-        self.court_detector = CourtDetector()
+# Frames replayed before a frame range so the trajectory window and the bounce
+# cooldown are in the same state as in a run from the start of the video
+DEFAULT_WARMUP_FRAMES = HISTORY_SIZE + COOLDOWN_FRAMES
+
+
+class ProcessingCancelled(Exception):
+    """Raised by a progress callback to stop process_video early."""
+
+
+class JobState:
+    """
+    What one process_video call learns about its video: the trajectory and
+    cooldown in DecisionEngine, the court calibration in LineDetector, and
+    the court tracking, ROI and sampling state. Created for every call, so
+    nothing carries over from one video to the next; the models are shared
+    through the engine.
+    """
+
+    def __init__(self, engine):
         self.decision_engine = DecisionEngine()
         self.line_detector = LineDetector()
+        self.shuttle_roi = ROIShuttlecockDetector(engine.shuttlecock_detector) if engine.shuttle_roi else None
+        self.shuttle_tiles = TiledShuttlecockDetector(engine.shuttlecock_detector) if engine.shuttle_tiles else None
+        self.court_tracker = (CourtTracker(engine.court_detector, engine.court_keyframe_interval)
+                              if engine.court_keyframe_interval else None)
+        self.sampler = AdaptiveSampler() if engine.adaptive_sampling else None
+
+
+class ProcessingEngine:
+    """
+    The loaded models and processing settings. Per-video state lives in a
+    JobState, so one engine can process several videos at once on different
+    threads; their forward passes take turns on the models, or with
+    micro_batching are merged into shared batches (see BatchingDetector).
+    """
+
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, queue_size=4, court_keyframe_interval=30, shuttle_roi=False,
+                 adaptive_sampling=False, backend=None, threads=None, int8=None, detectors=None, decoder=None,
+                 decode_threads=None, decode_width=None, encoder=None, encode_options=None, micro_batching=False,
+                 micro_batch_size=None, micro_batch_wait_ms=None, shuttle_tiles=False):
+        # backend / threads / int8 select the inference runtime (defaults from the ALICAS_* env vars).
+        # Both models load in parallel; load_seconds records how long each took.
+        # detectors: a ready (shuttlecock_detector, court_detector) pair to use instead, e.g. benchmark stubs
+        if detectors is not None:
+            self.shuttlecock_detector, self.court_detector = detectors
+            self.load_seconds = {}
+        else:
+            self.shuttlecock_detector, self.court_detector, self.load_seconds = load_detectors(
+                backend=backend, threads=threads, int8=int8)
+        # micro_batching: jobs running on different threads submit their frames to one inference thread
+        # per model, which merges them into batches of up to micro_batch_size frames, waiting at most
+        # micro_batch_wait_ms (defaults from ALICAS_MICRO_BATCH_SIZE / ALICAS_MICRO_BATCH_WAIT_MS)
+        self.batchers = []
+        if micro_batching:
+            self.shuttlecock_detector = BatchingDetector(self.shuttlecock_detector, micro_batch_size,
+                                                         micro_batch_wait_ms, name="shuttlecock")
+            self.court_detector = BatchingDetector(self.court_detector, micro_batch_size, micro_batch_wait_ms,
+                                                   name="court")
+            self.batchers = [self.shuttlecock_detector, self.court_detector]
+        # Held while a batch goes through the models; the runtimes are not safe to call from several
+        # threads. Not needed with micro_batching, where only the batching threads call the models
+        self.inference_lock = None if micro_batching else threading.Lock()
+        # ROI mode: run the shuttle model on a crop around the predicted position
+        self.shuttle_roi = shuttle_roi
+        # Tiled mode: run the shuttle model on full-resolution tiles that have motion in them, for
+        # high-resolution footage; replaces ROI mode when both are set
+        self.shuttle_tiles = shuttle_tiles
+        # Court tracking: run the court model on keyframes only (0 = every frame)
+        self.court_keyframe_interval = court_keyframe_interval
+        # Adaptive sampling: between rallies only every few frames go through the models
+        self.adaptive_sampling = adaptive_sampling
+        # Video decoding (defaults from ALICAS_DECODER / ALICAS_DECODE_THREADS / ALICAS_DECODE_WIDTH).
+        # With a decode_width, frames are scaled while decoding and results are in the scaled pixels
+        self.decoder = decoder or DEFAULT_DECODER
+        self.decode_threads = DEFAULT_DECODE_THREADS if decode_threads is None else decode_threads
+        self.decode_width = DEFAULT_DECODE_WIDTH if decode_width is None else decode_width
+        # Output video writer and its codec / preset / crf / threads / audio (defaults from ALICAS_ENCODER
+        # and ALICAS_OUTPUT_*); encode_options may override a subset
+        self.encoder = encoder or DEFAULT_ENCODER
+        self.encode_options = encode_options
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+
+    def warmup(self):
+        """
+        Runs both models once on a blank batch of batch_size frames.
+        Returns the time taken in seconds.
+        """
+        started = time.perf_counter()
+        self.shuttlecock_detector.warmup(self.batch_size)
+        self.court_detector.warmup(self.batch_size)
+        return round(time.perf_counter() - started, 3)
 
-    def process_video(self, video_path, output_path=None, mode="doubles", shot_type="rally"):
+    def process_video(self, video_path, output_path=None, mode="doubles", shot_type="rally", batch_size=None,
+                      queue_size=None, stats=None, progress=None, start_frame=0, end_frame=None, warmup_frames=0,
+                      metrics=None, sidecar_path=None):
         """
         Processes the video, runs detection, and generates an output video with visualizations.
         Returns a summary of results.
+        Without an output_path nothing is drawn or encoded (decision-only mode); annotated
+        clips around single decisions can be rendered later with render_clip.
         mode: "singles" or "doubles"
         shot_type: "serve" or "rally"
+        batch_size: frames per detector forward pass (defaults to the engine's batch_size)
+        queue_size: batches buffered between pipeline stages (defaults to the engine's queue_size)
+        stats: optional dict, filled with per-stage busy/wait times and throughput
+        progress: optional callable(frames_done, total_frames), called after every batch;
+                  it may raise ProcessingCancelled to stop processing
+        start_frame, end_frame: process only frames [start_frame, end_frame) (0-based, end exclusive);
+                  frame numbers in the results stay relative to the start of the video
+        warmup_frames: frames before start_frame that are run to build up trajectory and cooldown
+                  state, but are not written and produce no decisions
+        metrics: optional Metrics that receives per-stage timings (decode, inference_lock_wait,
+                  shuttle_model, court_model, line_detection, decision, draw, encode), frame/detection/decision counters and
+                  pipeline queue depths; stats["timings"] gets its summary
+        sidecar_path: optional path for a detection sidecar (see processing.sidecar): the boxes
+                  of every processed frame, the court calibrations and the decisions, so overlays
+                  can be drawn on the original video without rendering it
+
+        Decoding, inference, decisions and encoding run as a pipeline on
+        separate threads joined by bounded queues; decisions are made in
+        frame order, so the output matches a sequential run frame for frame.
+        Every call starts from a fresh JobState.
         """
-        cap = cv2.VideoCapture(str(video_path))
-        if not cap.isOpened():
-            raise ValueError(f"Could not open video: {video_path}")
+        batch_size = max(1, batch_size or self.batch_size)
+        queue_size = max(1, queue_size or self.queue_size)
+        metrics = metrics if metrics is not None else Metrics()
+
+        source = open_source(video_path, self.decoder, self.decode_threads, self.decode_width)
+        width, height = source.width, source.height
+        fps = source.fps
+        total_frames = source.frame_count
+
+        begin = max(0, start_frame - warmup_frames)
+        if begin:
+            source.seek(begin)
+        end = min(end_frame, total_frames) if end_frame is not None and total_frames > 0 else end_frame
+        limit = end - begin if end is not None else None
+        if limit is not None:
+            total_frames = limit
+        elif begin:
+            total_frames = max(0, total_frames - begin)
 
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        
+        out = None
         if output_path:
-            # Use 'vp09' (VP9) as fallback for 'avc1' issues
-            fourcc = cv2.VideoWriter_fourcc(*'vp09')
-            out = cv2.VideoWriter(str(output_path), fourcc, fps, (width, height))
+            # Audio, if copied, covers the written frames [start_frame, end)
+            audio_start = start_frame / fps if fps else 0.0
+            audio_duration = (end - start_frame) / fps if fps and end is not None else None
+            try:
+                out = open_writer(output_path, fps, (width, height), self.encoder, self.encode_options,
+                                  audio_from=video_path, audio_start=audio_start, audio_duration=audio_duration)
+            except Exception:
+                source.close()
+                raise
 
-        frame_count = 0
+        job = JobState(self)
         results_summary = []
-        active_decision = None
-        decision_timer = 0
-        lines_detected = False
-
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            frame_count += 1
-            
+        state = {
+            "job": job,
+            # Frame numbers are 1-based; frames numbered <= record_from are warm-up only
+            "frame_count": begin,
+            "record_from": start_frame,
+            "active_decision": None,
+            "decision_timer": 0,
+            "lines_detected": False,
+            "render": out is not None,
+            "metrics": metrics,
+            "sidecar": DetectionSidecar(fps, (width, height)) if sidecar_path else None,
+        }
+
+        def decode():
+            batches = source.read_batches(batch_size, limit)
+            while True:
+                with metrics.timed("decode"):
+                    frames = next(batches, None)
+                if frames is None:
+                    return
+                yield frames
+
+        def detect(frames, frame_indices):
+            # One forward pass per model for the whole batch
+            lock = self.inference_lock
+            if lock is not None:
+                with metrics.timed("inference_lock_wait"):
+                    lock.acquire()
+            try:
+                with metrics.timed("shuttle_model"):
+                    if job.shuttle_tiles:
+                        shuttlecock_batch = job.shuttle_tiles.detect_batch(frames, batch_size, frame_indices)
+                    elif job.shuttle_roi:
+                        shuttlecock_batch = job.shuttle_roi.detect_batch(frames, batch_size, frame_indices)
+                    else:
+                        shuttlecock_batch = split_batch(self.shuttlecock_detector.detect_batch(frames, batch_size),
+                                                        len(frames))
+                with metrics.timed("court_model"):
+                    if job.court_tracker:
+                        court_batch, scene_changes = job.court_tracker.detect_batch(frames, batch_size)
+                    else:
+                        court_batch = split_batch(self.court_detector.detect_batch(frames, batch_size),
+                                                  len(frames))
+                        scene_changes = [False] * len(frames)
+            finally:
+                if lock is not None:
+                    lock.release()
+            metrics.count("frames_inferred", len(frames))
+            metrics.count("detections", sum(map(len, shuttlecock_batch)), model="shuttlecock")
+            metrics.count("detections", sum(map(len, court_batch)), model="court")
+            return shuttlecock_batch, court_batch, scene_changes
+
+        # 0-based video position of the next batch and the last court detections (inference stage only)
+        sampling = {"next_index": begin, "court_dets": []}
+
+        def infer(frames):
             # 1. Detect
-            shuttlecock_dets = self.shuttlecock_detector.detect(frame)
-            court_dets = self.court_detector.detect(frame)
-            
-            # 2. Detect lines once when we have court detection
-            if not lines_detected and court_dets:
-                court_box = court_dets[0][:4]
-                self.line_detector.detect_lines(frame, court_box)
-                lines_detected = True
-            
-            # 3. Decide
-            # Pass frame_count for trajectory tracking and line_detector for precise boundaries
-            decision_event = self.decision_engine.evaluate(
-                shuttlecock_dets, 
-                court_dets, 
-                frame_count, 
-                mode=mode, 
+            first_index = sampling["next_index"]
+            sampling["next_index"] += len(frames)
+            if not job.sampler:
+                return (frames, *detect(frames, list(range(first_index, sampling["next_index"]))))
+
+            # Skipped frames get no shuttle detections and keep the last court box,
+            # so they still count towards the cooldown and keep their frame numbers
+            with metrics.timed("sampling"):
+                selected = job.sampler.select(frames, first_index)
+            shuttlecock_batch = [[] for _ in frames]
+            court_batch = [None] * len(frames)
+            scene_changes = [False] * len(frames)
+            if selected:
+                indices = [first_index + i for i in selected]
+                results = detect([frames[i] for i in selected], indices)
+                for i, frame_index, shuttlecock_dets, court_dets, changed in zip(selected, indices, *results):
+                    shuttlecock_batch[i] = shuttlecock_dets
+                    court_batch[i] = court_dets
+                    scene_changes[i] = changed
+                    job.sampler.observe(frame_index, shuttlecock_dets)
+            for i in range(len(frames)):
+                if court_batch[i] is None:
+                    court_batch[i] = sampling["court_dets"]
+                sampling["court_dets"] = court_batch[i]
+            return frames, shuttlecock_batch, court_batch, scene_changes
+
+        def decide(batch):
+            frames, shuttlecock_batch, court_batch, scene_changes = batch
+            annotated = []
+            for frame, shuttlecock_dets, court_dets, scene_changed in zip(frames, shuttlecock_batch, court_batch,
+                                                                          scene_changes):
+                if scene_changed:
+                    # The camera moved: recalibrate the lines from the new court box
+                    state["lines_detected"] = False
+                frame = self._decide_frame(frame, shuttlecock_dets, court_dets, state, results_summary,
+                                           mode, shot_type)
+                if state["sidecar"] is not None and state["frame_count"] > state["record_from"]:
+                    state["sidecar"].add_frame(state["frame_count"], shuttlecock_dets, court_dets)
+                if state["render"] and state["frame_count"] > state["record_from"]:
+                    annotated.append(frame)
+                else:
+                    # Done with this frame: its buffer goes back to the decoder
+                    source.release(frame)
+            metrics.count("frames", len(frames))
+            for name, depth in pipeline.queue_depths().items():
+                metrics.set_gauge("pipeline_queue_depth", depth, stage=name)
+            if progress:
+                progress(state["frame_count"] - begin, total_frames)
+            return annotated
+
+        def encode(frames):
+            with metrics.timed("encode"):
+                for frame in frames:
+                    out.write(frame)
+                    source.release(frame)
+
+        pipeline = Pipeline(queue_size=queue_size)
+        pipeline.source("decode", decode())
+        pipeline.stage("inference", infer)
+        pipeline.stage("decision", decide)
+        if out is not None:
+            pipeline.stage("encode", encode)
+
+        try:
+            run_stats = pipeline.run()
+        except BaseException:
+            if out is not None:
+                out.abort()
+            raise
+        finally:
+            source.close()
+        if out is not None:
+            with metrics.timed("encode_flush"):
+                out.release()
+        if state["sidecar"] is not None:
+            state["sidecar"].save(sidecar_path, results_summary, mode=mode, shot_type=shot_type)
+
+        if stats is not None:
+            frames_done = state["frame_count"] - begin
+            stats.update(run_stats)
+            stats["frames"] = frames_done
+            stats["fps"] = round(frames_done / run_stats["wall_s"], 2) if run_stats["wall_s"] else 0.0
+            stats["decoding"] = source.stats()
+            if out is not None:
+                stats["encoding"] = out.stats()
+            stats["shuttle_tracking"] = job.decision_engine.tracker.stats()
+            if job.court_tracker:
+                stats["court_tracking"] = job.court_tracker.stats()
+            if job.shuttle_tiles:
+                stats["shuttle_tiles"] = job.shuttle_tiles.stats()
+            elif job.shuttle_roi:
+                stats["shuttle_roi"] = job.shuttle_roi.stats()
+            if job.sampler:
+                stats["adaptive_sampling"] = job.sampler.stats()
+            if self.batchers:
+                # Totals of the shared batching threads, including other jobs' frames
+                stats["inference_batching"] = {batcher.name: batcher.stats() for batcher in self.batchers}
+            stats["timings"] = metrics.summary()
+
+        return results_summary
+
+    def _decide_frame(self, frame, shuttlecock_dets, court_dets, state, results_summary, mode, shot_type):
+        """
+        Runs line detection, the bounce decision and the overlay drawing for one frame.
+        Must be called in frame order.
+        """
+        state["frame_count"] += 1
+        frame_count = state["frame_count"]
+
+        metrics = state["metrics"]
+        job = state["job"]
+
+        # 2. Detect lines once when we have court detection
+        if not state["lines_detected"] and court_dets:
+            court_box = court_dets[0][:4]
+            with metrics.timed("line_detection"):
+                job.line_detector.detect_lines(frame, court_box)
+            state["lines_detected"] = True
+            if state["sidecar"] is not None:
+                state["sidecar"].add_court(frame_count, job.line_detector.calibration())
+
+        # 3. Decide
+        # Pass frame_count for trajectory tracking and line_detector for precise boundaries
+        with metrics.timed("decision"):
+            decision_event = job.decision_engine.evaluate(
+                shuttlecock_dets,
+                court_dets,
+                frame_count,
+                mode=mode,
                 shot_type=shot_type,
-                line_detector=self.line_detector if lines_detected else None
+                line_detector=job.line_detector if state["lines_detected"] else None
             )
-            
-            if decision_event:
-                active_decision = decision_event
-                decision_timer = 60 # Show for 60 frames (approx 2 seconds)
+
+        if decision_event:
+            state["active_decision"] = decision_event
+            state["decision_timer"] = 60 # Show for 60 frames (approx 2 seconds)
+            if frame_count > state["record_from"]:
                 results_summary.append(decision_event)
+                metrics.count("decisions", decision=decision_event["decision"])
 
-            # 3. Visualize
-            frame = draw_detections(frame, shuttlecock_dets, color=(0, 255, 255), label_prefix="Shuttle")
-            frame = draw_detections(frame, court_dets, color=(0, 255, 0), label_prefix="Court")
-            
-            if active_decision and decision_timer > 0:
-                # Draw impact point
-                center = active_decision["point"]
-                cv2.circle(frame, (int(center[0]), int(center[1])), 10, (0, 0, 255), -1)
-                
-                # Draw decision text
-                text = f"{active_decision['decision']}"
-                cv2.putText(frame, text, (int(center[0]) + 15, int(center[1])), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-                
-                decision_timer -= 1
-
-            if output_path:
-                out.write(frame)
+        if not state["render"]:
+            return frame
 
+        # 3. Visualize
+        draw_started = time.perf_counter()
+        frame = draw_detections(frame, shuttlecock_dets, color=(0, 255, 255), label_prefix="Shuttle")
+        frame = draw_detections(frame, court_dets, color=(0, 255, 0), label_prefix="Court")
+
+        active_decision = state["active_decision"]
+        if active_decision and state["decision_timer"] > 0:
+            # Draw impact point
+            center = active_decision["point"]
+            cv2.circle(frame, (int(center[0]), int(center[1])), 10, (0, 0, 255), -1)
+
+            # Draw decision text
+            text = f"{active_decision['decision']}"
+            cv2.putText(frame, text, (int(center[0]) + 15, int(center[1])),
+                       cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+
+            state["decision_timer"] -= 1
+
+        metrics.observe("draw", time.perf_counter() - draw_started)
+        return frame
+
+    def render_clip(self, video_path, output_path, decision_frame, mode="doubles", shot_type="rally",
+                    seconds_before=1.5, seconds_after=1.5):
+        """
+        Renders an annotated clip around one decision by seeking into the source video.
+        decision_frame is the 1-based "frame" of a results_summary entry. Trajectory and
+        cooldown state are warmed up first, so the overlay matches a full rendering.
+        Returns the decisions made inside the clip.
+        """
+        cap = cv2.VideoCapture(str(video_path))
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video: {video_path}")
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30
         cap.release()
-        if output_path:
-            out.release()
 
-        return results_summary
+        start = max(0, int(decision_frame) - 1 - round(seconds_before * fps))
+        end = int(decision_frame) + round(seconds_after * fps)
+        return self.process_video(video_path, output_path, mode=mode, shot_type=shot_type,
+                                  start_frame=start, end_frame=end, warmup_frames=DEFAULT_WARMUP_FRAMES)
@@ -2,41 +2,83 @@ import cv2
 import numpy as np
 from collections import defaultdict
 
+# Standard badminton court in metres, origin at a doubles corner,
+# x across the court (doubles sideline to doubles sideline),
+# y along it (baseline to baseline)
+COURT_WIDTH = 6.10
+COURT_LENGTH = 13.40
+SINGLES_MARGIN = 0.46            # doubles sideline to singles sideline
+DOUBLES_LONG_SERVICE = 0.76      # baseline to doubles long service line
+SHORT_SERVICE = 1.98             # net to short service line
+NET_Y = COURT_LENGTH / 2
+
+# In-bounds area in court coordinates for each (mode, shot_type), as (x1, y1, x2, y2) rectangles.
+# A serve must land in a service court: beyond the short service line, and for doubles short of the
+# doubles long service line. The server's side is not known, so both halves count
+COURT_REGIONS = {
+    ("doubles", "rally"): ((0.0, 0.0, COURT_WIDTH, COURT_LENGTH),),
+    ("doubles", "serve"): ((0.0, DOUBLES_LONG_SERVICE, COURT_WIDTH, NET_Y - SHORT_SERVICE),
+                           (0.0, NET_Y + SHORT_SERVICE, COURT_WIDTH, COURT_LENGTH - DOUBLES_LONG_SERVICE)),
+    ("singles", "rally"): ((SINGLES_MARGIN, 0.0, COURT_WIDTH - SINGLES_MARGIN, COURT_LENGTH),),
+    ("singles", "serve"): ((SINGLES_MARGIN, 0.0, COURT_WIDTH - SINGLES_MARGIN, NET_Y - SHORT_SERVICE),
+                           (SINGLES_MARGIN, NET_Y + SHORT_SERVICE, COURT_WIDTH - SINGLES_MARGIN, COURT_LENGTH)),
+}
+
+
 class LineDetector:
     def __init__(self):
         self.detected_lines = None
+        self.reset()
+
+    def reset(self):
         self.court_lines = {
             'inner_sidelines': [],  # Singles sidelines
             'outer_sidelines': [],  # Doubles sidelines
             'service_lines': [],    # Short and long service lines
             'baselines': []         # Back boundaries
         }
-    
+        # Fitted lines in full-frame coordinates: sidelines as x = a*y + b, others as y = a*x + b
+        self.line_fits = {key: [] for key in self.court_lines}
+        # Maps court coordinates (metres) to image pixels
+        self.homography = None
+        # uint8 lookup mask per (mode, shot_type): 1 where a bounce is IN
+        self.masks = {}
+
+    def has_court(self):
+        """True once a court model has been fitted and the lookup masks built."""
+        return bool(self.masks)
+
     def detect_lines(self, frame, court_box):
         """
-        Detect white court lines within the court bounding box.
-        
+        Detect white court lines within the court bounding box, fit a
+        homography from the outer sidelines and baselines to the standard
+        court, and build the IN/OUT lookup masks.
+
         Args:
             frame: Input video frame
             court_box: [x1, y1, x2, y2] bounding box of the court
-            
+
         Returns:
             Dictionary of classified lines
         """
+        self.reset()
         x1, y1, x2, y2 = map(int, court_box[:4])
-        
+        x1, y1 = max(0, x1), max(0, y1)
+
         # Extract court region
         court_region = frame[y1:y2, x1:x2]
-        
+        if court_region.size == 0:
+            return self.court_lines
+
         # Preprocessing
         gray = cv2.cvtColor(court_region, cv2.COLOR_BGR2GRAY)
-        
+
         # Apply bilateral filter to reduce noise while keeping edges sharp
         blurred = cv2.bilateralFilter(gray, 9, 75, 75)
-        
+
         # Edge detection
         edges = cv2.Canny(blurred, 50, 150, apertureSize=3)
-        
+
         # Hough Line Transform
         lines = cv2.HoughLinesP(
             edges,
@@ -46,149 +88,214 @@ class LineDetector:
             minLineLength=50,
             maxLineGap=10
         )
-        
+
         if lines is None:
             return self.court_lines
-        
-        # Classify lines
-        vertical_lines = []
-        horizontal_lines = []
-        
-        for line in lines:
-            x1_l, y1_l, x2_l, y2_l = line[0]
-            
-            # Calculate angle
-            angle = np.abs(np.arctan2(y2_l - y1_l, x2_l - x1_l) * 180 / np.pi)
-            
-            # Classify as vertical or horizontal
-            if angle > 80 and angle < 100:  # Nearly vertical (sidelines)
-                vertical_lines.append(line[0])
-            elif angle < 10 or angle > 170:  # Nearly horizontal (service/base lines)
-                horizontal_lines.append(line[0])
-        
+
+        # Segments in full-frame coordinates
+        segments = lines.reshape(-1, 4).astype(np.float64) + [x1, y1, x1, y1]
+
+        # Classify lines by angle. Under perspective the sidelines lean
+        # towards the vanishing point, so anything steeper than 30 degrees
+        # counts as a sideline; baselines and service lines stay near horizontal.
+        angles = np.abs(np.degrees(np.arctan2(segments[:, 3] - segments[:, 1], segments[:, 2] - segments[:, 0])))
+        side_segments = segments[(angles > 30) & (angles < 150)]
+        cross_segments = segments[(angles < 10) | (angles > 170)]
+
+        mid_x = (x1 + x2) / 2
+        mid_y = (y1 + y2) / 2
+
         # Merge similar lines and classify
-        self._classify_vertical_lines(vertical_lines, court_region.shape[1])
-        self._classify_horizontal_lines(horizontal_lines, court_region.shape[0])
-        
-        # Adjust coordinates back to full frame
-        self._adjust_to_frame_coords(x1, y1)
-        
+        self._classify_side_lines(side_segments, mid_y)
+        self._classify_cross_lines(cross_segments, mid_x)
+
+        self._fit_homography()
+        if self.homography is not None:
+            self._build_masks(frame.shape[:2])
+
         return self.court_lines
-    
-    def _classify_vertical_lines(self, lines, width):
-        """Classify vertical lines as inner or outer sidelines"""
-        if not lines:
+
+    @staticmethod
+    def _fit_line(segments, vertical):
+        """Least-squares line through segment endpoints: x = a*y + b if vertical, else y = a*x + b."""
+        points = segments.reshape(-1, 2)
+        if vertical:
+            a, b = np.polyfit(points[:, 1], points[:, 0], 1)
+        else:
+            a, b = np.polyfit(points[:, 0], points[:, 1], 1)
+        return float(a), float(b)
+
+    @classmethod
+    def _cluster(cls, segments, positions, vertical, gap=20):
+        """
+        Groups segments whose position (x at mid-height for sidelines, y at
+        mid-width otherwise) is within `gap` pixels of the previous one.
+        Returns [(position, fitted line)] sorted by position.
+        """
+        if not len(segments):
+            return []
+        order = np.argsort(positions)
+        positions = positions[order]
+        segments = segments[order]
+        breaks = np.flatnonzero(np.diff(positions) > gap) + 1
+        clusters = []
+        for idx in np.split(np.arange(len(positions)), breaks):
+            clusters.append((float(positions[idx].mean()), cls._fit_line(segments[idx], vertical)))
+        return clusters
+
+    def _classify_side_lines(self, segments, mid_y):
+        """Classify steep lines as inner or outer sidelines"""
+        if not len(segments):
             return
-        
-        # Group lines by x-coordinate (average of x1 and x2)
-        line_positions = [(l[0] + l[2]) / 2 for l in lines]
-        
-        # Find unique positions (merge similar lines)
-        unique_positions = []
-        for pos in sorted(line_positions):
-            if not unique_positions or abs(pos - unique_positions[-1]) > 20:
-                unique_positions.append(pos)
-        
-        # Sort positions
-        unique_positions.sort()
-        
+
+        # Position of each segment: its x where it crosses the middle of the court box
+        dy = segments[:, 3] - segments[:, 1]
+        t = np.where(np.abs(dy) > 1e-6, (mid_y - segments[:, 1]) / np.where(dy == 0, 1, dy), 0.5)
+        positions = segments[:, 0] + t * (segments[:, 2] - segments[:, 0])
+        clusters = self._cluster(segments, positions, vertical=True)
+
         # Classify based on position
         # Typically: outer_left, inner_left, inner_right, outer_right
-        if len(unique_positions) >= 4:
-            self.court_lines['outer_sidelines'] = [unique_positions[0], unique_positions[-1]]
-            self.court_lines['inner_sidelines'] = [unique_positions[1], unique_positions[-2]]
-        elif len(unique_positions) >= 2:
+        if len(clusters) >= 4:
+            outer, inner = [clusters[0], clusters[-1]], [clusters[1], clusters[-2]]
+        elif len(clusters) >= 2:
             # Assume we only see inner or outer lines
-            self.court_lines['outer_sidelines'] = [unique_positions[0], unique_positions[-1]]
-            self.court_lines['inner_sidelines'] = [unique_positions[0], unique_positions[-1]]
-    
-    def _classify_horizontal_lines(self, lines, height):
+            outer = inner = [clusters[0], clusters[-1]]
+        else:
+            return
+        self.court_lines['outer_sidelines'] = [c[0] for c in outer]
+        self.court_lines['inner_sidelines'] = [c[0] for c in inner]
+        self.line_fits['outer_sidelines'] = [c[1] for c in outer]
+        self.line_fits['inner_sidelines'] = [c[1] for c in inner]
+
+    def _classify_cross_lines(self, segments, mid_x):
         """Classify horizontal lines as service lines or baselines"""
-        if not lines:
+        if not len(segments):
             return
-        
-        # Group lines by y-coordinate
-        line_positions = [(l[1] + l[3]) / 2 for l in lines]
-        
-        # Find unique positions
-        unique_positions = []
-        for pos in sorted(line_positions):
-            if not unique_positions or abs(pos - unique_positions[-1]) > 20:
-                unique_positions.append(pos)
-        
-        unique_positions.sort()
-        
+
+        # Position of each segment: its y where it crosses the middle of the court box
+        dx = segments[:, 2] - segments[:, 0]
+        t = np.where(np.abs(dx) > 1e-6, (mid_x - segments[:, 0]) / np.where(dx == 0, 1, dx), 0.5)
+        positions = segments[:, 1] + t * (segments[:, 3] - segments[:, 1])
+        clusters = self._cluster(segments, positions, vertical=False)
+
         # Classify: baselines are at top and bottom, service lines in middle
-        if len(unique_positions) >= 2:
-            self.court_lines['baselines'] = [unique_positions[0], unique_positions[-1]]
-            if len(unique_positions) > 2:
-                self.court_lines['service_lines'] = unique_positions[1:-1]
-    
-    def _adjust_to_frame_coords(self, offset_x, offset_y):
-        """Adjust line coordinates from court region to full frame coordinates"""
-        # Adjust vertical lines (x-coordinates)
-        if self.court_lines['outer_sidelines']:
-            self.court_lines['outer_sidelines'] = [x + offset_x for x in self.court_lines['outer_sidelines']]
-        if self.court_lines['inner_sidelines']:
-            self.court_lines['inner_sidelines'] = [x + offset_x for x in self.court_lines['inner_sidelines']]
-        
-        # Adjust horizontal lines (y-coordinates)
-        if self.court_lines['baselines']:
-            self.court_lines['baselines'] = [y + offset_y for y in self.court_lines['baselines']]
-        if self.court_lines['service_lines']:
-            self.court_lines['service_lines'] = [y + offset_y for y in self.court_lines['service_lines']]
-    
+        if len(clusters) >= 2:
+            self.court_lines['baselines'] = [clusters[0][0], clusters[-1][0]]
+            self.line_fits['baselines'] = [clusters[0][1], clusters[-1][1]]
+            if len(clusters) > 2:
+                self.court_lines['service_lines'] = [c[0] for c in clusters[1:-1]]
+                self.line_fits['service_lines'] = [c[1] for c in clusters[1:-1]]
+
+    @staticmethod
+    def _intersect(side, cross):
+        """Intersection of x = a1*y + b1 with y = a2*x + b2."""
+        a1, b1 = side
+        a2, b2 = cross
+        denom = 1 - a1 * a2
+        if abs(denom) < 1e-9:
+            return None
+        y = (a2 * b1 + b2) / denom
+        return a1 * y + b1, y
+
+    def _fit_homography(self):
+        """Fits the court-to-image homography from the four outer corners."""
+        sides = self.line_fits['outer_sidelines']
+        ends = self.line_fits['baselines']
+        if len(sides) < 2 or len(ends) < 2:
+            return
+        corners = [
+            self._intersect(sides[0], ends[0]),   # far left
+            self._intersect(sides[1], ends[0]),   # far right
+            self._intersect(sides[1], ends[1]),   # near right
+            self._intersect(sides[0], ends[1]),   # near left
+        ]
+        if any(c is None for c in corners):
+            return
+        template = np.float32([[0, 0], [COURT_WIDTH, 0], [COURT_WIDTH, COURT_LENGTH], [0, COURT_LENGTH]])
+        image = np.float32(corners)
+        if abs(cv2.contourArea(image)) < 1.0:
+            return
+        self.homography = cv2.getPerspectiveTransform(template, image)
+
+    def _polygons(self, rects):
+        """Image-pixel corners of court rectangles (metres), one (4, 2) array each."""
+        polygons = []
+        for cx1, cy1, cx2, cy2 in rects:
+            corners = np.float32([[[cx1, cy1]], [[cx2, cy1]], [[cx2, cy2]], [[cx1, cy2]]])
+            polygons.append(cv2.perspectiveTransform(corners, self.homography).reshape(-1, 2))
+        return polygons
+
+    def _build_masks(self, shape):
+        """Rasterizes one uint8 IN/OUT lookup mask per (mode, shot_type)."""
+        for key, rects in COURT_REGIONS.items():
+            mask = np.zeros(shape, dtype=np.uint8)
+            cv2.fillPoly(mask, [np.round(polygon).astype(np.int32) for polygon in self._polygons(rects)], 1)
+            self.masks[key] = mask
+
+    def calibration(self):
+        """
+        The fitted court as plain lists, for drawing it elsewhere: the line
+        fits, the court-to-image homography and the in-bounds polygons (image
+        pixels) of each "mode/shot_type", one per rectangle of its region.
+        None parts were not found.
+        """
+        regions = {}
+        if self.homography is not None:
+            for (mode, shot_type), rects in COURT_REGIONS.items():
+                regions[f"{mode}/{shot_type}"] = [np.round(polygon, 1).tolist() for polygon in self._polygons(rects)]
+        return {
+            "line_fits": {key: [list(fit) for fit in fits] for key, fits in self.line_fits.items()},
+            "homography": self.homography.tolist() if self.homography is not None else None,
+            "regions": regions,
+        }
+
+    def _mask_for(self, mode, shot_type):
+        # Anything other than singles is played on the doubles court, anything other than a serve is a rally
+        mode = "singles" if mode == "singles" else "doubles"
+        shot_type = "serve" if shot_type == "serve" else "rally"
+        return self.masks.get((mode, shot_type))
+
+    def points_in_bounds(self, points, mode="doubles", shot_type="rally"):
+        """
+        Vectorized IN/OUT check for many points.
+
+        Args:
+            points: (n, 2) array-like of (x, y)
+            mode: "singles" or "doubles"
+            shot_type: "serve" or "rally"
+
+        Returns:
+            (n,) bool array, True where the point is IN
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        result = np.zeros(len(points), dtype=bool)
+        mask = self._mask_for(mode, shot_type) if self.masks else None
+        if mask is None or not len(points):
+            return result
+        xs = np.round(points[:, 0]).astype(np.int64)
+        ys = np.round(points[:, 1]).astype(np.int64)
+        inside = (xs >= 0) & (xs < mask.shape[1]) & (ys >= 0) & (ys < mask.shape[0])
+        result[inside] = mask[ys[inside], xs[inside]] > 0
+        return result
+
     def is_point_in_bounds(self, point, mode="doubles", shot_type="rally"):
         """
         Check if a point is within the court boundaries based on detected lines.
-        
+        A single lookup in the precomputed mask for (mode, shot_type).
+
         Args:
             point: (x, y) tuple
             mode: "singles" or "doubles"
             shot_type: "serve" or "rally"
-            
+
         Returns:
             bool: True if point is IN, False if OUT
         """
-        x, y = point
-        
-        # Determine which sidelines to use
-        if mode == "singles":
-            if not self.court_lines['inner_sidelines'] or len(self.court_lines['inner_sidelines']) < 2:
-                return False
-            left_line = self.court_lines['inner_sidelines'][0]
-            right_line = self.court_lines['inner_sidelines'][1]
-        else:  # doubles
-            if not self.court_lines['outer_sidelines'] or len(self.court_lines['outer_sidelines']) < 2:
-                return False
-            left_line = self.court_lines['outer_sidelines'][0]
-            right_line = self.court_lines['outer_sidelines'][1]
-        
-        # Check horizontal bounds (sidelines)
-        if x < left_line or x > right_line:
-            return False
-        
-        # Check vertical bounds (baselines and service lines)
-        if not self.court_lines['baselines'] or len(self.court_lines['baselines']) < 2:
+        mask = self._mask_for(mode, shot_type) if self.masks else None
+        if mask is None:
             return False
-        
-        top_line = self.court_lines['baselines'][0]
-        bottom_line = self.court_lines['baselines'][1]
-        
-        # For doubles serve, check service lines
-        if mode == "doubles" and shot_type == "serve":
-            if self.court_lines['service_lines']:
-                # Service area is between service lines (not all the way to baseline)
-                # Adjust the boundaries to exclude back tramline
-                # Assuming service lines are between baselines
-                if len(self.court_lines['service_lines']) >= 1:
-                    # Use service lines as new boundaries for serve
-                    # This is a simplified approach - might need refinement
-                    top_line = min(self.court_lines['service_lines'])
-                    bottom_line = max(self.court_lines['service_lines'])
-        
-        # Check if point is between top and bottom lines
-        if y < top_line or y > bottom_line:
+        x, y = int(round(point[0])), int(round(point[1]))
+        if not (0 <= x < mask.shape[1] and 0 <= y < mask.shape[0]):
             return False
-        
-        return True
+        return bool(mask[y, x])
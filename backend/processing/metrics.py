@@ -0,0 +1,211 @@
+import bisect
+import threading
+import time
+
+# Histogram bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram of durations in seconds, plus sum, count and max."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)   # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def snapshot(self):
+        return {"buckets": list(self.buckets), "counts": list(self.counts), "sum": self.sum,
+                "count": self.count, "max": self.max}
+
+    def merge(self, snapshot):
+        if tuple(snapshot["buckets"]) != self.buckets:
+            raise ValueError("Cannot merge histograms with different buckets")
+        self.counts = [a + b for a, b in zip(self.counts, snapshot["counts"])]
+        self.sum += snapshot["sum"]
+        self.count += snapshot["count"]
+        self.max = max(self.max, snapshot["max"])
+
+
+class _Timer:
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, **extra):
+    pairs = list(labels) + sorted(extra.items())
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _histogram_lines(name, labels, data):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(list(data["buckets"]) + [float("inf")], data["counts"]):
+        cumulative += count
+        lines.append(f"{name}_bucket{_format_labels(labels, le=_format_value(bound))} {cumulative}")
+    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(data['sum'])}")
+    lines.append(f"{name}_count{_format_labels(labels)} {data['count']}")
+    return lines
+
+
+class Metrics:
+    """
+    Processing metrics: a duration histogram per stage, counters and gauges,
+    each optionally labelled. Thread-safe; the pipeline stages record into
+    the same instance from their own threads.
+
+    A worker process records one job into its own Metrics and sends
+    snapshot() back with the result; the API process merges the snapshots
+    and renders them in the Prometheus text format for /metrics.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}     # stage -> Histogram
+        self.counters = {}   # (name, label key) -> value
+        self.gauges = {}     # (name, label key) -> value
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def timed(self, stage):
+        """Context manager recording the time spent in the block under `stage`."""
+        return _Timer(self, stage)
+
+    def count(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self.gauges[(name, _label_key(labels))] = value
+
+    def gauge_values(self, name):
+        """{label values: value} of one gauge, e.g. {("decision",): 2} for a stage-labelled gauge."""
+        with self._lock:
+            return {tuple(v for _, v in labels): value
+                    for (gauge, labels), value in self.gauges.items() if gauge == name}
+
+    def snapshot(self):
+        """Plain picklable / JSON-serialisable copy of the stage histograms and counters."""
+        with self._lock:
+            return {
+                "stages": {stage: histogram.snapshot() for stage, histogram in self.stages.items()},
+                "counters": [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+            }
+
+    def merge(self, snapshot):
+        with self._lock:
+            for stage, data in snapshot.get("stages", {}).items():
+                histogram = self.stages.get(stage)
+                if histogram is None:
+                    histogram = self.stages[stage] = Histogram(data["buckets"])
+                histogram.merge(data)
+            for name, labels, value in snapshot.get("counters", []):
+                key = (name, _label_key(labels))
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    def summary(self):
+        """Per-stage {calls, total_s, mean_ms, max_ms} and the counters, for a job's response."""
+        with self._lock:
+            stages = {
+                stage: {
+                    "calls": h.count,
+                    "total_s": round(h.sum, 4),
+                    "mean_ms": round(h.sum / h.count * 1000, 3) if h.count else 0.0,
+                    "max_ms": round(h.max * 1000, 3),
+                }
+                for stage, h in self.stages.items()
+            }
+            counters = {}
+            for (name, labels), value in sorted(self.counters.items()):
+                key = name + "".join(f".{v}" for _, v in labels)
+                counters[key] = value
+        return {"stages": stages, "counters": counters}
+
+    def render(self, prefix="alicas", gauges=(), histograms=()):
+        """
+        Prometheus text exposition format. gauges: extra (name, labels dict, value)
+        samples computed by the caller, e.g. job counts. histograms: extra
+        (name, labels dict, Histogram snapshot) samples, e.g. inference batch sizes.
+        """
+        lines = []
+        with self._lock:
+            stages = {stage: h.snapshot() for stage, h in self.stages.items()}
+            counters = dict(self.counters)
+            own_gauges = dict(self.gauges)
+
+        if stages:
+            name = f"{prefix}_stage_seconds"
+            lines.append(f"# HELP {name} Time per call of each processing stage "
+                         "(per batch for decode, models and encode; per frame otherwise).")
+            lines.append(f"# TYPE {name} histogram")
+            for stage, data in sorted(stages.items()):
+                lines.extend(_histogram_lines(name, (("stage", stage),), data))
+
+        by_name = {}
+        for name, labels, data in histograms:
+            by_name.setdefault(name, []).append((_label_key(labels), data))
+        for name, samples in sorted(by_name.items()):
+            metric = f"{prefix}_{name}"
+            lines.append(f"# TYPE {metric} histogram")
+            for labels, data in sorted(samples, key=lambda sample: sample[0]):
+                lines.extend(_histogram_lines(metric, labels, data))
+
+        by_name = {}
+        for (name, labels), value in counters.items():
+            by_name.setdefault(name, []).append((labels, value))
+        for name, samples in sorted(by_name.items()):
+            metric = f"{prefix}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for labels, value in sorted(samples):
+                lines.append(f"{metric}{_format_labels(labels)} {_format_value(value)}")
+
+        by_name = {}
+        for (name, labels), value in own_gauges.items():
+            by_name.setdefault(name, []).append((labels, value))
+        for name, labels, value in gauges:
+            by_name.setdefault(name, []).append((_label_key(labels), value))
+        for name, samples in sorted(by_name.items()):
+            metric = f"{prefix}_{name}"
+            lines.append(f"# TYPE {metric} gauge")
+            for labels, value in sorted(samples):
+                lines.append(f"{metric}{_format_labels(labels)} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
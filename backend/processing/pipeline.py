@@ -0,0 +1,192 @@
+import threading
+import time
+from collections import deque
+
+
+class PipelineAborted(Exception):
+    """Raised inside a stage when another stage has failed."""
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.busy = 0.0   # seconds spent doing work
+        self.wait = 0.0   # seconds blocked on an empty inbox or a full outbox
+        self.items = 0
+
+    def as_dict(self):
+        return {
+            "busy_s": round(self.busy, 4),
+            "wait_s": round(self.wait, 4),
+            "items": self.items,
+        }
+
+
+class Channel:
+    """
+    Bounded FIFO between two stages. put() blocks while the channel is full
+    (backpressure), get() blocks while it is empty.
+    """
+    _CLOSED = object()
+
+    def __init__(self, maxsize):
+        self.maxsize = max(1, maxsize)
+        self._items = deque()
+        self._closed = False
+        self._aborted = False
+        self._cond = threading.Condition()
+
+    def put(self, item, stats):
+        start = time.perf_counter()
+        with self._cond:
+            while len(self._items) >= self.maxsize and not self._aborted:
+                self._cond.wait()
+            if self._aborted:
+                raise PipelineAborted()
+            self._items.append(item)
+            self._cond.notify_all()
+        stats.wait += time.perf_counter() - start
+
+    def get(self, stats):
+        """Returns the next item, or Channel._CLOSED once the producer is done."""
+        start = time.perf_counter()
+        with self._cond:
+            while not self._items and not self._closed and not self._aborted:
+                self._cond.wait()
+            if self._aborted:
+                raise PipelineAborted()
+            item = self._items.popleft() if self._items else self._CLOSED
+            self._cond.notify_all()
+        stats.wait += time.perf_counter() - start
+        return item
+
+    def qsize(self):
+        with self._cond:
+            return len(self._items)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def abort(self):
+        with self._cond:
+            self._aborted = True
+            self._cond.notify_all()
+
+
+class Pipeline:
+    """
+    Runs a source followed by a chain of stages, each on its own thread,
+    joined by bounded channels. Items keep their order because every stage
+    is a single thread consuming a FIFO.
+
+    Usage:
+        pipeline = Pipeline(queue_size=4)
+        pipeline.source("decode", iterable)
+        pipeline.stage("inference", fn)   # fn(item) -> item passed downstream
+        pipeline.stage("encode", fn)      # last stage's return value is dropped
+        stats = pipeline.run()
+    """
+
+    def __init__(self, queue_size=4):
+        self.queue_size = queue_size
+        self._source = None
+        self._stages = []
+        self._channels = []
+        self._errors = []
+
+    def source(self, name, iterable):
+        self._source = (name, iterable)
+        return self
+
+    def stage(self, name, fn):
+        self._stages.append((name, fn))
+        return self
+
+    def queue_depths(self):
+        """Items waiting in each stage's inbox, by stage name (empty before run)."""
+        return {name: channel.qsize() for (name, _), channel in zip(self._stages, self._channels)}
+
+    def _abort(self, exc):
+        self._errors.append(exc)
+        for channel in self._channels:
+            channel.abort()
+
+    def _run_source(self, iterable, outbox, stats):
+        try:
+            iterator = iter(iterable)
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    stats.busy += time.perf_counter() - start
+                    break
+                stats.busy += time.perf_counter() - start
+                stats.items += 1
+                outbox.put(item, stats)
+            outbox.close()
+        except PipelineAborted:
+            pass
+        except BaseException as exc:
+            self._abort(exc)
+
+    def _run_stage(self, fn, inbox, outbox, stats):
+        try:
+            while True:
+                item = inbox.get(stats)
+                if item is Channel._CLOSED:
+                    break
+                start = time.perf_counter()
+                result = fn(item)
+                stats.busy += time.perf_counter() - start
+                stats.items += 1
+                if outbox is not None:
+                    outbox.put(result, stats)
+            if outbox is not None:
+                outbox.close()
+        except PipelineAborted:
+            pass
+        except BaseException as exc:
+            self._abort(exc)
+
+    def run(self):
+        """
+        Runs the pipeline to completion and returns per-stage stats.
+        Re-raises the first exception raised by any stage.
+        """
+        if self._source is None or not self._stages:
+            raise ValueError("Pipeline needs a source and at least one stage")
+
+        self._channels = [Channel(self.queue_size) for _ in self._stages]
+        source_name, iterable = self._source
+        stats = [StageStats(source_name)] + [StageStats(name) for name, _ in self._stages]
+
+        threads = [threading.Thread(
+            target=self._run_source,
+            args=(iterable, self._channels[0], stats[0]),
+            name=f"pipeline-{source_name}", daemon=True,
+        )]
+        for i, (name, fn) in enumerate(self._stages):
+            outbox = self._channels[i + 1] if i + 1 < len(self._channels) else None
+            threads.append(threading.Thread(
+                target=self._run_stage,
+                args=(fn, self._channels[i], outbox, stats[i + 1]),
+                name=f"pipeline-{name}", daemon=True,
+            ))
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - start
+
+        if self._errors:
+            raise self._errors[0]
+
+        return {
+            "wall_s": round(wall, 4),
+            "stages": {s.name: s.as_dict() for s in stats},
+        }
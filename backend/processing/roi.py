@@ -0,0 +1,110 @@
+import numpy as np
+from .detectors import split_batch
+from .tracker import ShuttleTracker
+
+
+class ROIShuttlecockDetector:
+    """
+    Runs the shuttlecock model on a crop around the predicted shuttle
+    position instead of the whole frame.
+
+    The prediction comes from a ShuttleTracker following the in-play shuttle.
+    The inference stage runs ahead of the decision stage, so this keeps its
+    own tracker rather than reading DecisionEngine's. A frame goes through
+    the model at full size
+    when there is no recent track, every `full_frame_interval` frames, and
+    again straight away when its crop came back empty. Crop boxes are
+    mapped back to frame coordinates.
+    """
+
+    def __init__(self, shuttlecock_detector, crop_size=640, full_frame_interval=15, max_gap=10):
+        self.detector = shuttlecock_detector
+        self.crop_size = crop_size
+        self.full_frame_interval = max(1, full_frame_interval)
+        self.max_gap = max_gap
+        self.reset()
+
+    def reset(self):
+        # A track not seen for max_gap frames is dropped, so there is no prediction
+        self.tracker = ShuttleTracker(max_missed=self.max_gap)
+        self.frame_index = 0
+        self.frames_since_full = 0
+        self.full_frames = 0
+        self.roi_frames = 0
+        self.fallbacks = 0
+
+    def predict(self, frame_index):
+        """Predicted (x, y) of the shuttle at frame_index, or None without a recent track."""
+        return self.tracker.predict(frame_index)
+
+    def _crop_window(self, center, width, height):
+        """Top-left corner of a crop_size window around center, kept inside the frame."""
+        half = self.crop_size // 2
+        x0 = int(min(max(center[0] - half, 0), width - self.crop_size))
+        y0 = int(min(max(center[1] - half, 0), height - self.crop_size))
+        return x0, y0
+
+    def detect_batch(self, frames, batch_size, frame_indices=None):
+        """
+        Returns a list with one list of [x1, y1, x2, y2, conf, cls] boxes per frame.
+        frame_indices: 0-based video positions of the frames, when they are not
+        consecutive (e.g. with adaptive sampling); defaults to the frames
+        following the previous batch.
+        """
+        if not frames:
+            return []
+        if frame_indices is None:
+            frame_indices = range(self.frame_index, self.frame_index + len(frames))
+        height, width = frames[0].shape[:2]
+        use_roi = width > self.crop_size and height > self.crop_size
+
+        # Plan: each frame either gets a crop (offset recorded) or a full-frame pass
+        offsets = []
+        for frame_index in frame_indices:
+            predicted = self.predict(frame_index) if use_roi else None
+            if predicted is None or self.frames_since_full >= self.full_frame_interval:
+                offsets.append(None)
+                self.frames_since_full = 0
+            else:
+                offsets.append(self._crop_window(predicted, width, height))
+                self.frames_since_full += 1
+
+        inputs = []
+        for frame, offset in zip(frames, offsets):
+            if offset is None:
+                inputs.append(frame)
+            else:
+                x0, y0 = offset
+                inputs.append(frame[y0:y0 + self.crop_size, x0:x0 + self.crop_size])
+        per_frame = split_batch(self.detector.detect_batch(inputs, batch_size), len(frames))
+
+        # Map crop boxes back to frame coordinates
+        for i, offset in enumerate(offsets):
+            if offset is not None and per_frame[i]:
+                shift = np.array([offset[0], offset[1], offset[0], offset[1], 0, 0], dtype=np.float32)
+                per_frame[i] = [det + shift for det in per_frame[i]]
+
+        # Crops that came back empty are retried on the full frame
+        missed = [i for i, offset in enumerate(offsets) if offset is not None and not per_frame[i]]
+        if missed:
+            retry = split_batch(self.detector.detect_batch([frames[i] for i in missed], batch_size), len(missed))
+            for i, dets in zip(missed, retry):
+                per_frame[i] = dets
+            self.fallbacks += len(missed)
+
+        # Update the tracker in frame order
+        for frame_index, dets in zip(frame_indices, per_frame):
+            self.tracker.update(frame_index, dets)
+
+        roi_count = sum(1 for offset in offsets if offset is not None)
+        self.roi_frames += roi_count
+        self.full_frames += len(frames) - roi_count
+        self.frame_index = frame_indices[-1] + 1
+        return per_frame
+
+    def stats(self):
+        return {
+            "full_frames": self.full_frames,
+            "roi_frames": self.roi_frames,
+            "fallbacks": self.fallbacks,
+        }
@@ -0,0 +1,104 @@
+import cv2
+import numpy as np
+
+from .tracker import ShuttleTracker
+
+# Width of the thumbnail used for the motion check. Nearest-neighbour sampling keeps the full contrast
+# of an object a few pixels wide, where averaging would blur a shuttle into the court
+THUMBNAIL_WIDTH = 480
+
+_CHANNEL_SUM = np.ones((1, 3))
+
+
+class AdaptiveSampler:
+    """
+    Decides which frames go through the models. While a rally is in play
+    every frame is run; between rallies only every `idle_interval`-th one.
+
+    Each frame is checked on its own; it counts as in play when:
+      - at least `motion_pixels` thumbnail pixels changed by more than
+        `motion_threshold` (summed over the colour channels) since the
+        previous frame, which keeps the full rate for `active_hold` frames,
+      - the in-play shuttle track was seen within the last `active_hold`
+        frames, or
+      - that track's last positions move down the screen, so a bounce may
+        be close.
+    The in-play track comes from a ShuttleTracker of the sampler's own, fed
+    the detections of every inferred frame, so it follows the same shuttle
+    as DecisionEngine's tracker. Skipped frames keep their frame numbers;
+    they just have no detections.
+    """
+
+    def __init__(self, idle_interval=10, motion_threshold=24, motion_pixels=2, active_hold=30, trend_points=4):
+        self.idle_interval = max(1, idle_interval)
+        self.motion_threshold = motion_threshold
+        self.motion_pixels = motion_pixels
+        self.active_hold = active_hold
+        self.trend_points = trend_points
+        self.reset()
+
+    def reset(self):
+        self.previous_thumbnail = None
+        self.active_until = -1
+        self.last_detection = -np.inf
+        self.last_run = -np.inf
+        self.tracker = ShuttleTracker()
+        self.track_id = None
+        self.recent_ys = []
+        self.frames_inferred = 0
+        self.frames_skipped = 0
+
+    def motion_score(self, frame):
+        """Number of thumbnail pixels that changed since the previous frame (inf for the first)."""
+        height, width = frame.shape[:2]
+        scale = min(1.0, THUMBNAIL_WIDTH / width)
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        thumbnail = cv2.resize(frame, size, interpolation=cv2.INTER_NEAREST)
+        previous, self.previous_thumbnail = self.previous_thumbnail, thumbnail
+        if previous is None or previous.shape != thumbnail.shape:
+            return float("inf")
+        change = cv2.transform(cv2.absdiff(thumbnail, previous), _CHANNEL_SUM)
+        return int(np.count_nonzero(change > self.motion_threshold))
+
+    def bounce_imminent(self):
+        """True if the in-play track's last few positions move steadily down the screen."""
+        if len(self.recent_ys) < self.trend_points:
+            return False
+        return bool(np.all(np.diff(self.recent_ys[-self.trend_points:]) > 0))
+
+    def in_play(self, frame_index):
+        return (frame_index <= self.active_until
+                or frame_index - self.last_detection <= self.active_hold
+                or self.bounce_imminent())
+
+    def select(self, frames, first_index):
+        """
+        Returns the indices (into frames) of the frames to run the models on.
+        first_index is the 0-based position of frames[0] in the video.
+        """
+        selected = []
+        for i, frame in enumerate(frames):
+            frame_index = first_index + i
+            if self.motion_score(frame) >= self.motion_pixels:
+                self.active_until = frame_index + self.active_hold
+            if self.in_play(frame_index) or frame_index - self.last_run >= self.idle_interval:
+                selected.append(i)
+                self.last_run = frame_index
+        self.frames_inferred += len(selected)
+        self.frames_skipped += len(frames) - len(selected)
+        return selected
+
+    def observe(self, frame_index, shuttlecock_dets):
+        """Feeds back the shuttle detections of an inferred frame, in frame order."""
+        track = self.tracker.update(frame_index, shuttlecock_dets)
+        if track is None:
+            return
+        self.last_detection = frame_index
+        # A different shuttle in play starts a new trend
+        if track["id"] != self.track_id:
+            self.track_id = track["id"]
+            self.recent_ys = []
+        self.recent_ys = (self.recent_ys + [track["center"][1]])[-self.trend_points:]
+
+    def stats(self):
+        return {"frames_inferred": self.frames_inferred, "frames_skipped": self.frames_skipped}
@@ -0,0 +1,215 @@
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import cv2
+
+from .decision import COOLDOWN_FRAMES
+from .engine import DEFAULT_WARMUP_FRAMES, ProcessingCancelled, ProcessingEngine
+from .metrics import Metrics
+from .config import DEFAULT_DECODE_WIDTH, FFMPEG_BINARY
+from .video_source import scaled_size
+from .video_writer import OpenCVWriter
+from .sidecar import DetectionSidecar
+
+# Seconds between progress reports while the shards run
+PROGRESS_INTERVAL = 0.5
+
+# One ProcessingEngine per shard worker process, and the shared memory it reports through: frames
+# done and total per shard, and a flag that stops every shard
+_engine = None
+_frames_done = None
+_frames_total = None
+_stop = None
+
+
+def plan_shards(total_frames, num_shards, min_shard_frames=300):
+    """
+    Splits [0, total_frames) into up to num_shards contiguous (start, end)
+    ranges of at least min_shard_frames each.
+    """
+    if total_frames <= 0:
+        return [(0, None)]
+    num_shards = max(1, min(num_shards, total_frames // max(1, min_shard_frames)))
+    bounds = [round(i * total_frames / num_shards) for i in range(num_shards + 1)]
+    return [(bounds[i], bounds[i + 1]) for i in range(num_shards)]
+
+
+def _init_shard_worker(engine_kwargs, frames_done=None, frames_total=None, stop=None):
+    global _engine, _frames_done, _frames_total, _stop
+    _frames_done, _frames_total, _stop = frames_done, frames_total, stop
+    _engine = ProcessingEngine(**engine_kwargs)
+
+
+def _run_shard(index, video_path, segment_path, start, end, warmup_frames, mode, shot_type, sidecar_path=None):
+    # Each shard starts from clean trajectory, cooldown and court calibration (a new JobState)
+    def report(frames_done, total_frames):
+        if _stop is not None and _stop.value:
+            raise ProcessingCancelled()
+        if _frames_done is not None:
+            _frames_done[index] = frames_done
+            _frames_total[index] = total_frames
+
+    stats = {}
+    metrics = Metrics()
+    results = _engine.process_video(video_path, segment_path, mode=mode, shot_type=shot_type, stats=stats,
+                                    start_frame=start, end_frame=end, warmup_frames=warmup_frames,
+                                    metrics=metrics, sidecar_path=sidecar_path, progress=report)
+    return results, stats, metrics.snapshot()
+
+
+def merge_results(shard_results, cooldown=COOLDOWN_FRAMES):
+    """
+    Merges per-shard results_summary lists (in shard order) into one list
+    ordered by frame. A bounce reported by two neighbouring shards within
+    the cooldown of each other is kept once, from the earlier shard.
+    """
+    merged = []
+    for shard_index, results in enumerate(shard_results):
+        for event in results:
+            merged.append((event["frame"], shard_index, event))
+    merged.sort(key=lambda item: (item[0], item[1]))
+
+    kept = []
+    for frame, shard_index, event in merged:
+        if kept:
+            last_frame, last_shard, _ = kept[-1]
+            if last_shard != shard_index and frame - last_frame <= cooldown:
+                continue
+        kept.append((frame, shard_index, event))
+    return [event for _, _, event in kept]
+
+
+def concat_segments(segment_paths, output_path, fps, size):
+    """
+    Joins the rendered shard segments into one video. Uses ffmpeg's concat
+    demuxer (no re-encode) when ffmpeg is installed, otherwise re-encodes
+    the frames with OpenCV.
+    """
+    segment_paths = [Path(p) for p in segment_paths if Path(p).is_file()]
+    ffmpeg = shutil.which(FFMPEG_BINARY)
+    if ffmpeg:
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as listing:
+            for path in segment_paths:
+                listing.write(f"file '{path.resolve().as_posix()}'\n")
+        try:
+            subprocess.run(
+                [ffmpeg, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+                 "-i", listing.name, "-c", "copy", str(output_path)],
+                check=True,
+            )
+            return
+        except subprocess.CalledProcessError:
+            pass
+        finally:
+            os.unlink(listing.name)
+
+    out = OpenCVWriter(output_path, fps, size)
+    try:
+        for path in segment_paths:
+            cap = cv2.VideoCapture(str(path))
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                out.write(frame)
+            cap.release()
+    finally:
+        out.release()
+
+
+def process_video_sharded(video_path, output_path=None, mode="doubles", shot_type="rally", num_shards=None,
+                          engine_kwargs=None, warmup_frames=DEFAULT_WARMUP_FRAMES, stats=None, metrics=None,
+                          sidecar_path=None, progress=None):
+    """
+    Processes a video as frame-range shards, each in its own worker process
+    with its own detectors, and merges the results.
+
+    Each shard replays `warmup_frames` frames before its range so bounce
+    detection carries over the shard boundary, but only reports decisions
+    made inside its own range. Rendered segments are joined into output_path,
+    and the shards' detection sidecars into sidecar_path.
+    Stage timings of all shards are merged into `metrics`, if given.
+    progress: optional callable(frames_done, total_frames) over all shards
+    (warm-up frames included), called every PROGRESS_INTERVAL seconds; it
+    may raise ProcessingCancelled to stop every shard.
+    Returns the merged results_summary.
+    """
+    num_shards = num_shards or os.cpu_count() or 1
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video: {video_path}")
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    cap.release()
+    # Segments are rendered at the decoded size
+    decode_width = (engine_kwargs or {}).get("decode_width")
+    size = scaled_size(size, DEFAULT_DECODE_WIDTH if decode_width is None else decode_width)
+
+    shards = plan_shards(total_frames, num_shards)
+    segment_dir = Path(tempfile.mkdtemp(prefix="alicas_shards_"))
+    suffix = Path(output_path).suffix if output_path else ".mp4"
+    segment_paths = [segment_dir / f"segment_{i:04d}{suffix}" if output_path else None for i in range(len(shards))]
+    sidecar_paths = [segment_dir / f"segment_{i:04d}.bin" if sidecar_path else None for i in range(len(shards))]
+
+    started = time.perf_counter()
+    try:
+        context = multiprocessing.get_context("spawn")
+        frames_done = context.Array("q", len(shards), lock=False)
+        frames_total = context.Array("q", len(shards), lock=False)
+        stop = context.Value("b", 0, lock=False)
+        executor = ProcessPoolExecutor(max_workers=len(shards), mp_context=context, initializer=_init_shard_worker,
+                                       initargs=(engine_kwargs or {}, frames_done, frames_total, stop))
+        try:
+            futures = [
+                executor.submit(_run_shard, index, str(video_path), str(segment) if segment else None, start, end,
+                                warmup_frames, mode, shot_type, str(sidecar) if sidecar else None)
+                for index, ((start, end), segment, sidecar) in enumerate(zip(shards, segment_paths, sidecar_paths))
+            ]
+            pending = futures
+            while pending:
+                finished, pending = wait(pending, timeout=PROGRESS_INTERVAL, return_when=FIRST_EXCEPTION)
+                if any(future.exception() is not None for future in finished):
+                    break
+                if progress:
+                    progress(sum(frames_done), sum(frames_total))
+            shard_outputs = [future.result() for future in futures]
+        except BaseException:
+            # Cancelled, or a shard failed: the running shards stop at their next batch, queued ones never start
+            stop.value = 1
+            raise
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        results_summary = merge_results([results for results, _, _ in shard_outputs])
+        if metrics is not None:
+            for _, _, snapshot in shard_outputs:
+                metrics.merge(snapshot)
+        if output_path:
+            concat_segments(segment_paths, output_path, fps, size)
+        if sidecar_path:
+            merged = DetectionSidecar(fps, size)
+            for path in sidecar_paths:
+                merged.extend(DetectionSidecar.load(path))
+            merged.save(sidecar_path, results_summary, mode=mode, shot_type=shot_type)
+    finally:
+        shutil.rmtree(segment_dir, ignore_errors=True)
+
+    if stats is not None:
+        wall = time.perf_counter() - started
+        frames_done = sum(shard_stats.get("frames", 0) for _, shard_stats, _ in shard_outputs)
+        stats["wall_s"] = round(wall, 4)
+        stats["frames"] = frames_done
+        stats["fps"] = round(frames_done / wall, 2) if wall else 0.0
+        stats["shards"] = [
+            {"start_frame": start, "end_frame": end, **shard_stats}
+            for (start, end), (_, shard_stats, _) in zip(shards, shard_outputs)
+        ]
+
+    return results_summary
@@ -0,0 +1,179 @@
+"""
+Per-frame detection sidecar: every shuttlecock and court box of a processed
+video in a compact binary file, so overlays can be drawn client-side on the
+original video instead of being burnt into a re-encoded copy.
+
+Layout (little-endian):
+
+    header   64 bytes, HEADER_FORMAT:
+             magic b"ALDS", version, row size, fps, first frame number,
+             frame count, width, height, row count and the byte offsets of
+             the index, the rows and the metadata
+    index    (frames + 1) uint32: rows of frame first_frame + i are
+             index[i] .. index[i + 1]
+    rows     ROW_DTYPE records (28 bytes), in frame order
+    metadata UTF-8 JSON to the end of the file: mode, shot_type, kinds,
+             court calibrations ({"frame", "line_fits", "homography",
+             "regions"}, each valid from its frame on) and decisions
+
+Header, index and rows have fixed sizes, so a client with HTTP range
+requests reads the header, then the two index entries around a time window,
+then exactly the rows of that window.
+"""
+import json
+import os
+import struct
+import time
+from pathlib import Path
+
+import numpy as np
+
+MAGIC = b"ALDS"
+VERSION = 1
+HEADER_FORMAT = "<4sHHdIIIIQQQQ"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# Detection kinds, stored in the "kind" column
+KINDS = ("shuttlecock", "court")
+ROW_DTYPE = np.dtype([
+    ("frame", "<u4"),   # 1-based frame number, as in results_summary
+    ("kind", "u1"),     # index into KINDS
+    ("cls", "u1"),      # model class id
+    ("pad", "<u2"),
+    ("x1", "<f4"), ("y1", "<f4"), ("x2", "<f4"), ("y2", "<f4"),
+    ("conf", "<f4"),
+])
+INDEX_DTYPE = np.dtype("<u4")
+
+
+class DetectionSidecar:
+    """
+    Collects the detections of consecutive frames and writes them as a
+    sidecar file. add_frame must be called in frame order without gaps.
+    """
+
+    def __init__(self, fps=0.0, size=(0, 0)):
+        self.fps = float(fps or 0.0)
+        self.size = tuple(size)
+        self.first_frame = None
+        self.counts = []     # rows per frame
+        self.rows = []       # row tuples, ROW_DTYPE field order
+        self.courts = []     # calibrations with the frame they apply from
+
+    @property
+    def frames(self):
+        return len(self.counts)
+
+    def add_frame(self, frame_number, shuttlecock_dets, court_dets):
+        if self.first_frame is None:
+            self.first_frame = frame_number
+        elif frame_number != self.first_frame + len(self.counts):
+            raise ValueError(f"Frame {frame_number} out of order, expected {self.first_frame + len(self.counts)}")
+        count = 0
+        for kind, dets in enumerate((shuttlecock_dets, court_dets)):
+            for x1, y1, x2, y2, conf, cls in dets:
+                self.rows.append((frame_number, kind, int(cls), 0, x1, y1, x2, y2, conf))
+                count += 1
+        self.counts.append(count)
+
+    def add_court(self, frame_number, calibration):
+        self.courts.append({"frame": frame_number, **calibration})
+
+    def _courts_in_range(self):
+        """
+        Calibrations made while warming up before the first frame collapse
+        into the latest one, which then applies from the first frame.
+        """
+        if self.first_frame is None:
+            return list(self.courts)
+        before = [court for court in self.courts if court["frame"] < self.first_frame]
+        courts = [dict(before[-1], frame=self.first_frame)] if before else []
+        return courts + [court for court in self.courts if court["frame"] >= self.first_frame]
+
+    def extend(self, other):
+        """Appends the frames of a sidecar that starts where this one ends, e.g. the next shard."""
+        if not other.frames:
+            return
+        if self.first_frame is None:
+            self.first_frame = other.first_frame
+            self.fps, self.size = other.fps, other.size
+        elif other.first_frame != self.first_frame + self.frames:
+            raise ValueError(f"Sidecar starting at frame {other.first_frame} does not follow frame "
+                             f"{self.first_frame + self.frames - 1}")
+        self.counts.extend(other.counts)
+        self.rows.extend(other.rows)
+        self.courts = self._courts_in_range() + other._courts_in_range()
+
+    def save(self, path, decisions=(), **meta):
+        """
+        Writes the sidecar to path (atomically) with the decisions and any
+        extra metadata, e.g. mode and shot_type.
+        """
+        rows = np.array(self.rows, dtype=ROW_DTYPE) if self.rows else np.empty(0, dtype=ROW_DTYPE)
+        index = np.zeros(self.frames + 1, dtype=INDEX_DTYPE)
+        index[1:] = np.cumsum(self.counts)
+        metadata = json.dumps({
+            **meta,
+            "kinds": list(KINDS),
+            "courts": self._courts_in_range(),
+            "decisions": list(decisions),
+        }, default=float).encode()
+
+        index_offset = HEADER_SIZE
+        rows_offset = index_offset + index.nbytes
+        meta_offset = rows_offset + rows.nbytes
+        width, height = self.size
+        header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, ROW_DTYPE.itemsize, self.fps, self.first_frame or 1,
+                             self.frames, width, height, len(rows), index_offset, rows_offset, meta_offset)
+
+        path = Path(path)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{time.time_ns()}.tmp")
+        with open(tmp, "wb") as handle:
+            handle.write(header)
+            handle.write(index.tobytes())
+            handle.write(rows.tobytes())
+            handle.write(metadata)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        header, index, rows, meta = read_sidecar(path)
+        sidecar = cls(header["fps"], (header["width"], header["height"]))
+        if header["frames"]:
+            sidecar.first_frame = header["first_frame"]
+        sidecar.counts = np.diff(index).tolist()
+        sidecar.rows = [tuple(row) for row in rows.tolist()]
+        sidecar.courts = meta.get("courts", [])
+        return sidecar
+
+
+def read_header(handle):
+    values = struct.unpack(HEADER_FORMAT, handle.read(HEADER_SIZE))
+    names = ("magic", "version", "row_size", "fps", "first_frame", "frames", "width", "height", "rows",
+             "index_offset", "rows_offset", "meta_offset")
+    header = dict(zip(names, values))
+    if header["magic"] != MAGIC or header["version"] != VERSION:
+        raise ValueError("Not a detection sidecar (or an unsupported version)")
+    return header
+
+
+def read_sidecar(path, start_frame=None, end_frame=None):
+    """
+    Reads a sidecar the way a range-requesting client would: only the index
+    entries and rows of frames [start_frame, end_frame) (1-based, default
+    all). Returns (header, index, rows, metadata).
+    """
+    with open(path, "rb") as handle:
+        header = read_header(handle)
+        first, frames = header["first_frame"], header["frames"]
+        start = min(max(start_frame - first, 0), frames) if start_frame is not None else 0
+        end = min(max(end_frame - first, start), frames) if end_frame is not None else frames
+
+        handle.seek(header["index_offset"] + start * INDEX_DTYPE.itemsize)
+        index = np.frombuffer(handle.read((end - start + 1) * INDEX_DTYPE.itemsize), dtype=INDEX_DTYPE)
+        handle.seek(header["rows_offset"] + int(index[0]) * ROW_DTYPE.itemsize)
+        rows = np.frombuffer(handle.read(int(index[-1] - index[0]) * ROW_DTYPE.itemsize), dtype=ROW_DTYPE)
+
+        handle.seek(header["meta_offset"])
+        metadata = json.loads(handle.read().decode())
+    return header, index - index[0], rows, metadata
@@ -0,0 +1,174 @@
+import cv2
+import numpy as np
+from .detectors import split_batch
+
+# Width of the downscaled copy used for frame differencing; a shuttle in 4K footage must still
+# cover a few of its pixels
+MOTION_WIDTH = 960
+# Change summed over the colour channels that counts as motion, and the moving pixels (at MOTION_WIDTH)
+# a tile needs
+MOTION_THRESHOLD = 24
+MIN_MOTION_PIXELS = 1
+# Boxes within this many pixels of a tile edge inside the frame are cut off; the overlapping tile has them whole
+EDGE_MARGIN = 2
+
+_CHANNEL_SUM = np.ones((1, 3))
+
+
+def tile_grid(width, height, tile_size, overlap):
+    """
+    (n, 4) int array of [x0, y0, x1, y1] tiles covering the frame, evenly
+    spaced so neighbours overlap by at least `overlap` pixels.
+    """
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        count = int(np.ceil((length - overlap) / max(1, tile_size - overlap)))
+        return np.round(np.linspace(0, length - tile_size, count)).astype(np.int64).tolist()
+
+    tiles = [(x, y, min(x + tile_size, width), min(y + tile_size, height))
+             for y in starts(height) for x in starts(width)]
+    return np.array(tiles, dtype=np.int64)
+
+
+def nms(dets, iou_threshold):
+    """Non-maximum suppression over [x1, y1, x2, y2, conf, cls] rows, per class."""
+    if len(dets) < 2:
+        return dets
+    boxes = dets[:, :4].astype(np.float64)
+    # Shift every class into its own region so boxes of different classes never overlap
+    boxes += (dets[:, 5:6] * (boxes.max() + 1))
+    rects = np.column_stack((boxes[:, :2], boxes[:, 2:] - boxes[:, :2])).tolist()
+    keep = cv2.dnn.NMSBoxes(rects, dets[:, 4].tolist(), 0.0, iou_threshold)
+    return dets[np.asarray(keep, dtype=np.int64).reshape(-1)]
+
+
+class TiledShuttlecockDetector:
+    """
+    Runs the shuttlecock model on full-resolution tiles instead of the whole
+    frame shrunk to the model's input size, so a shuttle in 4K footage stays
+    large enough to be found.
+
+    The frame is split into overlapping `tile_size` tiles, and only tiles
+    with motion go through the model: a downscaled copy of the
+    frame is differenced with the previous one, and a tile runs if it has
+    moving pixels or held a detection in the previous batch. Detections are
+    mapped back to frame coordinates, boxes cut off at an inner tile edge
+    are dropped, and the rest are merged with NMS. Frames no bigger than a
+    tile go through the model whole, every frame.
+    """
+
+    def __init__(self, shuttlecock_detector, tile_size=640, overlap=128, iou_threshold=0.5):
+        self.detector = shuttlecock_detector
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.iou_threshold = iou_threshold
+        self.reset()
+
+    def reset(self):
+        self.previous = None          # downscaled copy of the last frame
+        self.last_centers = np.empty((0, 2))
+        self.frames = 0
+        self.tiles = 0
+        self.tiles_run = 0
+
+    def _motion_mask(self, frame):
+        height, width = frame.shape[:2]
+        scale = min(1.0, MOTION_WIDTH / width)
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        # Nearest-neighbour sampling is several times cheaper than averaging on 4K frames and still hits
+        # an object a few pixels wide. Colour, not grey: a shuttle can have about the same brightness as
+        # the court behind it
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_NEAREST)
+        previous, self.previous = self.previous, small
+        if previous is None or previous.shape != small.shape:
+            return None, scale
+        change = cv2.transform(cv2.absdiff(small, previous), _CHANNEL_SUM)
+        return change > MOTION_THRESHOLD, scale
+
+    def _moving_tiles(self, frame, tiles):
+        """Boolean mask over tiles: True for the tiles to run the model on."""
+        mask, scale = self._motion_mask(frame)
+        if mask is None:
+            moving = np.zeros(len(tiles), dtype=bool)
+        else:
+            # Moving pixels per tile from the integral image of the motion mask
+            integral = cv2.integral(mask.astype(np.uint8))
+            x0, y0 = (np.floor(tiles[:, :2] * scale).astype(np.int64).T)
+            x1, y1 = (np.ceil(tiles[:, 2:] * scale).astype(np.int64).T)
+            x1 = np.minimum(x1, mask.shape[1])
+            y1 = np.minimum(y1, mask.shape[0])
+            counts = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+            moving = counts >= MIN_MOTION_PIXELS
+        if len(self.last_centers):
+            cx, cy = self.last_centers[:, 0], self.last_centers[:, 1]
+            holds = ((cx[None, :] >= tiles[:, 0:1]) & (cx[None, :] < tiles[:, 2:3])
+                     & (cy[None, :] >= tiles[:, 1:2]) & (cy[None, :] < tiles[:, 3:4]))
+            moving |= holds.any(axis=1)
+        return moving
+
+    def _inside(self, dets, tile, width, height):
+        """Drops boxes touching an edge of the tile that is not an edge of the frame."""
+        x0, y0, x1, y1 = tile
+        cut = np.zeros(len(dets), dtype=bool)
+        if x0 > 0:
+            cut |= dets[:, 0] <= x0 + EDGE_MARGIN
+        if y0 > 0:
+            cut |= dets[:, 1] <= y0 + EDGE_MARGIN
+        if x1 < width:
+            cut |= dets[:, 2] >= x1 - EDGE_MARGIN
+        if y1 < height:
+            cut |= dets[:, 3] >= y1 - EDGE_MARGIN
+        return dets[~cut]
+
+    def detect_batch(self, frames, batch_size, frame_indices=None):
+        """
+        Returns a list with one list of [x1, y1, x2, y2, conf, cls] boxes per
+        frame. The selected tiles of all frames go through the model together.
+        frame_indices is accepted for the same interface as ROIShuttlecockDetector.
+        """
+        if not frames:
+            return []
+        height, width = frames[0].shape[:2]
+        tiles = tile_grid(width, height, self.tile_size, self.overlap)
+        self.frames += len(frames)
+        self.tiles += len(frames) * len(tiles)
+        if len(tiles) == 1:
+            self.tiles_run += len(frames)
+            return split_batch(self.detector.detect_batch(frames, batch_size), len(frames))
+
+        crops, owners = [], []
+        for i, frame in enumerate(frames):
+            for t in np.flatnonzero(self._moving_tiles(frame, tiles)):
+                x0, y0, x1, y1 = tiles[t]
+                crops.append(frame[y0:y1, x0:x1])
+                owners.append((i, t))
+        self.tiles_run += len(crops)
+
+        found = [[] for _ in frames]
+        if crops:
+            per_crop = split_batch(self.detector.detect_batch(crops, batch_size), len(crops))
+            for (i, t), dets in zip(owners, per_crop):
+                if not dets:
+                    continue
+                x0, y0 = tiles[t][:2]
+                dets = np.asarray(dets, dtype=np.float32) + np.array([x0, y0, x0, y0, 0, 0], dtype=np.float32)
+                dets = self._inside(dets, tiles[t], width, height)
+                if len(dets):
+                    found[i].append(dets)
+
+        per_frame = []
+        for dets in found:
+            merged = nms(np.concatenate(dets), self.iou_threshold) if dets else np.empty((0, 6), dtype=np.float32)
+            per_frame.append(list(merged))
+        last = next((dets for dets in reversed(per_frame) if dets), [])
+        self.last_centers = np.array([((d[0] + d[2]) / 2, (d[1] + d[3]) / 2) for d in last]).reshape(-1, 2)
+        return per_frame
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "tiles": self.tiles,
+            "tiles_run": self.tiles_run,
+            "tiles_run_fraction": round(self.tiles_run / self.tiles, 4) if self.tiles else 0.0,
+        }
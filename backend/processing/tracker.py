@@ -0,0 +1,238 @@
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # greedy matching below
+    linear_sum_assignment = None
+
+# Association gate: a detection can join a track if it is within MAX_DISTANCE pixels
+# of the predicted position, plus GATE_SPEED_FACTOR times the track's speed per frame
+MAX_DISTANCE = 80.0
+GATE_SPEED_FACTOR = 1.5
+# Frames a track survives without a matching detection
+MAX_MISSED = 10
+# Detections a track needs before it can become the in-play track
+MIN_HITS = 3
+# Pixels a track must have travelled before it can become the in-play track; spare
+# shuttles on the floor and other static false positives never do
+MIN_TRAVEL = 15.0
+# Speed (pixels per frame) below which the in-play track counts as still, and the
+# number of still frames after which another moving track may take over
+MIN_SPEED = 1.0
+MAX_STILL_FRAMES = 15
+
+# Constant-velocity Kalman filter noise: acceleration (px / frame^2) and measurement (px)
+ACCELERATION_NOISE = 4.0
+MEASUREMENT_NOISE = 2.0
+# Initial velocity uncertainty of a new track (px / frame)
+INITIAL_VELOCITY_STD = 20.0
+
+_R = np.eye(2) * MEASUREMENT_NOISE ** 2
+
+
+def _transition(dt):
+    F = np.eye(4)
+    F[0, 2] = F[1, 3] = dt
+    return F
+
+
+def _process_noise(dt):
+    q = ACCELERATION_NOISE ** 2
+    block = np.array([[dt ** 4 / 4, dt ** 3 / 2], [dt ** 3 / 2, dt ** 2]]) * q
+    Q = np.zeros((4, 4))
+    Q[np.ix_([0, 2], [0, 2])] = block
+    Q[np.ix_([1, 3], [1, 3])] = block
+    return Q
+
+
+def _assign(cost, gate):
+    """
+    Minimum-cost one-to-one matching of tracks (rows) to detections
+    (columns), keeping only pairs within the gate. Hungarian algorithm with
+    SciPy, otherwise greedy by increasing cost.
+    """
+    allowed = cost <= gate
+    if not allowed.any():
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    if linear_sum_assignment is not None:
+        # Pairs outside the gate get a cost no allowed matching can beat
+        rows, cols = linear_sum_assignment(np.where(allowed, cost, 1e9))
+        keep = allowed[rows, cols]
+        return rows[keep], cols[keep]
+    rows, cols = np.nonzero(allowed)
+    order = np.argsort(cost[rows, cols], kind="stable")
+    used_rows, used_cols, matched_rows, matched_cols = set(), set(), [], []
+    for r, c in zip(rows[order], cols[order]):
+        if r not in used_rows and c not in used_cols:
+            used_rows.add(r)
+            used_cols.add(c)
+            matched_rows.append(r)
+            matched_cols.append(c)
+    return np.array(matched_rows, dtype=np.int64), np.array(matched_cols, dtype=np.int64)
+
+
+class ShuttleTracker:
+    """
+    Tracks every shuttlecock detection across frames and picks the one in
+    play, so spare shuttles on the floor or false positives on shoes don't
+    take over the trajectory.
+
+    Each track is a constant-velocity Kalman filter. All tracks are
+    predicted, gated and updated together as arrays, and detections are
+    matched to tracks by distance to the prediction with the Hungarian
+    algorithm. The in-play track is the fastest confirmed track that has
+    moved; it keeps that role until it is lost or stays still for
+    MAX_STILL_FRAMES. Frame numbers may skip (e.g. adaptive sampling): the
+    filters predict over the gap.
+    """
+
+    def __init__(self, max_distance=MAX_DISTANCE, max_missed=MAX_MISSED, min_hits=MIN_HITS, min_travel=MIN_TRAVEL):
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.min_hits = min_hits
+        self.min_travel = min_travel
+        self.reset()
+
+    def reset(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.states = np.empty((0, 4))          # x, y, vx, vy
+        self.covariances = np.empty((0, 4, 4))
+        self.hits = np.empty(0, dtype=np.int64)
+        self.last_seen = np.empty(0, dtype=np.int64)
+        self.positions = np.empty((0, 2))       # last matched detection center
+        self.travel = np.empty(0)               # summed distance between matched detections
+        self.frame = None                        # frame the states are predicted to
+        self.next_id = 1
+        self.active_id = None
+        self.still_frames = 0
+        self.tracks_created = 0
+        self.switches = 0
+
+    def _predict_to(self, frame):
+        if self.frame is not None and frame > self.frame and len(self.ids):
+            dt = frame - self.frame
+            F = _transition(dt)
+            self.states = self.states @ F.T
+            self.covariances = F @ self.covariances @ F.T + _process_noise(dt)
+        self.frame = frame if self.frame is None else max(self.frame, frame)
+
+    def predict(self, frame):
+        """
+        Predicted (x, y) of the in-play track at frame, or None without one.
+        Does not change the tracker.
+        """
+        if self.active_id is None:
+            return None
+        i = int(np.flatnonzero(self.ids == self.active_id)[0])
+        x, y, vx, vy = self.states[i]
+        dt = frame - self.frame
+        return float(x + vx * dt), float(y + vy * dt)
+
+    def update(self, frame, detections):
+        """
+        Adds the detections ([x1, y1, x2, y2, conf, cls] boxes) of a frame.
+        Returns the in-play track's detection at this frame as
+        {"id", "center", "box"}, or None if it has none here.
+        """
+        self._predict_to(frame)
+        boxes = np.asarray(detections, dtype=np.float64).reshape(-1, 6)
+        centers = (boxes[:, :2] + boxes[:, 2:4]) / 2
+
+        matched_tracks = np.empty(0, dtype=np.int64)
+        matched_dets = np.empty(0, dtype=np.int64)
+        if len(self.ids) and len(boxes):
+            predicted = self.states[:, :2]
+            cost = np.linalg.norm(predicted[:, None, :] - centers[None, :, :], axis=2)
+            speed = np.linalg.norm(self.states[:, 2:], axis=1)
+            gate = (self.max_distance + GATE_SPEED_FACTOR * speed)[:, None]
+            matched_tracks, matched_dets = _assign(cost, gate)
+
+        matched_ids = self.ids[matched_tracks]
+        if len(matched_tracks):
+            self._correct(matched_tracks, centers[matched_dets])
+            self.hits[matched_tracks] += 1
+            self.last_seen[matched_tracks] = frame
+
+        new = np.setdiff1d(np.arange(len(boxes)), matched_dets)
+        if len(new):
+            self._start_tracks(frame, centers[new])
+
+        # Forget tracks that have not been seen for too long
+        alive = frame - self.last_seen <= self.max_missed
+        if not alive.all():
+            self._keep(alive)
+
+        self._select_active(frame)
+        detection_of = dict(zip(matched_ids.tolist(), matched_dets.tolist()))
+        if self.active_id not in detection_of:
+            return None
+        det = detection_of[self.active_id]
+        return {"id": self.active_id, "center": (float(centers[det][0]), float(centers[det][1])),
+                "box": boxes[det].tolist()}
+
+    def _correct(self, indices, measurements):
+        """Kalman update of the matched tracks with their detection centers, all at once."""
+        P = self.covariances[indices]
+        S = P[:, :2, :2] + _R
+        K = P[:, :, :2] @ np.linalg.inv(S)                      # (m, 4, 2)
+        innovation = measurements - self.states[indices, :2]
+        self.states[indices] += (K @ innovation[:, :, None])[:, :, 0]
+        self.covariances[indices] = P - K @ P[:, :2, :]
+        self.travel[indices] += np.linalg.norm(measurements - self.positions[indices], axis=1)
+        self.positions[indices] = measurements
+
+    def _start_tracks(self, frame, centers):
+        count = len(centers)
+        states = np.zeros((count, 4))
+        states[:, :2] = centers
+        covariance = np.diag([MEASUREMENT_NOISE ** 2] * 2 + [INITIAL_VELOCITY_STD ** 2] * 2)
+        self.ids = np.concatenate([self.ids, np.arange(self.next_id, self.next_id + count)])
+        self.states = np.concatenate([self.states, states])
+        self.covariances = np.concatenate([self.covariances, np.repeat(covariance[None], count, axis=0)])
+        self.hits = np.concatenate([self.hits, np.ones(count, dtype=np.int64)])
+        self.last_seen = np.concatenate([self.last_seen, np.full(count, frame, dtype=np.int64)])
+        self.positions = np.concatenate([self.positions, centers])
+        self.travel = np.concatenate([self.travel, np.zeros(count)])
+        self.next_id += count
+        self.tracks_created += count
+
+    def _keep(self, mask):
+        self.ids = self.ids[mask]
+        self.states = self.states[mask]
+        self.covariances = self.covariances[mask]
+        self.hits = self.hits[mask]
+        self.last_seen = self.last_seen[mask]
+        self.positions = self.positions[mask]
+        self.travel = self.travel[mask]
+
+    def _select_active(self, frame):
+        previous = self.active_id
+        if previous is not None:
+            index = np.flatnonzero(self.ids == previous)
+            if not len(index):
+                self.active_id = None
+            else:
+                speed = np.linalg.norm(self.states[index[0], 2:])
+                self.still_frames = self.still_frames + 1 if speed < MIN_SPEED else 0
+                if self.still_frames < MAX_STILL_FRAMES:
+                    return
+                # Came to rest, e.g. on the floor after the rally
+                self.active_id = None
+
+        # The fastest confirmed, moving track seen in this frame takes over
+        speed = np.linalg.norm(self.states[:, 2:], axis=1)
+        candidates = ((self.last_seen == frame) & (self.hits >= self.min_hits) & (self.travel >= self.min_travel)
+                      & (speed >= MIN_SPEED) & (self.ids != (previous or 0)))
+        if candidates.any():
+            self.active_id = int(self.ids[candidates][np.argmax(speed[candidates])])
+            self.still_frames = 0
+        if previous is not None and self.active_id != previous:
+            self.switches += 1
+
+    def stats(self):
+        return {
+            "tracks": int(len(self.ids)),
+            "tracks_created": self.tracks_created,
+            "active_id": self.active_id,
+            "switches": self.switches,
+        }
@@ -0,0 +1,125 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# A bounce must be this many pixels lower than both ends of the window
+MIN_DROP_PX = 2
+
+
+class TrajectoryBuffer:
+    """
+    Fixed-capacity ring buffer of (frame, x, y) rows backed by one
+    preallocated NumPy array. Every row is written twice, at i and
+    i + capacity, so the chronological window is always a contiguous slice
+    and reading it never copies.
+
+    Indexing returns (frame, (x, y)) tuples, like the deque it replaces.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._data = np.zeros((2 * capacity, 3), dtype=np.float64)
+        self._next = 0
+        self._len = 0
+
+    def append(self, item):
+        """Appends a (frame, (x, y)) tuple, dropping the oldest row when full."""
+        frame, point = item
+        row = (frame, point[0], point[1])
+        self._data[self._next] = row
+        self._data[self._next + self.capacity] = row
+        self._next = (self._next + 1) % self.capacity
+        self._len = min(self._len + 1, self.capacity)
+
+    def clear(self):
+        self._next = 0
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    @property
+    def window(self):
+        """(len, 3) view of [frame, x, y] rows, oldest first."""
+        start = (self._next - self._len) % self.capacity
+        return self._data[start:start + self._len]
+
+    @property
+    def frames(self):
+        return self.window[:, 0]
+
+    @property
+    def points(self):
+        return self.window[:, 1:]
+
+    @property
+    def ys(self):
+        return self.window[:, 2]
+
+    def __getitem__(self, index):
+        frame, x, y = self.window[index]
+        return int(frame), (x, y)
+
+    def __iter__(self):
+        for frame, x, y in self.window:
+            yield int(frame), (x, y)
+
+
+def is_bounce(ys):
+    """
+    True if the middle sample of a window is its lowest point on screen
+    (largest y) and sits MIN_DROP_PX below both ends.
+    """
+    mid_y = ys[len(ys) // 2]
+    return bool(mid_y >= ys.max() and mid_y > ys[0] + MIN_DROP_PX and mid_y > ys[-1] + MIN_DROP_PX)
+
+
+def detect_bounces(track, history_size=7, min_history=5, cooldown=30):
+    """
+    Finds every bounce in a whole shuttle track in one vectorized pass.
+
+    track: (n, 3) array of [frame, x, y] rows, one per frame with a
+    detection, in frame order. Applies the same rules as
+    DecisionEngine.evaluate called once per frame: after each detection the
+    last `history_size` positions (at least `min_history`) are checked for a
+    local maximum in y at the middle sample, and after a bounce no new one is
+    reported for `cooldown` frames.
+
+    Returns an (m, 4) array of [bounce_frame, x, y, evaluated_frame] rows.
+    """
+    track = np.asarray(track, dtype=np.float64).reshape(-1, 3)
+    n = len(track)
+    if n < min_history:
+        return np.empty((0, 4))
+
+    ys = track[:, 2]
+    candidates = []   # (detection index that triggers the check, index of the bounce)
+
+    # While the history is still filling up, the window starts at the first detection
+    for length in range(min_history, min(history_size, n + 1)):
+        if is_bounce(ys[:length]):
+            candidates.append((length - 1, length // 2))
+
+    # Full windows: one row per detection index k >= history_size - 1
+    if n >= history_size:
+        windows = sliding_window_view(ys, history_size)
+        mid = history_size // 2
+        mid_y = windows[:, mid]
+        hits = ((mid_y >= windows.max(axis=1))
+                & (mid_y > windows[:, 0] + MIN_DROP_PX)
+                & (mid_y > windows[:, -1] + MIN_DROP_PX))
+        starts = np.flatnonzero(hits)
+        candidates.extend(zip((starts + history_size - 1).tolist(), (starts + mid).tolist()))
+
+    if not candidates:
+        return np.empty((0, 4))
+
+    # Cooldown: a bounce evaluated at frame F blocks evaluations before F + cooldown
+    bounces = []
+    next_allowed = -np.inf
+    for eval_idx, bounce_idx in sorted(candidates):
+        eval_frame = track[eval_idx, 0]
+        if eval_frame < next_allowed:
+            continue
+        next_allowed = eval_frame + cooldown
+        bounces.append((track[bounce_idx, 0], track[bounce_idx, 1], track[bounce_idx, 2], eval_frame))
+    return np.array(bounces, dtype=np.float64)
@@ -0,0 +1,366 @@
+import importlib.util
+import shutil
+import subprocess
+import tempfile
+import threading
+
+import cv2
+import numpy as np
+
+from .config import DECODERS, FFMPEG_BINARY
+
+
+def scaled_size(size, decode_width=0):
+    """(width, height) of frames decoded at decode_width, keeping the aspect ratio; never upscales."""
+    width, height = size
+    if not decode_width or decode_width >= width or width <= 0:
+        return width, height
+    return decode_width, max(2, int(round(height * decode_width / width / 2)) * 2)
+
+
+class FramePool:
+    """
+    Recycled frame buffers of one shape. Frames handed back with release()
+    are reused by the next acquire(); a new buffer is only allocated while
+    more frames are in flight than ever before, so a pipeline with bounded
+    queues settles on a fixed number of buffers.
+    """
+
+    def __init__(self, shape, dtype=np.uint8):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self._lock = threading.Lock()
+        self._buffers = {}   # id -> every buffer this pool handed out
+        self._free = []
+
+    @property
+    def allocated(self):
+        return len(self._buffers)
+
+    def acquire(self):
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+            buffer = np.empty(self.shape, dtype=self.dtype)
+            self._buffers[id(buffer)] = buffer
+            return buffer
+
+    def release(self, frame):
+        """Returns a frame from acquire() to the pool; other arrays and repeated releases are ignored."""
+        with self._lock:
+            if self._buffers.get(id(frame)) is frame and not any(f is frame for f in self._free):
+                self._free.append(frame)
+
+
+class FrameSource:
+    """
+    Reads the frames of a video into pooled BGR buffers.
+
+    Frames from read() belong to the source's pool: hand each one back with
+    release() once nothing refers to it any more, and it is reused for a
+    later frame. seek() is frame-accurate: the next read() returns exactly
+    that 0-based frame.
+
+    width / height are the decoded frame size (scaled to decode_width),
+    source_size the video's own; fps and frame_count come from the container.
+    """
+    name = None
+
+    def __init__(self, video_path, threads=0, decode_width=0):
+        self.video_path = str(video_path)
+        self.threads = max(0, threads or 0)
+        self.source_size, self.fps, self.frame_count = self._open()
+        self.width, self.height = scaled_size(self.source_size, decode_width)
+        self.pool = FramePool((self.height, self.width, 3))
+        self.position = 0
+        self.frames_read = 0
+
+    def _open(self):
+        """Opens the video; returns ((width, height), fps, frame_count)."""
+        raise NotImplementedError
+
+    def _read_into(self, buffer):
+        """Decodes the next frame into buffer; False at the end of the video."""
+        raise NotImplementedError
+
+    def _seek(self, frame_index):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    @property
+    def scaled(self):
+        return (self.width, self.height) != tuple(self.source_size)
+
+    def seek(self, frame_index):
+        frame_index = max(0, int(frame_index))
+        if frame_index != self.position:
+            self._seek(frame_index)
+            self.position = frame_index
+
+    def read(self):
+        """The next frame, or None at the end of the video."""
+        buffer = self.pool.acquire()
+        if not self._read_into(buffer):
+            self.pool.release(buffer)
+            return None
+        self.position += 1
+        self.frames_read += 1
+        return buffer
+
+    def release(self, frame):
+        self.pool.release(frame)
+
+    def read_batches(self, batch_size, limit=None):
+        """Yields lists of up to batch_size frames until the video ends or limit frames were read."""
+        remaining = limit if limit is not None else float("inf")
+        while remaining > 0:
+            frames = []
+            while len(frames) < min(batch_size, remaining):
+                frame = self.read()
+                if frame is None:
+                    break
+                frames.append(frame)
+            if not frames:
+                return
+            remaining -= len(frames)
+            yield frames
+
+    def stats(self):
+        return {
+            "decoder": self.name,
+            "threads": self.threads,
+            "size": [self.width, self.height],
+            "source_size": list(self.source_size),
+            "frames": self.frames_read,
+            "buffers": self.pool.allocated,
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _probe(video_path):
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video: {video_path}")
+    try:
+        size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        return size, cap.get(cv2.CAP_PROP_FPS), int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        cap.release()
+
+
+class OpenCVSource(FrameSource):
+    """cv2.VideoCapture, decoding into the pooled buffers (resized with cv2.resize when scaled)."""
+    name = "opencv"
+
+    def _open(self):
+        self._cap = cv2.VideoCapture(self.video_path)
+        if not self._cap.isOpened():
+            raise ValueError(f"Could not open video: {self.video_path}")
+        self._native = None
+        # A frame grabbed by _seek that the next read still has to return
+        self._grabbed = False
+        size = (int(self._cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        return size, self._cap.get(cv2.CAP_PROP_FPS), int(self._cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    def _next(self, image):
+        if self._grabbed:
+            self._grabbed = False
+            return self._cap.retrieve(image)
+        return self._cap.read(image)
+
+    def _read_into(self, buffer):
+        if not self.scaled:
+            ret, frame = self._next(buffer)
+            if ret and frame is not buffer:
+                # The capture allocated its own array, e.g. for a frame of unexpected size
+                cv2.resize(frame, (self.width, self.height), dst=buffer, interpolation=cv2.INTER_AREA)
+            return ret
+        ret, self._native = self._next(self._native)
+        if ret:
+            cv2.resize(self._native, (self.width, self.height), dst=buffer, interpolation=cv2.INTER_AREA)
+        return ret
+
+    def _seek(self, frame_index):
+        self._grabbed = False
+        self._cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+        # POS_FRAMES echoes the requested frame even when decoding resumed at an earlier keyframe, so
+        # check the timestamp of the frame actually decoded next (kept for the next read)
+        if self.fps and self._cap.grab():
+            expected_ms = frame_index * 1000.0 / self.fps
+            if abs(self._cap.get(cv2.CAP_PROP_POS_MSEC) - expected_ms) < 500.0 / self.fps:
+                self._grabbed = True
+                return
+        # The container could not seek exactly: reopen and skip frames without converting them
+        self._cap.release()
+        self._cap = cv2.VideoCapture(self.video_path)
+        for _ in range(frame_index):
+            if not self._cap.grab():
+                break
+
+    def close(self):
+        self._cap.release()
+
+
+class PyAVSource(FrameSource):
+    """
+    PyAV (libavcodec) with frame and slice threading. Scaling and the
+    conversion to BGR happen in libswscale, and the result is copied
+    straight into the pooled buffer.
+    """
+    name = "pyav"
+
+    def _open(self):
+        import av
+
+        try:
+            self._container = av.open(self.video_path)
+        except av.FFmpegError as exc:
+            raise ValueError(f"Could not open video: {self.video_path}") from exc
+        if not self._container.streams.video:
+            self._container.close()
+            raise ValueError(f"No video stream in {self.video_path}")
+        self._stream = stream = self._container.streams.video[0]
+        stream.codec_context.thread_type = "AUTO"
+        stream.codec_context.thread_count = self.threads
+        self._time_base = float(stream.time_base)
+        self._start = float(stream.start_time * stream.time_base) if stream.start_time is not None else 0.0
+        fps = float(stream.average_rate or stream.guessed_rate or 0)
+        frame_count = stream.frames
+        if not frame_count and fps:
+            duration = (stream.duration * stream.time_base if stream.duration
+                        else (self._container.duration or 0) / av.time_base)
+            frame_count = int(round(float(duration) * fps))
+        self._frames = self._container.decode(stream)
+        self._skip_before = None
+        return (stream.codec_context.width, stream.codec_context.height), fps, frame_count
+
+    def _next_frame(self):
+        for frame in self._frames:
+            if self._skip_before is not None:
+                if frame.pts is not None and frame.pts * self._time_base < self._skip_before:
+                    continue
+                self._skip_before = None
+            return frame
+        return None
+
+    def _read_into(self, buffer):
+        frame = self._next_frame()
+        if frame is None:
+            return False
+        frame = frame.reformat(width=self.width, height=self.height, format="bgr24", interpolation="AREA")
+        plane = frame.planes[0]
+        rows = np.frombuffer(plane, dtype=np.uint8).reshape(self.height, plane.line_size)
+        np.copyto(buffer.reshape(self.height, self.width * 3), rows[:, :self.width * 3])
+        return True
+
+    def _seek(self, frame_index):
+        fps = self.fps or 30.0
+        # Land on the keyframe before the target and drop the frames up to it;
+        # half a frame of slack absorbs rounding in the timestamps
+        target = self._start + frame_index / fps
+        self._container.seek(int(target / self._time_base), stream=self._stream, backward=True, any_frame=False)
+        self._frames = self._container.decode(self._stream)
+        self._skip_before = target - 0.5 / fps
+
+    def close(self):
+        self._container.close()
+
+
+class FFmpegSource(FrameSource):
+    """
+    An ffmpeg subprocess decoding with its own threads and writing raw BGR
+    frames to a pipe, which are read straight into the pooled buffers.
+    Seeking restarts ffmpeg with an input -ss, which decodes from the
+    previous keyframe and drops the frames before the target.
+    """
+    name = "ffmpeg"
+
+    def _open(self):
+        self._proc = None
+        self._errors = None
+        self._start_index = 0
+        return _probe(self.video_path)
+
+    def _start_process(self):
+        fps = self.fps or 30.0
+        command = [FFMPEG_BINARY, "-nostdin", "-hide_banner", "-loglevel", "error", "-threads", str(self.threads)]
+        if self._start_index:
+            # A quarter frame early, so rounding to the stream's time base still lands on the target
+            command += ["-ss", f"{(self._start_index - 0.25) / fps:.6f}"]
+        command += ["-i", self.video_path, "-map", "0:v:0", "-an", "-sn", "-vsync", "passthrough"]
+        if self.scaled:
+            command += ["-vf", f"scale={self.width}:{self.height}:flags=area"]
+        command += ["-pix_fmt", "bgr24", "-f", "rawvideo", "pipe:1"]
+        self._errors = tempfile.TemporaryFile()
+        try:
+            self._proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=self._errors,
+                                          bufsize=self.width * self.height * 3)
+        except OSError as exc:
+            self._errors.close()
+            self._errors = None
+            raise ValueError(f"Could not start {FFMPEG_BINARY}: {exc}") from exc
+
+    def _read_into(self, buffer):
+        if self._proc is None:
+            self._start_process()
+        view = memoryview(buffer).cast("B")
+        read = 0
+        while read < len(view):
+            n = self._proc.stdout.readinto(view[read:])
+            if not n:
+                break
+            read += n
+        if read == len(view):
+            return True
+        if self._proc.wait() != 0:
+            self._errors.seek(0)
+            message = self._errors.read().decode(errors="replace").strip()
+            raise ValueError(f"ffmpeg could not decode {self.video_path}: {message}")
+        return False
+
+    def _seek(self, frame_index):
+        # ffmpeg is (re)started at the new position by the next read
+        self._stop_process()
+        self._start_index = frame_index
+
+    def _stop_process(self):
+        if self._proc is not None:
+            self._proc.stdout.close()
+            if self._proc.poll() is None:
+                self._proc.kill()
+            self._proc.wait()
+            self._proc = None
+        if self._errors is not None:
+            self._errors.close()
+            self._errors = None
+
+    def close(self):
+        self._stop_process()
+
+
+SOURCES = {"opencv": OpenCVSource, "pyav": PyAVSource, "ffmpeg": FFmpegSource}
+
+
+def resolve_decoder(decoder="auto"):
+    """The decoder "auto" stands for: pyav if installed, else ffmpeg if on the PATH, else opencv."""
+    if decoder not in DECODERS:
+        raise ValueError(f"Unknown decoder {decoder!r}, expected one of {DECODERS}")
+    if decoder != "auto":
+        return decoder
+    if importlib.util.find_spec("av") is not None:
+        return "pyav"
+    if shutil.which(FFMPEG_BINARY):
+        return "ffmpeg"
+    return "opencv"
+
+
+def open_source(video_path, decoder="auto", threads=0, decode_width=0):
+    """Opens video_path with the given decoder (see config.DECODERS)."""
+    return SOURCES[resolve_decoder(decoder)](video_path, threads=threads, decode_width=decode_width)
@@ -0,0 +1,169 @@
+import logging
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from .config import DEFAULT_ENCODE_OPTIONS, ENCODERS, FFMPEG_BINARY
+
+logger = logging.getLogger(__name__)
+
+# Containers that get the index moved to the front (-movflags +faststart) for progressive playback
+FASTSTART_SUFFIXES = (".mp4", ".mov", ".m4v")
+# cv2.VideoWriter codecs, tried in order
+OPENCV_FOURCCS = ("vp09", "mp4v")
+
+
+class FFmpegWriter:
+    """
+    Pipes raw BGR frames to an ffmpeg subprocess, which encodes them on its
+    own threads while the pipeline keeps going; write() only copies the
+    frame into the pipe.
+
+    options: codec, preset, crf, threads and audio (see config.DEFAULT_ENCODE_OPTIONS).
+    With audio, the first audio track of audio_from, from audio_start for
+    audio_duration seconds (to its end if None), is copied into the output
+    without re-encoding.
+    """
+    name = "ffmpeg"
+
+    def __init__(self, output_path, fps, size, options=None, audio_from=None, audio_start=0.0,
+                 audio_duration=None):
+        self.output_path = str(output_path)
+        self.options = {**DEFAULT_ENCODE_OPTIONS, **(options or {})}
+        self.size = tuple(size)
+        self.frames = 0
+        width, height = self.size
+
+        command = [FFMPEG_BINARY, "-y", "-nostdin", "-hide_banner", "-loglevel", "error",
+                   "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", f"{fps or 30:.6f}",
+                   "-i", "pipe:0"]
+        if self.options["audio"] and audio_from:
+            if audio_start > 0:
+                command += ["-ss", f"{audio_start:.6f}"]
+            if audio_duration:
+                command += ["-t", f"{audio_duration:.6f}"]
+            # "?": no error for a source without audio
+            command += ["-i", str(audio_from), "-map", "0:v:0", "-map", "1:a:0?", "-c:a", "copy"]
+        if width % 2 or height % 2:
+            # yuv420p needs even dimensions
+            command += ["-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2"]
+        command += ["-c:v", self.options["codec"], "-pix_fmt", "yuv420p"]
+        if self.options["preset"]:
+            command += ["-preset", self.options["preset"]]
+        if self.options["crf"] is not None:
+            command += ["-crf", str(self.options["crf"])]
+        if self.options["threads"]:
+            command += ["-threads", str(self.options["threads"])]
+        if Path(self.output_path).suffix.lower() in FASTSTART_SUFFIXES:
+            command += ["-movflags", "+faststart"]
+        command.append(self.output_path)
+
+        self._errors = tempfile.TemporaryFile()
+        try:
+            self._proc = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=self._errors,
+                                          bufsize=width * height * 3)
+        except OSError as exc:
+            self._errors.close()
+            raise RuntimeError(f"Could not start {FFMPEG_BINARY}: {exc}") from exc
+
+    def _error(self):
+        self._errors.seek(0)
+        message = self._errors.read().decode(errors="replace").strip() or f"exit code {self._proc.returncode}"
+        return RuntimeError(f"ffmpeg could not encode {self.output_path}: {message}")
+
+    def write(self, frame):
+        try:
+            self._proc.stdin.write(np.ascontiguousarray(frame).data)
+        except (BrokenPipeError, ValueError):
+            self._proc.wait()
+            raise self._error() from None
+        self.frames += 1
+
+    def release(self):
+        """Flushes the remaining frames and waits for ffmpeg to finish the file."""
+        if self._proc.stdin.closed:
+            return
+        try:
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = self._proc.wait()
+        try:
+            if returncode != 0:
+                raise self._error()
+        finally:
+            self._errors.close()
+
+    def abort(self):
+        """Stops ffmpeg without finishing the file, e.g. after a failed or cancelled run."""
+        if self._proc.poll() is None:
+            self._proc.kill()
+        try:
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        self._proc.wait()
+        self._errors.close()
+
+    def stats(self):
+        return {"encoder": self.name, "codec": self.options["codec"], "preset": self.options["preset"],
+                "crf": self.options["crf"], "frames": self.frames}
+
+
+class OpenCVWriter:
+    """cv2.VideoWriter with the first of OPENCV_FOURCCS that opens; raises when none does."""
+    name = "opencv"
+
+    def __init__(self, output_path, fps, size, options=None, audio_from=None, audio_start=0.0,
+                 audio_duration=None):
+        self.output_path = str(output_path)
+        self.frames = 0
+        for fourcc in OPENCV_FOURCCS:
+            self._out = cv2.VideoWriter(self.output_path, cv2.VideoWriter_fourcc(*fourcc), fps, tuple(size))
+            if self._out.isOpened():
+                if fourcc != OPENCV_FOURCCS[0]:
+                    logger.warning("OpenCV cannot encode %s, writing %s with %s", OPENCV_FOURCCS[0],
+                                   self.output_path, fourcc)
+                break
+        else:
+            raise RuntimeError(f"OpenCV has no encoder for {self.output_path} (tried {', '.join(OPENCV_FOURCCS)})")
+        if options and options.get("audio") and audio_from:
+            logger.warning("The opencv encoder cannot copy audio; %s has no sound", self.output_path)
+
+    def write(self, frame):
+        self._out.write(frame)
+        self.frames += 1
+
+    def release(self):
+        self._out.release()
+
+    abort = release
+
+    def stats(self):
+        return {"encoder": self.name, "frames": self.frames}
+
+
+WRITERS = {"ffmpeg": FFmpegWriter, "opencv": OpenCVWriter}
+
+
+def resolve_encoder(encoder="auto"):
+    """The encoder "auto" stands for: ffmpeg if it is on the PATH, else opencv."""
+    if encoder not in ENCODERS:
+        raise ValueError(f"Unknown encoder {encoder!r}, expected one of {ENCODERS}")
+    if encoder != "auto":
+        return encoder
+    return "ffmpeg" if shutil.which(FFMPEG_BINARY) else "opencv"
+
+
+def open_writer(output_path, fps, size, encoder="auto", options=None, audio_from=None, audio_start=0.0,
+                audio_duration=None):
+    """
+    Opens a writer for the annotated output video (see config.ENCODERS).
+    Writers have write(frame), release() to finish the file, abort() and stats().
+    """
+    return WRITERS[resolve_encoder(encoder)](output_path, fps, size, options=options, audio_from=audio_from,
+                                            audio_start=audio_start, audio_duration=audio_duration)
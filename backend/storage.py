@@ -0,0 +1,197 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from starlette.concurrency import run_in_threadpool
+
+# Bytes read from the client and written to disk per step
+CHUNK_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    """Raised for invalid resumable upload requests (unknown id, wrong offset)."""
+
+
+class _Session:
+    def __init__(self, upload_id, path, original_filename, size):
+        self.upload_id = upload_id
+        self.path = path
+        self.original_filename = original_filename
+        self.size = size
+        self.offset = 0
+        self.hasher = hashlib.sha256()
+        self.lock = threading.Lock()
+        self.updated_at = time.time()
+
+    def as_dict(self):
+        return {
+            "upload_id": self.upload_id,
+            "original_filename": self.original_filename,
+            "offset": self.offset,
+            "size": self.size,
+        }
+
+
+class UploadStore:
+    """
+    Stores uploaded videos under their SHA-256 digest, so uploading the same
+    file twice returns the existing copy. Data is hashed as it arrives and
+    written to disk off the event loop.
+
+    Large files can also be sent as a resumable upload: create a session,
+    append chunks at the offset the server reports, then complete it.
+    Sessions idle for longer than session_ttl seconds are dropped with
+    their partial file, as are partial files no session owns (e.g. left
+    by a previous run, since sessions live in memory).
+    """
+
+    def __init__(self, upload_dir, session_ttl=86400):
+        self.upload_dir = Path(upload_dir)
+        self.partial_dir = self.upload_dir / ".partial"
+        self.partial_dir.mkdir(parents=True, exist_ok=True)
+        self.session_ttl = session_ttl
+        self.sessions = {}
+
+    def find(self, digest):
+        """Returns the stored file for a digest, or None."""
+        for path in self.upload_dir.glob(f"{digest}.*"):
+            if path.is_file():
+                return path
+        path = self.upload_dir / digest
+        return path if path.is_file() else None
+
+    def _finalize(self, partial_path, digest, original_filename):
+        """Moves a fully received file to its content address."""
+        existing = self.find(digest)
+        if existing is not None:
+            partial_path.unlink(missing_ok=True)
+            return existing, True
+        suffix = Path(original_filename or "").suffix.lower()
+        target = self.upload_dir / f"{digest}{suffix}"
+        os.replace(partial_path, target)
+        return target, False
+
+    @staticmethod
+    def _write(handle, hasher, chunk):
+        hasher.update(chunk)
+        handle.write(chunk)
+
+    async def save(self, upload):
+        """
+        Streams a FastAPI UploadFile to disk.
+        Returns (path, sha256 hex digest, duplicate).
+        """
+        partial_path = self.partial_dir / uuid.uuid4().hex
+        hasher = hashlib.sha256()
+        try:
+            handle = await run_in_threadpool(open, partial_path, "wb")
+            try:
+                while True:
+                    chunk = await upload.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    await run_in_threadpool(self._write, handle, hasher, chunk)
+            finally:
+                await run_in_threadpool(handle.close)
+            digest = hasher.hexdigest()
+            path, duplicate = await run_in_threadpool(self._finalize, partial_path, digest, upload.filename)
+            return path, digest, duplicate
+        except BaseException:
+            partial_path.unlink(missing_ok=True)
+            raise
+
+    # Resumable uploads
+
+    def expire_sessions(self):
+        """Drops idle sessions and orphaned partial files. Returns the number of files removed."""
+        cutoff = time.time() - self.session_ttl
+        for upload_id, session in list(self.sessions.items()):
+            # A session with a chunk being written is not idle, however long the chunk takes
+            if session.updated_at < cutoff and session.lock.acquire(blocking=False):
+                try:
+                    self.sessions.pop(upload_id, None)
+                finally:
+                    session.lock.release()
+        owned = {session.path.name for session in self.sessions.values()}
+        removed = 0
+        for path in self.partial_dir.iterdir():
+            try:
+                # save() writes its partial files here too; an active one is never that old
+                if path.name not in owned and path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def create_session(self, original_filename, size=None):
+        self.expire_sessions()
+        upload_id = uuid.uuid4().hex
+        session = _Session(upload_id, self.partial_dir / upload_id, original_filename, size)
+        session.path.touch()
+        self.sessions[upload_id] = session
+        return session
+
+    def get_session(self, upload_id):
+        session = self.sessions.get(upload_id)
+        if session is None:
+            raise UploadError("Upload not found")
+        return session
+
+    async def append(self, upload_id, offset, stream):
+        """
+        Appends the bytes of an async stream at `offset`, which must equal the
+        number of bytes already received. On a dropped connection the session
+        keeps everything written so far, and the client resumes from
+        session.offset. Bytes past the declared size are rejected before
+        they are written, so the session stays usable.
+        """
+        session = self.get_session(upload_id)
+        if not session.lock.acquire(blocking=False):
+            raise UploadError("Another chunk is being written to this upload")
+        try:
+            if offset != session.offset:
+                raise UploadError(f"Expected offset {session.offset}, got {offset}")
+            handle = await run_in_threadpool(open, session.path, "ab")
+            try:
+                buffer = bytearray()
+                async for piece in stream:
+                    buffer.extend(piece)
+                    if session.size is not None and session.offset + len(buffer) > session.size:
+                        raise UploadError(f"Chunk goes past the declared size of {session.size} bytes; "
+                                          f"{session.offset} bytes are stored")
+                    if len(buffer) >= CHUNK_SIZE:
+                        await run_in_threadpool(self._write, handle, session.hasher, bytes(buffer))
+                        session.offset += len(buffer)
+                        buffer.clear()
+                if buffer:
+                    await run_in_threadpool(self._write, handle, session.hasher, bytes(buffer))
+                    session.offset += len(buffer)
+            finally:
+                await run_in_threadpool(handle.close)
+                session.updated_at = time.time()
+            return session
+        finally:
+            session.lock.release()
+
+    async def complete(self, upload_id):
+        """Finishes a resumable upload. Returns (path, sha256 hex digest, duplicate)."""
+        session = self.get_session(upload_id)
+        if not session.lock.acquire(blocking=False):
+            raise UploadError("A chunk is still being written to this upload")
+        try:
+            # Completed (or expired) while this request was waiting for the session
+            if self.sessions.get(upload_id) is not session:
+                raise UploadError("Upload not found")
+            if session.size is not None and session.offset != session.size:
+                raise UploadError(f"Upload incomplete: {session.offset} of {session.size} bytes received")
+            digest = session.hasher.hexdigest()
+            path, duplicate = await run_in_threadpool(self._finalize, session.path, digest,
+                                                      session.original_filename)
+            del self.sessions[upload_id]
+            return path, digest, duplicate
+        finally:
+            session.lock.release()
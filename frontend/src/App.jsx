@@ -47,14 +47,35 @@ function App() {
 
       // 2. Process
       const processResponse = await axios.post(`http://localhost:8000/process/${filename}?mode=${mode}&shot_type=${shotType}`);
+      const jobId = processResponse.data.job_id;
+
+      // 3. Poll the job until it finishes
+      let job;
+      while (true) {
+        const jobResponse = await axios.get(`http://localhost:8000/jobs/${jobId}`);
+        job = jobResponse.data;
+        if (['completed', 'failed', 'cancelled'].includes(job.status)) break;
+        const { frames_done, total_frames, fps } = job.progress;
+        if (total_frames) {
+          setStatus(`Processing video... ${frames_done}/${total_frames} frames (${fps} fps)`);
+        }
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+      }
+      if (job.status !== 'completed') {
+        throw new Error(job.error || `Job ${job.status}`);
+      }
 
       // Assuming the backend returns the full path, we need to convert it to a URL
       // Since we mounted /outputs, we can construct the URL
-      // The backend returns "output_video": "outputs\\processed_filename.mp4"
-      const outputFilename = processResponse.data.output_video.split(/[\\/]/).pop();
-      setProcessedVideoUrl(`http://localhost:8000/outputs/${outputFilename}`);
-      setResults(processResponse.data.results_summary);
-      setStatus('Processing complete!');
+      // The backend returns "output_video": "outputs\\processed_filename.mp4", or null for a
+      // decision-only job (ALICAS_RENDER=0), in which case the original video stays on screen
+      const outputVideo = job.result.output_video;
+      if (outputVideo) {
+        const outputFilename = outputVideo.split(/[\\/]/).pop();
+        setProcessedVideoUrl(`http://localhost:8000/outputs/${outputFilename}`);
+      }
+      setResults(job.result.results_summary || []);
+      setStatus(outputVideo ? 'Processing complete!' : 'Processing complete (decisions only, no annotated video)');
 
     } catch (err) {
       console.error(err);
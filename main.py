@@ -1,9 +1,17 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from ultralytics import YOLO
-from PIL import Image
-import io
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+import asyncio
+import cv2
+import json
 import logging
+import numpy as np
+import os
+import tarfile
+import zipfile
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -28,6 +36,16 @@ app.add_middleware(
 # Global variable to hold the model
 model = None
 
+# All inference runs on this single thread, off the event loop; the model is not safe to call from several threads
+inference_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+
+# Images per forward pass on /predict/batch
+PREDICT_BATCH_SIZE = int(os.environ.get("ALICAS_PREDICT_BATCH_SIZE", "16"))
+# Most files accepted in one /predict/batch form; larger sets can be sent as a zip or tar archive
+PREDICT_MAX_FILES = int(os.environ.get("ALICAS_PREDICT_MAX_FILES", "10000"))
+IMAGE_TYPES = ["image/jpeg", "image/png", "image/jpg"]
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
 @app.on_event("startup")
 async def load_model():
     global model
@@ -43,7 +61,74 @@ async def load_model():
 
 @app.get("/")
 async def root():
-    return {"message": "Welcome to ALiCaS-B API. Use /predict to get inference."}
+    return {"message": "Welcome to ALiCaS-B API. Use /predict to get inference, /predict/batch for many images."}
+
+def decode_image(data):
+    """Decodes encoded image bytes to a BGR array without an intermediate copy of the bytes. None if invalid."""
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def to_detections(result):
+    """The boxes of one ultralytics result as JSON-ready dictionaries."""
+    boxes = result.boxes
+    classes = boxes.cls.cpu().numpy().astype(int).tolist()
+    return [
+        {
+            "class": cls,
+            "class_name": model.names[cls],
+            "confidence": conf,
+            "bbox": bbox  # [x1, y1, x2, y2]
+        }
+        for cls, conf, bbox in zip(classes, boxes.conf.cpu().numpy().tolist(), boxes.xyxy.cpu().numpy().tolist())
+    ]
+
+
+def run_model(images):
+    """One forward pass over a list of BGR images. Returns one list of detections per image."""
+    return [to_detections(result) for result in model(images, verbose=False)]
+
+
+def iter_images(uploads):
+    """
+    Yields (name, encoded bytes) for every image in the uploads, expanding
+    zip and tar archives member by member.
+    """
+    for upload in uploads:
+        handle = upload.file
+        if zipfile.is_zipfile(handle):
+            handle.seek(0)
+            with zipfile.ZipFile(handle) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir() and Path(info.filename).suffix.lower() in IMAGE_SUFFIXES:
+                        yield info.filename, archive.read(info)
+            continue
+        handle.seek(0)
+        if upload.content_type not in IMAGE_TYPES:
+            try:
+                archive = tarfile.open(fileobj=handle, mode="r:*")
+            except tarfile.TarError:
+                archive = None
+            if archive is not None:
+                with archive:
+                    for member in archive:
+                        if member.isfile() and Path(member.name).suffix.lower() in IMAGE_SUFFIXES:
+                            yield member.name, archive.extractfile(member).read()
+                continue
+            handle.seek(0)
+        yield upload.filename, handle.read()
+
+
+def read_batch(images, batch_size):
+    """Reads and decodes the next batch_size images. Returns [(name, image or None)]."""
+    return [(name, decode_image(data)) for name, data in islice(images, batch_size)]
+
+
+def predict_batch(batch):
+    """Runs the model on the decodable images of a batch. Returns [(name, detections or None)]."""
+    valid = [image for _, image in batch if image is not None]
+    detections = iter(run_model(valid) if valid else [])
+    return [(name, next(detections) if image is not None else None) for name, image in batch]
+
 
 @app.post("/predict")
 async def predict(file: UploadFile = File(...)):
@@ -53,36 +138,84 @@ async def predict(file: UploadFile = File(...)):
     if not model:
         raise HTTPException(status_code=500, detail="Model not loaded")
 
-    if file.content_type not in ["image/jpeg", "image/png", "image/jpg"]:
+    if file.content_type not in IMAGE_TYPES:
         raise HTTPException(status_code=400, detail="Invalid file type. Please upload an image.")
 
-    try:
-        # Read image file
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
-
-        # Run inference
-        results = model(image)
-
-        # Process results
-        detections = []
-        for result in results:
-            # Iterate through boxes for more control
-            for box in result.boxes:
-                detection = {
-                    "class": int(box.cls[0]),
-                    "class_name": model.names[int(box.cls[0])],
-                    "confidence": float(box.conf[0]),
-                    "bbox": box.xyxy[0].tolist() # [x1, y1, x2, y2]
-                }
-                detections.append(detection)
+    # Read image file
+    contents = await file.read()
+    image = decode_image(contents)
+    if image is None:
+        raise HTTPException(status_code=400, detail="Could not decode the image.")
 
+    try:
+        # Run inference off the event loop
+        loop = asyncio.get_running_loop()
+        detections = (await loop.run_in_executor(inference_executor, run_model, [image]))[0]
         return JSONResponse(content={"detections": detections})
 
     except Exception as e:
         logger.error(f"Error during prediction: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@app.post("/predict/batch")
+async def predict_many(request: Request):
+    """
+    Object detection for many images in one request. Send a multipart form
+    whose "files" are images and/or zip or tar archives of images.
+
+    Results stream back as NDJSON, one line per image in upload (and
+    archive) order: {"index", "name", "detections"}, or {"index", "name",
+    "error"} for an image that could not be decoded. A last line
+    {"done": true, "images", "batches"} ends a complete response; if
+    processing fails part-way the last line is {"error": ...} instead.
+    Images go through the model PREDICT_BATCH_SIZE at a time, and the next
+    batch is read and decoded while the current one is in the model.
+    """
+    if not model:
+        raise HTTPException(status_code=500, detail="Model not loaded")
+
+    form = await request.form(max_files=PREDICT_MAX_FILES)
+    uploads = [item for item in form.getlist("files") if hasattr(item, "file")]
+    if not uploads:
+        await form.close()
+        raise HTTPException(status_code=400, detail="No files uploaded. Send them as multipart field 'files'.")
+
+    async def stream():
+        loop = asyncio.get_running_loop()
+        images = iter_images(uploads)
+        index = batches = 0
+        pending = None
+        try:
+            pending = loop.run_in_executor(None, read_batch, images, PREDICT_BATCH_SIZE)
+            while True:
+                batch = await pending
+                if not batch:
+                    break
+                inference = loop.run_in_executor(inference_executor, predict_batch, batch)
+                # Decode the next batch while this one is in the model
+                pending = loop.run_in_executor(None, read_batch, images, PREDICT_BATCH_SIZE)
+                lines = []
+                for name, detections in await inference:
+                    if detections is None:
+                        lines.append({"index": index, "name": name, "error": "Could not decode image"})
+                    else:
+                        lines.append({"index": index, "name": name, "detections": detections})
+                    index += 1
+                batches += 1
+                yield "".join(json.dumps(line) + "\n" for line in lines)
+            yield json.dumps({"done": True, "images": index, "batches": batches}) + "\n"
+        except Exception as e:
+            logger.error(f"Error during batch prediction: {e}")
+            yield json.dumps({"error": str(e), "images": index}) + "\n"
+        finally:
+            # The client may have gone away while the next batch was being read
+            if pending is not None and not pending.done():
+                await asyncio.wait([pending])
+            await form.close()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)